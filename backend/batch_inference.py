@@ -0,0 +1,309 @@
+"""Offline batch detection over recorded video files and image folders.
+
+Re-scans footage or incident archives (e.g. after retraining the weights)
+throughput-first: sources are decoded by a background prefetch pool, frames
+are sampled every `--stride` frames and run through the model in batches, and
+detections are written in bulk to CSV, Parquet or an SQLite database.
+
+Progress is checkpointed to `<output>.progress.json` after every flush, so an
+interrupted job picks up where it stopped when run again with the same output.
+
+Usage:
+    python batch_inference.py recordings/ cam1.mp4 --output detections.csv --stride 5
+    python batch_inference.py incidents/ --output rescan.db --weights bestyolov11.pt
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import cv2
+from sqlalchemy import create_engine, Column, Float, Integer, MetaData, String, Table
+
+from detector import BACKENDS, PRECISIONS, load_detector
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger("batch_inference")
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+FIELDS = ["source", "frame", "time_s", "file", "label", "confidence", "x1", "y1", "x2", "y2"]
+
+_SOURCE_DONE = object()
+
+
+def expand_sources(inputs: List[str]) -> List[str]:
+    """Video files stay as they are; directories become one source of their images
+    plus one source per video inside them."""
+    sources = []
+    for path in inputs:
+        if os.path.isdir(path):
+            entries = sorted(os.listdir(path))
+            if any(os.path.splitext(e)[1].lower() in IMAGE_EXTENSIONS for e in entries):
+                sources.append(path)
+            sources.extend(
+                os.path.join(path, e) for e in entries
+                if os.path.splitext(e)[1].lower() in VIDEO_EXTENSIONS
+            )
+        elif os.path.isfile(path):
+            sources.append(path)
+        else:
+            logger.warning(f"Skipping missing input {path}")
+    return sources
+
+
+# --- DECODING ---
+def decode_video(path: str, start: int, stride: int, out: queue.Queue):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    while True:
+        if index % stride:
+            # grab() skips the frame without paying for a full decode
+            if not cap.grab():
+                break
+        else:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.put((path, index, index / fps if fps else None, None, frame))
+        index += 1
+    cap.release()
+
+
+def decode_images(path: str, start: int, stride: int, out: queue.Queue):
+    files = [path] if os.path.isfile(path) else [
+        os.path.join(path, e) for e in sorted(os.listdir(path))
+        if os.path.splitext(e)[1].lower() in IMAGE_EXTENSIONS
+    ]
+    for index in range(start, len(files), stride):
+        frame = cv2.imread(files[index])
+        if frame is None:
+            logger.warning(f"Could not read {files[index]}")
+            continue
+        out.put((path, index, None, files[index], frame))
+
+
+def decode_source(path: str, start: int, stride: int, out: queue.Queue):
+    """Push sampled frames of one source onto `out`, then a done marker."""
+    try:
+        if os.path.isdir(path) or os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            decode_images(path, start, stride, out)
+        else:
+            decode_video(path, start, stride, out)
+    except Exception as e:
+        logger.error(f"Failed to decode {path}: {e}")
+    out.put((path, _SOURCE_DONE))
+
+
+# --- OUTPUT ---
+class CsvOutput:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, rows: List[dict]):
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class ParquetOutput:
+    """Writes one part file per flush into a directory, so resumed jobs just add parts."""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.part = len([e for e in os.listdir(path) if e.endswith(".parquet")])
+
+    def write(self, rows: List[dict]):
+        table = self.pa.Table.from_pylist(rows)
+        self.pq.write_table(table, os.path.join(self.path, f"part-{self.part:05d}.parquet"))
+        self.part += 1
+
+    def close(self):
+        pass
+
+
+class SqliteOutput:
+    def __init__(self, path: str):
+        self.engine = create_engine(f"sqlite:///{path}")
+        metadata = MetaData()
+        self.table = Table(
+            "batch_detections", metadata,
+            Column("id", Integer, primary_key=True),
+            Column("source", String, index=True),
+            Column("frame", Integer),
+            Column("time_s", Float),
+            Column("file", String),
+            Column("label", String, index=True),
+            Column("confidence", Float),
+            Column("x1", Float), Column("y1", Float), Column("x2", Float), Column("y2", Float),
+        )
+        metadata.create_all(self.engine)
+
+    def write(self, rows: List[dict]):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), rows)
+
+    def close(self):
+        self.engine.dispose()
+
+
+def open_output(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return CsvOutput(path)
+    if ext == ".parquet":
+        return ParquetOutput(path)
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return SqliteOutput(path)
+    raise SystemExit(f"Unsupported output {path}: use .csv, .parquet or .db")
+
+
+# --- PROGRESS ---
+def load_progress(path: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("sources", {})
+
+
+def save_progress(path: str, progress: Dict[str, dict]):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"sources": progress}, f)
+    os.replace(tmp, path)
+
+
+# --- MAIN LOOP ---
+def run(args):
+    sources = expand_sources(args.inputs)
+    progress_path = args.output + ".progress.json"
+    progress = load_progress(progress_path)
+    pending = [s for s in sources if not progress.get(s, {}).get("done")]
+    if not pending:
+        logger.info("Nothing to do, all sources already processed")
+        return
+    logger.info(f"{len(pending)} of {len(sources)} sources to process")
+
+    model = load_detector(args.weights, args.backend, args.precision)
+    output = open_output(args.output)
+    frames_queue: queue.Queue = queue.Queue(maxsize=args.batch_size * args.prefetch)
+
+    def start_decoding():
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for source in pending:
+                last = progress.get(source, {}).get("frame", -1)
+                # Resume on the next sampled frame after the last one written
+                start = (last // args.stride + 1) * args.stride if last >= 0 else 0
+                pool.submit(decode_source, source, start, args.stride, frames_queue)
+
+    threading.Thread(target=start_decoding, daemon=True, name="batch-decode").start()
+
+    rows: List[dict] = []
+    batch: list = []
+    remaining = len(pending)
+    frames_done = 0
+    video_span: Dict[str, list] = {}  # source -> [first, last] video time seen this run
+    started = time.monotonic()
+    last_flush = started
+
+    def flush():
+        nonlocal rows, last_flush
+        if rows:
+            output.write(rows)
+        save_progress(progress_path, progress)
+        rows = []
+        last_flush = time.monotonic()
+
+    def run_batch():
+        nonlocal batch, frames_done
+        results = model([item[4] for item in batch], conf=args.conf, verbose=False)
+        for (source, index, time_s, file, _), r in zip(batch, results):
+            for box in r.boxes:
+                x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+                rows.append({
+                    "source": source, "frame": index, "time_s": time_s, "file": file,
+                    "label": model.names[int(box.cls[0])], "confidence": round(float(box.conf[0]), 4),
+                    "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                })
+            # Frames of one source are queued in order, so this is a processed prefix
+            progress.setdefault(source, {})["frame"] = index
+            if time_s is not None:
+                video_span.setdefault(source, [time_s, time_s])[1] = time_s
+        frames_done += len(batch)
+        batch = []
+
+    while remaining:
+        item = frames_queue.get()
+        if item[1] is _SOURCE_DONE:
+            if batch:
+                run_batch()
+            progress.setdefault(item[0], {})["done"] = True
+            remaining -= 1
+            flush()
+            logger.info(f"Finished {item[0]}")
+            continue
+        batch.append(item)
+        if len(batch) >= args.batch_size:
+            run_batch()
+        if len(rows) >= args.flush_rows or time.monotonic() - last_flush > args.flush_seconds:
+            flush()
+            elapsed = time.monotonic() - started
+            logger.info(f"{frames_done} frames, {frames_done / elapsed:.1f} frames/s")
+
+    flush()
+    output.close()
+    elapsed = max(time.monotonic() - started, 1e-6)
+    video_seconds = sum(last - first for first, last in video_span.values())
+    logger.info(f"Done: {frames_done} frames in {elapsed:.1f}s ({frames_done / elapsed:.1f} frames/s)")
+    if video_seconds:
+        logger.info(f"Covered {video_seconds:.0f}s of video ({video_seconds / elapsed:.1f}x real time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="video files, image files or directories")
+    parser.add_argument("--output", required=True, help="detections.csv, detections.parquet or detections.db")
+    parser.add_argument("--weights", default="bestyolov11.pt")
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--stride", type=int, default=1, help="run the model on every Nth frame")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--conf", type=float, default=0.25, help="minimum confidence to record")
+    parser.add_argument("--workers", type=int, default=4, help="sources decoded in parallel")
+    parser.add_argument("--prefetch", type=int, default=4, help="decoded batches buffered ahead of the model")
+    parser.add_argument("--flush-rows", type=int, default=5000, help="rows buffered before a bulk write")
+    parser.add_argument("--flush-seconds", type=float, default=30.0, help="max seconds between checkpoints")
+    args = parser.parse_args()
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark the detector on each inference backend over a fixed clip.
+
+For every backend spec (backend:precision) this reports per-frame latency
+percentiles, single-frame and batched throughput, and accuracy drift against
+the PyTorch fp32 reference: detections of the reference run on the same
+frames are used as ground truth and each backend's mAP@0.5 against them is
+reported (1.0 = identical output). Pass `--data` with a dataset yaml to also
+run the real validation mAP per backend.
+
+Usage:
+    python benchmark_backends.py --clip clip.mp4 --backends pytorch:fp32 onnx:fp32 openvino:fp16 openvino:int8 \
+        --calibration-data weapons.yaml
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from detector import load_detector
+
+
+def read_clip(path: str, count: int) -> List[np.ndarray]:
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read any frames from {path}")
+    return frames
+
+
+def detections(result) -> Dict[str, np.ndarray]:
+    """Boxes, confidences and classes of one ultralytics result as numpy arrays."""
+    boxes = result.boxes
+    return {
+        "xyxy": boxes.xyxy.cpu().numpy() if len(boxes) else np.zeros((0, 4)),
+        "conf": boxes.conf.cpu().numpy() if len(boxes) else np.zeros(0),
+        "cls": boxes.cls.cpu().numpy().astype(int) if len(boxes) else np.zeros(0, dtype=int),
+    }
+
+
+def iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def map50(reference: List[dict], predicted: List[dict]) -> float:
+    """mAP@0.5 of `predicted` using `reference` detections as ground truth."""
+    classes = set()
+    for det in reference:
+        classes.update(det["cls"].tolist())
+    if not classes:
+        return 1.0
+    aps = []
+    for c in classes:
+        gt = [det["xyxy"][det["cls"] == c] for det in reference]
+        n_gt = sum(len(g) for g in gt)
+        preds = []
+        for i, det in enumerate(predicted):
+            mask = det["cls"] == c
+            preds.extend((conf, i, box) for conf, box in zip(det["conf"][mask], det["xyxy"][mask]))
+        preds.sort(key=lambda p: -p[0])
+        matched = [np.zeros(len(g), dtype=bool) for g in gt]
+        tp = np.zeros(len(preds))
+        for k, (_, i, box) in enumerate(preds):
+            if len(gt[i]):
+                overlaps = iou(box, gt[i])
+                best = int(np.argmax(overlaps))
+                if overlaps[best] >= 0.5 and not matched[i][best]:
+                    matched[i][best] = True
+                    tp[k] = 1
+        if not preds:
+            aps.append(0.0)
+            continue
+        cum_tp = np.cumsum(tp)
+        recall = cum_tp / max(n_gt, 1)
+        precision = cum_tp / np.arange(1, len(preds) + 1)
+        # All-point interpolated area under the precision/recall curve
+        recall = np.concatenate([[0.0], recall, [1.0]])
+        precision = np.concatenate([[1.0], precision, [0.0]])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]
+        aps.append(float(np.sum((recall[1:] - recall[:-1]) * precision[1:])))
+    return float(np.mean(aps))
+
+
+def benchmark(model, frames: List[np.ndarray], batch_size: int, warmup: int) -> dict:
+    for frame in frames[:warmup]:
+        model(frame, verbose=False)
+
+    latencies = []
+    outputs = []
+    for frame in frames:
+        start = time.perf_counter()
+        result = model(frame, verbose=False)[0]
+        latencies.append(time.perf_counter() - start)
+        outputs.append(detections(result))
+
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        model(frames[i:i + batch_size], verbose=False)
+    batched = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    return {
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "fps": len(frames) / float(np.sum(latencies)),
+        "batched_fps": len(frames) / batched,
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", required=True, help="fixed video clip used for every backend")
+    parser.add_argument("--weights", default="bestyolov11.pt")
+    parser.add_argument("--arch", default="yolo", choices=["yolo", "rtdetr"])
+    parser.add_argument("--backends", nargs="+", default=["pytorch:fp32", "onnx:fp32", "openvino:fp32", "openvino:fp16"],
+                        help="backend:precision specs to compare")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--calibration-data", help="dataset yaml for int8 export calibration")
+    parser.add_argument("--data", help="dataset yaml to also report validation mAP50-95 per backend")
+    args = parser.parse_args()
+
+    frames = read_clip(args.clip, args.frames)
+    specs = args.backends if "pytorch:fp32" in args.backends else ["pytorch:fp32"] + args.backends
+    results = {}
+    for spec in specs:
+        backend, _, precision = spec.partition(":")
+        model = load_detector(args.weights, backend, precision or "fp32", args.arch, args.calibration_data)
+        results[spec] = benchmark(model, frames, args.batch_size, args.warmup)
+        if args.data:
+            results[spec]["val_map"] = float(model.val(data=args.data, verbose=False).box.map)
+        print(f"{spec}: done")
+
+    reference = results["pytorch:fp32"]["outputs"]
+    header = f"{'backend':<18}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'fps':>8}{'batch fps':>11}{'mAP50 vs ref':>14}"
+    if args.data:
+        header += f"{'val mAP':>9}"
+    print(f"\n{len(frames)} frames from {args.clip}\n{header}")
+    for spec, r in results.items():
+        line = (f"{spec:<18}{r['p50']:>9.1f}{r['p90']:>9.1f}{r['p99']:>9.1f}{r['fps']:>8.1f}"
+                f"{r['batched_fps']:>11.1f}{map50(reference, r['outputs']):>14.3f}")
+        if args.data:
+            line += f"{r['val_map']:>9.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare batched multi-camera inference against sequential per-camera loops.
+
+Replays frames from one source (video file or webcam index) as if they came
+from N cameras and times:
+  - sequential: one model(frame) call per camera, like the old camera_worker
+  - batched:    one model([frames...]) call per round, like inference_scheduler
+
+Usage:
+    python benchmark_cameras.py --source clip.mp4 --cameras 8 --rounds 50
+"""
+import argparse
+import time
+
+import cv2
+
+from detector import BACKENDS, PRECISIONS, load_detector
+
+
+def read_frames(source, count):
+    """Read up to `count` frames from a video source, looping if it ends early."""
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            if not frames:
+                raise RuntimeError(f"Could not read any frames from {source}")
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_sequential(model, frames, cameras, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        for c in range(cameras):
+            model(frames[(i + c) % len(frames)], verbose=False)
+    return time.perf_counter() - start
+
+
+def run_batched(model, frames, cameras, rounds, batch_size):
+    start = time.perf_counter()
+    for i in range(rounds):
+        batch = [frames[(i + c) % len(frames)] for c in range(cameras)]
+        for j in range(0, len(batch), batch_size):
+            model(batch[j:j + batch_size], verbose=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="bestyolov11.pt")
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--source", default="0", help="video file path or webcam index")
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    model = load_detector(args.weights, args.backend, args.precision)
+    frames = read_frames(args.source, max(args.cameras, 16))
+    # Warm up so the first-call overhead does not count against either mode
+    model(frames[0], verbose=False)
+
+    total = args.cameras * args.rounds
+    seq = run_sequential(model, frames, args.cameras, args.rounds)
+    bat = run_batched(model, frames, args.cameras, args.rounds, args.batch_size)
+
+    print(f"{args.cameras} cameras x {args.rounds} rounds ({total} frames)")
+    print(f"sequential: {seq:.2f}s  {total / seq:.1f} frames/s  {1000 * seq / args.rounds:.1f} ms/round")
+    print(f"batched:    {bat:.2f}s  {total / bat:.1f} frames/s  {1000 * bat / args.rounds:.1f} ms/round")
+    print(f"speedup:    {seq / bat:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
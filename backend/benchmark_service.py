@@ -0,0 +1,697 @@
+"""Replayable end-to-end load test of the backend with synthetic cameras, model and Telegram.
+
+The server runs in a child process (the hidden --serve mode of this script)
+in a scratch directory. Before main.py starts, it swaps in:
+  - FakeCapture for cv2.VideoCapture: frames from --clip (looped) or generated
+    from --seed (noise plus a moving block, so the motion gate sees motion),
+    paced at --fps like a live camera
+  - StubDetector for the model: fixed --model-latency-ms per call plus
+    --image-latency-ms per image. Every frame gets a "neutral" box, and each
+    camera gets a "pistol" box for --weapon-frames of every --weapon-period
+    frames, so tracks confirm and incidents fire on a schedule
+  - FakeApplication/FakeBot for Telegram: no network, --telegram-latency-ms per send
+and a database seeded with --seed-incidents rows over --seed-days days.
+
+The driver then waits for /readyz and warms up for --warmup seconds. For
+--duration seconds it runs:
+  - --viewers /video clients spread over the cameras (frames/s and inter-frame gap)
+  - --ws-clients /ws/incidents clients (fan-out spread: last minus first
+    receipt of each event across clients)
+  - --query-clients loops over paged /incidents, filtered /incidents and the
+    analytics endpoints, plus an NDJSON export every --export-every requests
+While it runs, it samples the server's CPU and RSS. At the end it reads
+/stats/cameras, and reads /metrics to get per-stage p50/p99 for the measured
+window only.
+
+The report is printed, optionally written as JSON (--output). With
+--baseline old.json it is compared against an earlier report, and the script
+exits 1 if anything regressed by more than --tolerance.
+
+Usage:
+    python benchmark_service.py --cameras 8 --viewers 16 --ws-clients 50 --query-clients 4 \
+        --seed-incidents 200000 --duration 60 --output run.json
+    python benchmark_service.py --cameras 8 --viewers 16 --baseline run.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"  # same as main.TIMESTAMP_FORMAT
+NAMES = {0: "pistol", 1: "knife", 2: "neutral"}
+
+
+# --- SYNTHETIC SERVER (child process) ---
+def synthetic_frames(width: int, height: int, count: int, seed: int) -> List[np.ndarray]:
+    """Seeded noise background with a block moving across it."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    frames = []
+    size = max(8, height // 6)
+    for i in range(count):
+        frame = background.copy()
+        x = int((width - size) * i / max(1, count - 1))
+        cv2.rectangle(frame, (x, height // 3), (x + size, height // 3 + size), (40, 40, 200), -1)
+        frames.append(frame)
+    return frames
+
+
+def clip_frames(path: str, count: int) -> List[np.ndarray]:
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read any frames from {path}")
+    return frames
+
+
+class FakeCapture:
+    """cv2.VideoCapture replacement for "fake://<n>" sources: shared frames, paced like a live camera."""
+
+    frames: List[np.ndarray] = []
+    fps = 15.0
+
+    def __init__(self, source, *args):
+        self.index = int(str(source).rsplit("/", 1)[-1])
+        self.position = self.index * 7  # cameras do not show the same frame at the same time
+        self.next_at = time.monotonic()
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0.0  # like a stream: main.py only paces files itself
+
+    def read(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        # A reader that fell behind skips ahead instead of bursting
+        self.next_at = max(self.next_at, time.monotonic()) + 1.0 / self.fps
+        frame = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        return True, frame.copy()  # a decoder hands out a new buffer per frame
+
+    def release(self):
+        pass
+
+
+class _Array:
+    """Stands in for a torch tensor: .cpu().numpy()."""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Boxes:
+    def __init__(self, boxes: list):
+        self.xyxy = _Array(np.array([b[0] for b in boxes], dtype=np.float32).reshape(-1, 4))
+        self.conf = _Array(np.array([b[1] for b in boxes], dtype=np.float32))
+        self.cls = _Array(np.array([b[2] for b in boxes], dtype=np.float32))
+
+    def __len__(self):
+        return len(self.conf.array)
+
+
+class _Result:
+    def __init__(self, boxes: list):
+        self.boxes = _Boxes(boxes)
+
+
+class StubDetector:
+    """Deterministic stand-in for the ultralytics model with configurable latency."""
+
+    names = NAMES
+
+    def __init__(self, latency: float, image_latency: float, cameras: int, weapon_period: int, weapon_frames: int):
+        self.latency = latency
+        self.image_latency = image_latency
+        self.cameras = max(1, cameras)
+        self.weapon_period = weapon_period
+        self.weapon_frames = weapon_frames
+        self.images = 0
+
+    def __call__(self, images, verbose=False, **kwargs):
+        if not isinstance(images, list):
+            images = [images]
+        time.sleep(self.latency + self.image_latency * len(images))
+        results = []
+        for image in images:
+            h, w = image.shape[:2]
+            boxes = [((w * 0.1, h * 0.1, w * 0.3, h * 0.6), 0.6, 2)]
+            # Scheduler rounds visit every camera once, so images // cameras counts frames per camera
+            if self.weapon_period and (self.images // self.cameras) % self.weapon_period < self.weapon_frames:
+                boxes.append(((w * 0.5, h * 0.4, w * 0.6, h * 0.5), 0.9, 0))
+            self.images += 1
+            results.append(_Result(boxes))
+        return results
+
+
+class FakeBot:
+    """Telegram Bot replacement: every send succeeds after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def _send(self):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        photo = type("PhotoSize", (), {"file_id": f"fake-{uuid.uuid4().hex}"})()
+        return type("Message", (), {"photo": [photo]})()
+
+    async def send_message(self, **kwargs):
+        return await self._send()
+
+    async def send_photo(self, **kwargs):
+        return await self._send()
+
+
+class FakeApplication:
+    """Enough of telegram.ext.Application for main.telegram_worker, without polling Telegram."""
+
+    latency = 0.05
+
+    class _Builder:
+        def token(self, token):
+            return self
+
+        def build(self):
+            return FakeApplication()
+
+    class _Updater:
+        async def start_polling(self):
+            pass
+
+    def __init__(self):
+        self.bot = FakeBot(self.latency)
+        self.updater = self._Updater()
+
+    @classmethod
+    def builder(cls):
+        return cls._Builder()
+
+    def add_handler(self, handler):
+        pass
+
+    async def initialize(self):
+        pass
+
+    async def start(self):
+        pass
+
+
+def seed_database(path: str, count: int, days: int, cameras: int, seed: int):
+    """Create incidents.db with `count` incidents spread over the last `days` days (rollups are built on startup)."""
+    from sqlalchemy import create_engine
+    sys.path.insert(0, HERE)
+    import main  # only for the schema; its own engine is never connected here
+    engine = create_engine(f"sqlite:///{path}")
+    main.Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(path)
+    batch = []
+    for _ in range(count):
+        incident_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        timestamp = (now - timedelta(seconds=rng.uniform(0, days * 86400))).strftime(TIMESTAMP_FORMAT)
+        camera = f"Camera {rng.randrange(cameras) + 1}"
+        batch.append((incident_id, timestamp, camera, camera, "Benchmark", rng.choice(["pistol", "knife"]),
+                      round(rng.uniform(0.78, 1.0), 2), f"/incidents/{incident_id}.jpg"))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO incidents (id, timestamp, camera, camera_name, location, label, confidence, image) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO incidents (id, timestamp, camera, camera_name, location, label, confidence, image) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def seed_subscribers(path: str, count: int):
+    """Subscribe `count` fake Telegram chats without filters, so every alert goes to all of them."""
+    from sqlalchemy import create_engine
+    sys.path.insert(0, HERE)
+    import main
+    engine = create_engine(f"sqlite:///{path}")
+    main.Base.metadata.create_all(bind=engine)  # seed files made before subscriptions moved to the database
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT OR IGNORE INTO telegram_subscriptions (chat_id, min_confidence, digest_seconds) "
+                     "VALUES (?, 0, 0)", [(str(1000 + i),) for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def serve(args):
+    """Child process: apply the swaps, then run main.app under uvicorn in the scratch directory."""
+    os.chdir(args.workdir)
+    FakeCapture.frames = (clip_frames(args.clip, 300) if args.clip
+                          else synthetic_frames(args.width, args.height, 60, args.seed))
+    FakeCapture.fps = args.fps
+    cv2.VideoCapture = FakeCapture
+    FakeApplication.latency = args.telegram_latency_ms / 1000
+
+    sys.path.insert(0, HERE)
+    import logging
+    import uvicorn
+    import main
+    logging.getLogger("main").setLevel(logging.WARNING)  # one INFO line per alert and chat drowns the report
+    main.load_detector = lambda *a, **k: StubDetector(
+        args.model_latency_ms / 1000, args.image_latency_ms / 1000, args.cameras, args.weapon_period, args.weapon_frames
+    )
+    main.Application = FakeApplication
+    main.RETENTION_ENABLED = False  # would archive seeded rows mid-run
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --- DRIVER ---
+def percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if values else None
+
+
+def summary(values: List[float], scale: float = 1000.0) -> dict:
+    """count, p50, p99 (and max) of a list of seconds, in milliseconds by default."""
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * scale, 2) if values else None,
+        "p99": round(percentile(values, 99) * scale, 2) if values else None,
+        "max": round(max(values) * scale, 2) if values else None,
+    }
+
+
+class ProcessSampler:
+    """CPU and RSS of one process from /proc (Linux)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.cpu: List[float] = []
+        self.rss: List[int] = []
+        self.last = None
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+        with open(f"/proc/{self.pid}/status") as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        return time.monotonic(), cpu_seconds, rss
+
+    async def run(self, interval: float = 0.5):
+        if not os.path.exists(f"/proc/{self.pid}"):
+            return
+        while True:
+            now, cpu_seconds, rss = self._read()
+            if self.last is not None:
+                self.cpu.append(100.0 * (cpu_seconds - self.last[1]) / (now - self.last[0]))
+            self.rss.append(rss)
+            self.last = (now, cpu_seconds)
+            await asyncio.sleep(interval)
+
+    def report(self) -> dict:
+        if not self.rss:
+            return {"cpu_percent_mean": None, "cpu_percent_max": None, "rss_mb_peak": None, "rss_mb_end": None}
+        return {
+            "cpu_percent_mean": round(float(np.mean(self.cpu)), 1) if self.cpu else None,
+            "cpu_percent_max": round(max(self.cpu), 1) if self.cpu else None,
+            "rss_mb_peak": round(max(self.rss) / 2 ** 20, 1),
+            "rss_mb_end": round(self.rss[-1] / 2 ** 20, 1),
+        }
+
+
+async def video_viewer(client, camera: str, stats: dict, stop: asyncio.Event):
+    """Read /video until stopped, recording the gap between frame boundaries."""
+    marker = b"--frame\r\n"
+    last = None
+    tail = b""
+    try:
+        async with client.stream("GET", "/video", params={"camera": camera}) as response:
+            async for chunk in response.aiter_bytes():
+                data = tail + chunk
+                now = time.monotonic()
+                for _ in range(data.count(marker)):
+                    stats["frames"] = stats.get("frames", 0) + 1
+                    if last is not None:
+                        stats.setdefault("gaps", []).append(now - last)
+                    last = now
+                tail = data[-(len(marker) - 1):]
+                if stop.is_set():
+                    break
+    except Exception as e:
+        stats["errors"] = stats.get("errors", 0) + 1
+        stats["last_error"] = repr(e)
+
+
+async def websocket_client(url: str, receipts: Dict[int, List[float]], stats: dict, stop: asyncio.Event):
+    import websockets
+    try:
+        async with websockets.connect(url) as ws:
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                event = json.loads(message)
+                receipts.setdefault(event.get("event_id"), []).append(time.monotonic())
+                stats["messages"] = stats.get("messages", 0) + 1
+    except Exception as e:
+        stats["errors"] = stats.get("errors", 0) + 1
+        stats["last_error"] = repr(e)
+
+
+def query_plan(cameras: int, page_size: int) -> list:
+    """(name, path, params) requests the query clients cycle through."""
+    return [
+        ("incidents_page", "/incidents", {"limit": page_size}),
+        ("incidents_next_page", "/incidents", {"limit": page_size, "cursor": None}),
+        ("incidents_filtered", "/incidents", {"limit": page_size, "camera": f"Camera {cameras}", "label": "pistol",
+                                              "min_confidence": 0.9}),
+        ("timeline_day", "/analytics/incidents/timeline", {"granularity": "day"}),
+        ("timeline_hour", "/analytics/incidents/timeline", {"granularity": "hour"}),
+        ("distribution", "/analytics/incidents/distribution", {"by": "camera"}),
+    ]
+
+
+async def query_client(client, plan: list, export_every: int, latencies: Dict[str, List[float]],
+                       errors: Dict[str, int], stop: asyncio.Event, offset: int):
+    cursor = None
+    i = offset
+    while not stop.is_set():
+        i += 1
+        if export_every and i % export_every == 0:
+            name, path, params = "export_ndjson", "/incidents", {"format": "ndjson"}
+        else:
+            name, path, params = plan[i % len(plan)]
+            if "cursor" in params:
+                if cursor is None:
+                    continue
+                params = {**params, "cursor": cursor}
+        started = time.monotonic()
+        try:
+            response = await client.get(path, params=params)
+            await response.aread()
+            response.raise_for_status()
+        except Exception:
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.setdefault(name, []).append(time.monotonic() - started)
+        if name == "incidents_page":
+            cursor = response.headers.get("x-next-cursor")
+
+
+def parse_histograms(text: str, name: str = "weapon_stage_seconds") -> Dict[str, Dict[float, float]]:
+    """Cumulative bucket counts per stage from the Prometheus text format."""
+    series: Dict[str, Dict[float, float]] = {}
+    prefix = f"{name}_bucket{{"
+    for line in text.splitlines():
+        if not line.startswith(prefix):
+            continue
+        labels, value = line[len(prefix):].rsplit("} ", 1)
+        parts = dict(item.split("=", 1) for item in labels.split(","))
+        stage = parts["stage"].strip('"')
+        bound = parts["le"].strip('"')
+        series.setdefault(stage, {})[float("inf") if bound == "+Inf" else float(bound)] = float(value)
+    return series
+
+
+def histogram_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Prometheus-style quantile from cumulative buckets (linear within a bucket)."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_report(before: str, after: str) -> dict:
+    """Per-stage count, p50 and p99 in ms over the window between two /metrics scrapes."""
+    start, end = parse_histograms(before), parse_histograms(after)
+    report = {}
+    for stage, buckets in end.items():
+        window = {b: c - start.get(stage, {}).get(b, 0.0) for b, c in buckets.items()}
+        count = window.get(float("inf"), 0)
+        if not count:
+            continue
+        report[stage] = {
+            "count": int(count),
+            "p50": round(histogram_quantile(window, 0.5) * 1000, 2),
+            "p99": round(histogram_quantile(window, 0.99) * 1000, 2),
+        }
+    return report
+
+
+async def drive(args, base_url: str, server: subprocess.Popen) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=args.viewers + args.query_clients + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=limits) as client:
+        deadline = time.monotonic() + args.startup_timeout
+        while True:
+            if server.poll() is not None:
+                raise SystemExit("Server exited during startup")
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit("Server did not become ready")
+            await asyncio.sleep(0.2)
+
+        stop = asyncio.Event()
+        viewer_stats = [{} for _ in range(args.viewers)]
+        ws_stats = [{} for _ in range(args.ws_clients)]
+        receipts: Dict[int, List[float]] = {}
+        latencies: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        plan = query_plan(args.cameras, args.page_size)
+        ws_url = base_url.replace("http://", "ws://") + "/ws/incidents"
+        sampler = ProcessSampler(server.pid)
+        tasks = [asyncio.create_task(sampler.run())]
+        tasks += [asyncio.create_task(video_viewer(client, f"Camera {i % args.cameras + 1}", viewer_stats[i], stop))
+                  for i in range(args.viewers)]
+        tasks += [asyncio.create_task(websocket_client(ws_url, receipts, ws_stats[i], stop))
+                  for i in range(args.ws_clients)]
+        tasks += [asyncio.create_task(query_client(client, plan, args.export_every, latencies, errors, stop, i))
+                  for i in range(args.query_clients)]
+
+        await asyncio.sleep(args.warmup)
+        # Measure only the window after warm-up
+        for stats in viewer_stats:
+            stats.clear()
+        receipts.clear()
+        latencies.clear()
+        errors.clear()
+        sampler.cpu.clear()
+        sampler.rss.clear()
+        metrics_before = (await client.get("/metrics")).text
+        started = time.monotonic()
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - started
+        metrics_after = (await client.get("/metrics")).text
+        cameras = (await client.get("/stats/cameras")).json()
+        persistence = (await client.get("/stats/persistence")).json()
+        clips = (await client.get("/stats/clips")).json()
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    gaps = [g for s in viewer_stats for g in s.get("gaps", [])]
+    spreads = [max(t) - min(t) for t in receipts.values() if len(t) > 1]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("serve", "workdir", "output", "baseline")},
+        "seconds": round(elapsed, 1),
+        "server": sampler.report(),
+        "cameras": {
+            "capture_fps": round(float(np.mean([c["capture_fps"] for c in cameras])), 2) if cameras else None,
+            "inference_fps": round(float(np.mean([c["inference_fps"] for c in cameras])), 2) if cameras else None,
+            "frame_age_ms": round(float(np.mean([c["frame_age_ms"] for c in cameras])), 1) if cameras else None,
+            "frames_dropped": sum(c["frames_dropped"] for c in cameras),
+        },
+        "video": {
+            "fps_per_viewer": round(sum(s.get("frames", 0) for s in viewer_stats) / elapsed / max(1, args.viewers), 2),
+            "frame_gap_ms": summary(gaps),
+            "errors": sum(s.get("errors", 0) for s in viewer_stats),
+        },
+        "websocket": {
+            "events": len(receipts),
+            "messages": sum(len(t) for t in receipts.values()),
+            "fanout_spread_ms": summary(spreads),
+            "errors": sum(s.get("errors", 0) for s in ws_stats),
+        },
+        "queries": {name: {**summary(values), "errors": errors.get(name, 0)} for name, values in sorted(latencies.items())},
+        "stages": stage_report(metrics_before, metrics_after),
+        "persistence": persistence,
+        "clips": clips,
+    }
+
+
+def print_report(report: dict):
+    server, cams, video, ws = report["server"], report["cameras"], report["video"], report["websocket"]
+    c = report["config"]
+    print(f"\n{c['cameras']} cameras @ {c['fps']} fps, {c['viewers']} viewers, {c['ws_clients']} WebSocket clients, "
+          f"{c['query_clients']} query clients, {c['seed_incidents']} seeded incidents, {report['seconds']}s")
+    print(f"server:     cpu {server['cpu_percent_mean']}% mean / {server['cpu_percent_max']}% max, "
+          f"rss {server['rss_mb_peak']} MB peak / {server['rss_mb_end']} MB end")
+    print(f"cameras:    capture {cams['capture_fps']} fps, inference {cams['inference_fps']} fps, "
+          f"frame age {cams['frame_age_ms']} ms, dropped {cams['frames_dropped']}")
+    print(f"video:      {video['fps_per_viewer']} fps/viewer, gap p50 {video['frame_gap_ms']['p50']} ms "
+          f"p99 {video['frame_gap_ms']['p99']} ms, errors {video['errors']}")
+    print(f"websocket:  {ws['events']} events, {ws['messages']} messages, fan-out spread p50 "
+          f"{ws['fanout_spread_ms']['p50']} ms p99 {ws['fanout_spread_ms']['p99']} ms, errors {ws['errors']}")
+    print(f"\n{'query':<22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, q in report["queries"].items():
+        print(f"{name:<22}{q['count']:>8}{q['p50']:>10}{q['p99']:>10}{q['errors']:>8}")
+    print(f"\n{'stage':<22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for stage, s in sorted(report["stages"].items()):
+        print(f"{stage:<22}{s['count']:>8}{s['p50']:>10}{s['p99']:>10}")
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Metrics worse than the baseline by more than `tolerance` (a fraction)."""
+    found = []
+
+    def check(name, current, previous, higher_is_better):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            found.append(f"{name}: {previous} -> {current} ({change:+.0%})")
+
+    check("cameras.inference_fps", report["cameras"]["inference_fps"], baseline["cameras"]["inference_fps"], True)
+    check("video.fps_per_viewer", report["video"]["fps_per_viewer"], baseline["video"]["fps_per_viewer"], True)
+    check("video.frame_gap_ms.p99", report["video"]["frame_gap_ms"]["p99"], baseline["video"]["frame_gap_ms"]["p99"], False)
+    check("server.cpu_percent_mean", report["server"]["cpu_percent_mean"], baseline["server"]["cpu_percent_mean"], False)
+    check("server.rss_mb_peak", report["server"]["rss_mb_peak"], baseline["server"]["rss_mb_peak"], False)
+    for name, q in report["queries"].items():
+        if name in baseline["queries"]:
+            check(f"queries.{name}.p99", q["p99"], baseline["queries"][name]["p99"], False)
+    for stage, s in report["stages"].items():
+        if stage in baseline["stages"]:
+            check(f"stages.{stage}.p99", s["p99"], baseline["stages"][stage]["p99"], False)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=15.0, help="frames per second of each fake camera")
+    parser.add_argument("--clip", help="video file to replay instead of synthetic frames")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--model-latency-ms", type=float, default=20.0, help="stub detector time per call")
+    parser.add_argument("--image-latency-ms", type=float, default=5.0, help="stub detector time per image")
+    parser.add_argument("--weapon-period", type=int, default=300, help="frames per camera between weapon episodes (0 = none)")
+    parser.add_argument("--weapon-frames", type=int, default=10, help="frames each weapon episode lasts")
+    parser.add_argument("--telegram-latency-ms", type=float, default=50.0)
+    parser.add_argument("--subscribers", type=int, default=10, help="fake Telegram chats to alert")
+    parser.add_argument("--viewers", type=int, default=4)
+    parser.add_argument("--ws-clients", type=int, default=10)
+    parser.add_argument("--query-clients", type=int, default=2)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--export-every", type=int, default=50, help="every Nth query is a full NDJSON export (0 = never)")
+    parser.add_argument("--seed-incidents", type=int, default=100000)
+    parser.add_argument("--seed-days", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds measured")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary directory)")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against --baseline")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="weapon-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    with open(os.path.join(workdir, "cameras.json"), "w") as f:
+        json.dump({f"Camera {i + 1}": {"source": f"fake://{i}", "name": f"Camera {i + 1}", "location": "Benchmark"}
+                   for i in range(args.cameras)}, f)
+    # The seeded database is kept in the workdir and copied for every run, so runs start from the same data
+    seeded = os.path.join(workdir, f"seed-{args.seed_incidents}-{args.seed_days}-{args.cameras}-{args.seed}.db")
+    if not os.path.exists(seeded):
+        print(f"Seeding {args.seed_incidents} incidents into {seeded}")
+        seed_database(seeded, args.seed_incidents, args.seed_days, args.cameras, args.seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(os.path.join(workdir, "incidents.db" + suffix)):
+            os.remove(os.path.join(workdir, "incidents.db" + suffix))
+    shutil.copyfile(seeded, os.path.join(workdir, "incidents.db"))
+    seed_subscribers(os.path.join(workdir, "incidents.db"), args.subscribers)
+    shutil.rmtree(os.path.join(workdir, "incidents"), ignore_errors=True)
+
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--serve", "--workdir", workdir]
+    server = subprocess.Popen(command, env={**os.environ, "APP_ROLE": "all", "CAMERAS_FILE": "cameras.json"})
+    try:
+        report = asyncio.run(drive(args, f"http://127.0.0.1:{args.port}", server))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        if found:
+            print(f"\nRegressions beyond {args.tolerance:.0%} against {args.baseline}:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Pre-event frame buffers and background MP4 clip encoding for incidents.
+
+Each camera keeps a `FrameBuffer` of its recent frames, downscaled and JPEG
+compressed, bounded both in seconds and in bytes. When an incident fires, the
+`ClipRecorder` waits until the post-event window has been captured, then
+decodes the buffered frames between start and end and writes them as an MP4
+on a small encoder pool. Neither the capture nor the inference thread ever
+waits on an encode.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBuffer:
+    def __init__(self, max_seconds: float, max_bytes: int, fps: float = 10.0, width: int = 960,
+                 jpeg_quality: int = 75):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.interval = 1.0 / fps if fps else 0.0
+        self.width = width
+        self.jpeg_quality = jpeg_quality
+        self.lock = threading.Lock()
+        self.frames: deque = deque()  # (monotonic time, jpeg bytes), oldest first
+        self.bytes = 0
+        self.last_added = float("-inf")
+
+    def add(self, frame, now: float):
+        """Buffer a frame if the buffer's frame interval has passed since the last one."""
+        if now - self.last_added < self.interval:
+            return
+        self.last_added = now
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, round(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        data = jpeg.tobytes()
+        with self.lock:
+            self.frames.append((now, data))
+            self.bytes += len(data)
+            while self.frames and (now - self.frames[0][0] > self.max_seconds or self.bytes > self.max_bytes):
+                _, old = self.frames.popleft()
+                self.bytes -= len(old)
+
+    def between(self, start: float, end: float) -> List[Tuple[float, bytes]]:
+        with self.lock:
+            return [(t, data) for t, data in self.frames if start <= t <= end]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"frames": len(self.frames), "bytes": self.bytes}
+
+
+class ClipRecorder:
+    def __init__(self, fps: float = 10.0, max_concurrency: int = 2, max_pending: int = 32,
+                 fourcc: str = "avc1", fallback_fourcc: str = "mp4v"):
+        self.fps = fps
+        self.max_pending = max_pending  # clips waiting for their window or being encoded
+        self.fourccs = [fourcc] + ([fallback_fourcc] if fallback_fourcc != fourcc else [])
+        self.codec_lock = threading.Lock()  # encoder threads share the codec choice
+        self.cond = threading.Condition()
+        self.pending: list = []  # heap of (end, tiebreak, job), waiting for the post-event window
+        self.outstanding = 0  # pending + submitted to the encoder pool
+        self.counter = itertools.count()
+        self.encoded = self.failed = self.skipped = 0
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="clip-encoder")
+        self.thread = threading.Thread(target=self._schedule_loop, daemon=True, name="clip-scheduler")
+        self.thread.start()
+
+    def record(self, buffer: FrameBuffer, start: float, end: float, path: str,
+               on_done: Callable[[Optional[str]], None]) -> bool:
+        """Queue a clip of `buffer` from `start` to `end` (monotonic times), encoded once `end` has passed.
+
+        `on_done` is called from an encoder thread with the path, or None if
+        the clip could not be written. Returns False (and records nothing) if
+        `max_pending` clips are already outstanding.
+        """
+        with self.cond:
+            if not self.running or self.outstanding >= self.max_pending:
+                self.skipped += 1
+                logger.warning(f"Too many clips outstanding, skipping {os.path.basename(path)}")
+                return False
+            self.outstanding += 1
+            heapq.heappush(self.pending, (end, next(self.counter), (buffer, start, end, path, on_done)))
+            self.cond.notify()
+        return True
+
+    def _schedule_loop(self):
+        while True:
+            with self.cond:
+                while self.running and (not self.pending or self.pending[0][0] > time.monotonic()):
+                    timeout = self.pending[0][0] - time.monotonic() if self.pending else None
+                    self.cond.wait(timeout)
+                if not self.running:
+                    return
+                _, _, job = heapq.heappop(self.pending)
+            self._submit(*job)
+
+    def _submit(self, buffer: FrameBuffer, start: float, end: float, path: str, on_done):
+        # Take the frames now: a busy encoder pool must not let the buffer evict the clip's start
+        self.executor.submit(self._encode, buffer.between(start, end), path, on_done)
+
+    def _open_writer(self, path: str, size: Tuple[int, int], fps: float):
+        with self.codec_lock:
+            fourccs = list(self.fourccs)
+        for i, fourcc in enumerate(fourccs):
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+            if writer.isOpened():
+                if i:
+                    with self.codec_lock:
+                        # Not available in this OpenCV build; do not retry it for every clip
+                        if self.fourccs != [fourcc]:
+                            logger.warning(f"Clip codec {fourccs[0]} unavailable, using {fourcc}")
+                            self.fourccs = [fourcc]
+                return writer
+            writer.release()
+        return None
+
+    def _encode(self, frames: List[Tuple[float, bytes]], path: str, on_done):
+        result = None
+        try:
+            if not frames:
+                raise ValueError("no buffered frames in the clip window")
+            first = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+            size = (first.shape[1], first.shape[0])
+            # Cameras slower than the buffer rate yield fewer frames; keep the clip real time
+            span = frames[-1][0] - frames[0][0]
+            fps = min(self.fps, (len(frames) - 1) / span) if span > 0 else self.fps
+            writer = self._open_writer(path, size, fps)
+            if writer is None:
+                raise IOError(f"no usable video codec among {self.fourccs}")
+            try:
+                for _, data in frames:
+                    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        frame = cv2.resize(frame, size)  # camera resolution changed mid-clip
+                    writer.write(frame)
+            finally:
+                writer.release()
+            result = path
+        except Exception as e:
+            logger.error(f"Failed to record clip {os.path.basename(path)}: {e}")
+        with self.cond:
+            self.outstanding -= 1
+            if result:
+                self.encoded += 1
+            else:
+                self.failed += 1
+        try:
+            on_done(result)
+        except Exception as e:
+            logger.error(f"Clip callback failed for {os.path.basename(path)}: {e}")
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "encoding": self.outstanding - len(self.pending),
+                "encoded": self.encoded,
+                "failed": self.failed,
+                "skipped": self.skipped,
+            }
+
+    def shutdown(self):
+        """Encode clips still waiting for their window with the frames captured so far, then wait for the pool."""
+        with self.cond:
+            self.running = False
+            jobs = [job for _, _, job in sorted(self.pending)]
+            self.pending.clear()
+            self.cond.notify()
+        self.thread.join()
+        for job in jobs:
+            self._submit(*job)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,98 @@
+"""Detector loading for the live server and the offline tools.
+
+The same trained weights can run on different inference backends:
+  - "pytorch":  the .pt weights directly (default)
+  - "onnx":     exported ONNX model run by ONNX Runtime
+  - "openvino": exported OpenVINO IR, usually the fastest on Intel CPUs
+
+Exports are done once through ultralytics and cached next to the weights
+(e.g. bestyolov11_fp16_dynamic_openvino_model/), so later starts load them directly.
+Every backend returns an ultralytics model object, so callers keep using
+`model(frames)` and `model.names` whatever the backend.
+
+ultralytics (and torch behind it) is only imported when a model is actually
+loaded, so importing this module is cheap.
+"""
+import logging
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ["pytorch", "onnx", "openvino"]
+PRECISIONS = ["fp32", "fp16", "int8"]
+ARCHITECTURES = {"yolo": "YOLO", "rtdetr": "RTDETR"}  # ultralytics class per architecture
+
+# Precisions each export format supports on CPU (ultralytics ignores half=True for CPU ONNX exports)
+SUPPORTED_PRECISIONS = {
+    "pytorch": ["fp32"],
+    "onnx": ["fp32"],
+    "openvino": ["fp32", "fp16", "int8"],
+}
+
+
+def model_class(arch: str):
+    """ultralytics model class for an architecture, imported on first use."""
+    import ultralytics
+    return getattr(ultralytics, ARCHITECTURES[arch])
+
+
+def exported_path(weights: str, backend: str, precision: str) -> str:
+    """Where the cached export for a backend/precision lives."""
+    stem, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return f"{stem}_{precision}.onnx"
+    # "dynamic": exports from before dynamic batch shapes had a fixed batch of 1 and must not be reused
+    return f"{stem}_{precision}_dynamic_openvino_model"
+
+
+def export_weights(weights: str, backend: str, precision: str, arch: str = "yolo",
+                   calibration_data: Optional[str] = None, imgsz: int = 640) -> str:
+    """Export .pt weights to ONNX or OpenVINO and cache the result."""
+    target = exported_path(weights, backend, precision)
+    if os.path.exists(target):
+        return target
+    if precision == "int8" and not calibration_data:
+        raise ValueError("INT8 export needs a dataset yaml for calibration (calibration_data)")
+
+    logger.info(f"Exporting {weights} to {backend} ({precision}), this only happens once")
+    model = model_class(arch)(weights)
+    # Dynamic batch: the live server runs batches of up to INFERENCE_BATCH_SIZE frames
+    kwargs = {"format": backend, "imgsz": imgsz, "dynamic": True}
+    if precision == "fp16":
+        kwargs["half"] = True
+    elif precision == "int8":
+        kwargs["int8"] = True
+        kwargs["data"] = calibration_data
+    exported = model.export(**kwargs)
+    # ultralytics names exports after the weights only; rename so precisions don't collide
+    shutil.move(str(exported), target)
+    return target
+
+
+def load_detector(weights: str, backend: str = "pytorch", precision: str = "fp32", arch: str = "yolo",
+                  calibration_data: Optional[str] = None, imgsz: int = 640):
+    """Load `weights` on the requested backend, exporting them first if needed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    if precision not in SUPPORTED_PRECISIONS[backend]:
+        raise ValueError(f"{backend} does not support {precision}, use one of {SUPPORTED_PRECISIONS[backend]}")
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {arch}, expected one of {list(ARCHITECTURES)}")
+
+    if backend == "pytorch":
+        path = weights
+    else:
+        path = export_weights(weights, backend, precision, arch, calibration_data, imgsz)
+    logger.info(f"Loading {arch} detector from {path} ({backend}, {precision})")
+    # Exported models lose the architecture class, but ultralytics infers it from the file
+    return model_class(arch)(path) if backend == "pytorch" else model_class("yolo")(path, task="detect")
+
+
+def warmup(model, imgsz: int = 640, batch_size: int = 1):
+    """Run dummy inference so lazy initialisation (kernels, graph compile) happens before real frames."""
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    model([frame] * batch_size, verbose=False)
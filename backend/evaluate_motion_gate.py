@@ -0,0 +1,86 @@
+"""Replay a recorded clip through the motion gate to weigh CPU saved against missed detections.
+
+The detector runs on every frame to get the reference, while a MotionGate
+driven by video time decides which frames the live pipeline would have run.
+Reported: fraction of model calls skipped, weapon frames seen, weapon
+episodes (bursts of weapon frames) missed entirely and the extra delay before
+the gated pipeline first sees each episode.
+
+Usage:
+    python evaluate_motion_gate.py night_entrance.mp4 --idle-interval 1.0 --area-threshold 0.005
+"""
+import argparse
+
+import cv2
+
+from detector import BACKENDS, PRECISIONS, load_detector
+from motion_gate import MotionGate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip")
+    parser.add_argument("--weights", default="bestyolov11.pt")
+    parser.add_argument("--backend", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--labels", nargs="+", default=["pistol", "knife"], help="weapon labels")
+    parser.add_argument("--conf", type=float, default=0.78, help="confidence that raises an incident")
+    parser.add_argument("--episode-gap", type=float, default=3.0, help="seconds without a weapon that end an episode")
+    parser.add_argument("--width", type=int, default=160)
+    parser.add_argument("--pixel-threshold", type=int, default=25)
+    parser.add_argument("--area-threshold", type=float, default=0.005)
+    parser.add_argument("--motion-hold", type=float, default=2.0)
+    parser.add_argument("--weapon-hold", type=float, default=10.0)
+    parser.add_argument("--idle-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    model = load_detector(args.weights, args.backend, args.precision)
+    gate = MotionGate(args.width, args.pixel_threshold, args.area_threshold,
+                      args.motion_hold, args.weapon_hold, args.idle_interval)
+    cap = cv2.VideoCapture(args.clip)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    index = 0
+    weapon_frames = gated_weapon_frames = 0
+    episodes = []  # [start, end, first time seen by the gated run or None]
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        now = index / fps
+        index += 1
+        gate.update(frame, now)
+        run_gated = gate.should_infer(now)
+
+        r = model(frame, verbose=False)[0]
+        labels = [(model.names[int(b.cls[0])], float(b.conf[0])) for b in r.boxes]
+        if run_gated and any(label in args.labels for label, _ in labels):
+            gate.note_weapon(now)
+        if not any(label in args.labels and conf >= args.conf for label, conf in labels):
+            continue
+
+        weapon_frames += 1
+        if episodes and now - episodes[-1][1] <= args.episode_gap:
+            episodes[-1][1] = now
+        else:
+            episodes.append([now, now, None])
+        if run_gated:
+            gated_weapon_frames += 1
+            if episodes[-1][2] is None:
+                episodes[-1][2] = now
+    cap.release()
+
+    missed = [e for e in episodes if e[2] is None]
+    delays = [e[2] - e[0] for e in episodes if e[2] is not None]
+    print(f"{index} frames ({index / fps:.0f}s of video)")
+    print(f"model calls skipped: {gate.skipped} ({100 * gate.skip_ratio():.1f}%)")
+    print(f"weapon frames: {weapon_frames}, seen by gated run: {gated_weapon_frames}")
+    print(f"weapon episodes: {len(episodes)}, missed entirely: {len(missed)}")
+    for start, end, _ in missed:
+        print(f"  missed {start:.1f}s - {end:.1f}s")
+    if delays:
+        print(f"extra delay to first detection: mean {sum(delays) / len(delays):.2f}s, max {max(delays):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Transport between the detector process and API worker processes (see serve.py).
+
+Frames: the detector writes every annotated frame of a camera into a
+`multiprocessing.shared_memory` ring of fixed-size slots. Each slot carries the
+sequence number of the frame in it, and the header carries the newest one. A
+reader takes a numpy view straight onto the slot (no copy), encodes it and then
+checks that the slot still holds the same sequence number (a seqlock). A frame
+the writer lapped mid-encode is discarded instead of being sent torn.
+
+Incidents: the detector runs an `IncidentPublisher` (a multiprocessing
+connection listener); each API worker keeps an `IncidentSubscriber` connected
+to it and gets every incident as soon as it is committed. Slow or dead
+subscribers are dropped, never waited for.
+"""
+import hashlib
+import logging
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = 3  # write_seq, slots, slot_bytes
+SLOT_FIELDS = 5  # seq, height, width, channels, captured_at (float64 bits)
+HEADER_BYTES = 64
+SLOT_HEADER_BYTES = 64
+
+
+def ring_name(prefix: str, camera: str) -> str:
+    """Shared memory name for a camera; labels may contain characters names cannot."""
+    return f"{prefix}_{hashlib.sha1(camera.encode()).hexdigest()[:12]}"
+
+
+def _attach(name: str) -> SharedMemory:
+    """Attach to an existing segment without letting this process's resource tracker unlink it on exit."""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _Ring:
+    def __init__(self, shm: SharedMemory):
+        self.shm = shm
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)
+        self.slots = int(self.header[1])
+        self.slot_bytes = int(self.header[2])
+        self.slot_headers = np.ndarray((self.slots, SLOT_FIELDS), dtype=np.uint64, buffer=shm.buf,
+                                       offset=HEADER_BYTES, strides=(SLOT_HEADER_BYTES, 8))
+        self.data_offset = HEADER_BYTES + self.slots * SLOT_HEADER_BYTES
+
+    def close(self):
+        # numpy views must go before the mapping can be closed
+        self.header = self.slot_headers = None
+        self.shm.close()
+
+
+class FrameRingWriter(_Ring):
+    """Detector side of one camera's frame ring."""
+
+    def __init__(self, name: str, slots: int = 4, slot_bytes: int = 3840 * 2160 * 3):
+        size = HEADER_BYTES + slots * (SLOT_HEADER_BYTES + slot_bytes)
+        try:
+            shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a detector that did not shut down cleanly
+            stale = SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = SharedMemory(name=name, create=True, size=size)
+        np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)[:] = (0, slots, slot_bytes)
+        super().__init__(shm)
+        self.oversize_warned = False
+
+    def write(self, frame: np.ndarray, captured_at: float = 0.0) -> bool:
+        """Copy a uint8 frame into the next slot; False if it does not fit or the ring is closed."""
+        if self.header is None:
+            return False
+        if frame.nbytes > self.slot_bytes:
+            if not self.oversize_warned:
+                logger.warning(f"Frame of {frame.nbytes} bytes does not fit ring {self.shm.name}, not shared")
+                self.oversize_warned = True
+            return False
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        h, w = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        self.slot_headers[slot, 0] = 0  # readers treat the slot as invalid while it is written
+        offset = self.data_offset + slot * self.slot_bytes
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[...] = frame
+        self.slot_headers[slot, 1:4] = (h, w, channels)
+        self.slot_headers[slot, 4] = np.float64(captured_at).view(np.uint64)
+        self.slot_headers[slot, 0] = seq
+        self.header[0] = seq
+        return True
+
+    def unlink(self):
+        shm = self.shm
+        self.close()
+        shm.unlink()
+
+
+class FrameRingReader:
+    """API worker side of one camera's frame ring; attaches lazily and survives detector restarts."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ring: Optional[_Ring] = None
+
+    def attach(self) -> bool:
+        if self.ring is None:
+            try:
+                ring = _Ring(_attach(self.name))
+            except FileNotFoundError:
+                return False
+            if not ring.slots or not ring.slot_bytes:
+                # The writer created the segment but has not written the header yet
+                ring.close()
+                return False
+            self.ring = ring
+        return True
+
+    def reattach(self):
+        """Drop the mapping so the next read picks up a segment recreated by a restarted detector."""
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def latest_seq(self) -> int:
+        return int(self.ring.header[0]) if self.attach() else 0
+
+    def read(self) -> Optional[Tuple[int, np.ndarray, float]]:
+        """(seq, zero-copy view, captured_at) of the newest frame, or None.
+
+        The view is only valid while `still_valid(seq)` holds; check it after
+        using the pixels and drop the view before calling `reattach()`.
+        """
+        if not self.attach():
+            return None
+        ring = self.ring
+        seq = int(ring.header[0])
+        if not seq:
+            return None
+        slot = seq % ring.slots
+        if int(ring.slot_headers[slot, 0]) != seq:
+            return None
+        h, w, channels = (int(v) for v in ring.slot_headers[slot, 1:4])
+        captured_at = float(ring.slot_headers[slot, 4:5].view(np.float64)[0])
+        shape = (h, w, channels) if channels > 1 else (h, w)
+        view = np.ndarray(shape, dtype=np.uint8, buffer=ring.shm.buf, offset=ring.data_offset + slot * ring.slot_bytes)
+        if int(ring.slot_headers[slot, 0]) != seq:
+            return None
+        return seq, view, captured_at
+
+    def still_valid(self, seq: int) -> bool:
+        """True if the slot of `seq` was not overwritten since it was read."""
+        ring = self.ring
+        return ring is not None and int(ring.slot_headers[seq % ring.slots, 0]) == seq
+
+    def close(self):
+        self.reattach()
+
+
+class IncidentPublisher:
+    """Detector side: fan incidents out to every connected API worker."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes, buffer: int = 100):
+        self.listener = Listener(address, authkey=authkey)
+        self.buffer = buffer
+        self.lock = threading.Lock()
+        self.queues = set()
+        self.dropped = 0
+        self.closed = False
+        threading.Thread(target=self._accept_loop, daemon=True, name="incident-publisher").start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.closed:
+                    return
+                # Failed handshake (wrong authkey, port scanner); keep listening
+                logger.warning(f"Rejected incident subscriber: {e}")
+                continue
+            q = queue.Queue(maxsize=self.buffer)
+            with self.lock:
+                self.queues.add(q)
+            threading.Thread(target=self._send_loop, args=(conn, q), daemon=True, name="incident-sender").start()
+            logger.info(f"Incident subscriber connected ({len(self.queues)} total)")
+
+    def _send_loop(self, conn, q: queue.Queue):
+        try:
+            while True:
+                incident = q.get()
+                if incident is None:
+                    break
+                conn.send(incident)
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self.lock:
+                self.queues.discard(q)
+            conn.close()
+            logger.info("Incident subscriber disconnected")
+
+    def publish(self, incident: dict):
+        with self.lock:
+            queues = list(self.queues)
+        for q in queues:
+            try:
+                q.put_nowait(incident)
+            except queue.Full:
+                self.dropped += 1
+
+    def subscriber_count(self) -> int:
+        with self.lock:
+            return len(self.queues)
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+        with self.lock:
+            queues = list(self.queues)
+        for q in queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+class IncidentSubscriber:
+    """API worker side: keep a connection to the publisher and hand each incident to `on_incident`."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes, on_incident: Callable[[dict], None],
+                 retry_interval: float = 1.0):
+        self.address = address
+        self.authkey = authkey
+        self.on_incident = on_incident
+        self.retry_interval = retry_interval
+        self.connected = False
+        self.conn = None
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, daemon=True, name="incident-subscriber").start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+            except AuthenticationError:
+                logger.error("Incident publisher rejected our authkey, check INCIDENT_IPC_AUTHKEY")
+                time.sleep(self.retry_interval * 10)
+                continue
+            except (OSError, EOFError):
+                # Detector not up (yet); keep trying
+                time.sleep(self.retry_interval)
+                continue
+            self.connected = True
+            logger.info(f"Connected to incident publisher at {self.address[0]}:{self.address[1]}")
+            try:
+                while True:
+                    self.on_incident(self.conn.recv())
+            except (OSError, EOFError):
+                if not self._stop.is_set():
+                    logger.warning("Lost connection to incident publisher, reconnecting")
+            finally:
+                self.connected = False
+                self.conn.close()
+            time.sleep(self.retry_interval)
+
+    def close(self):
+        self._stop.set()
+        if self.conn is not None:
+            self.conn.close()
@@ -4,19 +4,36 @@ import threading
 import os
 import json
 import logging
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response, Request, Query
-from fastapi.responses import StreamingResponse
+import math
+from fastapi import FastAPI, WebSocket, Response, Request, Query, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from ultralytics import YOLO, RTDETR
+from detector import load_detector, warmup
+from motion_gate import MotionGate
+from tracker import IoUTracker
+from tiling import crop, merge_detections, plan_regions
+from metrics import Registry, SamplingProfiler
+from ipc import FrameRingReader, FrameRingWriter, IncidentPublisher, IncidentSubscriber, ring_name
+from clips import ClipRecorder, FrameBuffer
+from retention import ArchiveStore, directory_bytes, enable_incremental_vacuum, incremental_vacuum
 from typing import List, Dict, Set, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+import base64
+import numpy as np
 import queue
+import itertools
+import shutil
 import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
-from sqlalchemy import create_engine, Column, String, Float, DateTime, func
+from telegram.helpers import escape_markdown
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+from sqlalchemy import create_engine, event, inspect, Column, String, Float, Integer, DateTime, Index, MetaData, and_, or_, exists, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -28,24 +45,153 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- CONFIG ---
+# Detector: weights file, architecture ("yolo" or "rtdetr", e.g. with "bestRTDETR.pt"),
+# backend ("pytorch", "onnx" or "openvino") and precision ("fp32", "fp16" or "int8")
+MODEL_WEIGHTS = os.getenv('MODEL_WEIGHTS', 'bestyolov11.pt')
+MODEL_ARCH = os.getenv('MODEL_ARCH', 'yolo')
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'pytorch')
+MODEL_PRECISION = os.getenv('MODEL_PRECISION', 'fp32')
+MODEL_CALIBRATION_DATA = os.getenv('MODEL_CALIBRATION_DATA')  # dataset yaml, needed for int8 export
+
 CAMERA_ID = 0  # 0 for default webcam
 CAMERA_LABEL = "Camera 1"
 INCIDENTS_DIR = "incidents"
+# Incident snapshots: the original plus smaller renditions, all written once at persist time
+SNAPSHOT_QUALITY = 90  # JPEG quality of the original
+SNAPSHOT_RENDITIONS = {"thumbnail": (320, 70), "preview": (960, 80)}  # field -> (max width px, JPEG quality)
+SNAPSHOT_CACHE_MAX_AGE = 31536000  # seconds; a snapshot URL never changes content
 WEAPON_LABELS = ["pistol", "knife"]
 CONFIDENCE_THRESHOLD = 0.78
-DUPLICATE_TIME_WINDOW = 10  # seconds
+DUPLICATE_TIME_WINDOW = 10  # seconds, only used when TRACKING is off
+
+# Weapon tracking: one incident per tracked object instead of per (camera, label) window
+TRACKING = True
+TRACK_MIN_CONFIDENCE = 0.5  # weapon boxes at or above this keep a track alive
+TRACK_IOU_THRESHOLD = 0.3  # minimum IoU to match a box to an existing track
+TRACK_MAX_AGE = 2.0  # seconds a track survives without a matching box
+TRACK_CONFIRM_HITS = 3  # a track is confirmed after being seen in N ...
+TRACK_CONFIRM_WINDOW = 5  # ... of its last M inference frames (and peaking >= CONFIDENCE_THRESHOLD)
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"  # format of Incident.timestamp
 
 # Telegram config
 BOT_TOKEN = str(os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_TOKEN'))
-SUBSCRIPTIONS_FILE = "telegram_subscriptions.json"
+SUBSCRIPTIONS_FILE = "telegram_subscriptions.json"  # old subscriber list, imported into the database on first start
+DB_VERSION_SUBSCRIPTIONS_IMPORTED = 1  # PRAGMA user_version once SUBSCRIPTIONS_FILE has been imported
+SUBSCRIPTION_FILTER_KINDS = ("camera", "label")  # per-chat allow lists (see TelegramSubscriptionFilter)
+TELEGRAM_DIGEST_MAX_LINES = 10  # incidents listed in one digest message (captions are capped at 1024 chars)
+TELEGRAM_MAX_CONCURRENCY = 20  # concurrent sends per alert
+TELEGRAM_GLOBAL_RATE = 25  # messages/second across all chats (Telegram limit is ~30)
+TELEGRAM_PER_CHAT_INTERVAL = 1.0  # seconds between messages to the same chat
+TELEGRAM_MAX_RETRIES = 3  # retries for transient send errors
+TELEGRAM_RETRY_BASE_DELAY = 1.0  # seconds, doubled on every retry
 
-# Camera to location map
+# Camera to location map. "source" is anything cv2.VideoCapture accepts
+# (webcam index, RTSP/HTTP URL or video file path).
 CAMERA_LOCATION_MAP = {
-    "Camera 1": {"name": "Main Entrance", "location": "Building A - Front"}
+    "Camera 1": {"name": "Main Entrance", "location": "Building A - Front", "source": CAMERA_ID}
 }
+# Optional JSON file with extra/overriding camera definitions, same shape as CAMERA_LOCATION_MAP
+CAMERAS_FILE = os.getenv('CAMERAS_FILE', 'cameras.json')
+INFERENCE_BATCH_SIZE = 16  # max frames per batched model call
+MAX_INFERENCE_FPS = 20  # upper bound on scheduler rounds per second (0 = unlimited)
+MJPEG_QUALITY = 80  # JPEG quality for the /video stream
+CAPTURE_MAX_BACKOFF = 2.0  # seconds between retries when a camera stops returning frames
+
+# ROIs and tiling: per camera, set "rois" (list of polygons [[x, y], ...] in pixels)
+# and/or "tile_size" (pixels, e.g. 640) and "tile_overlap" in CAMERA_LOCATION_MAP
+TILE_OVERLAP = 0.2  # default fraction of overlap between neighbouring tiles
+TILE_MERGE_IOU = 0.5  # IoU of two boxes clipped to their tiles' overlap above which they are one object
+
+# Motion gating: skip the detector on static scenes (see motion_gate.py)
+MOTION_GATING = True
+MOTION_WIDTH = 160  # width of the downscaled frame used for differencing
+MOTION_PIXEL_THRESHOLD = 25  # grey-level change that counts as a changed pixel
+MOTION_AREA_THRESHOLD = 0.005  # fraction of changed pixels that counts as motion
+MOTION_HOLD_SECONDS = 2.0  # keep full inference rate this long after motion stops
+WEAPON_HOLD_SECONDS = 10.0  # keep full inference rate this long after any weapon box
+IDLE_INFERENCE_INTERVAL = 1.0  # seconds between detector runs while nothing changes
+
+# Incident persistence
+PERSIST_QUEUE_SIZE = 256  # max incidents waiting for snapshot + DB write
+PERSIST_BATCH_SIZE = 32  # max incidents per DB commit
+PERSIST_PUT_TIMEOUT = 0.5  # seconds detection waits on a full queue before dropping
+PERSIST_SHUTDOWN_TIMEOUT = 10.0  # seconds allowed to flush on shutdown
+PERSIST_COMMIT_RETRIES = 4  # retries of a failed commit (e.g. "database is locked") before giving up
+PERSIST_RETRY_BASE_DELAY = 0.5  # seconds, doubled on every retry
+
+# Incident API
+INCIDENTS_PAGE_SIZE = 500  # default /incidents page size
+INCIDENTS_MAX_PAGE_SIZE = 5000  # largest page a client may request
+
+# WebSocket incident push
+WS_CLIENT_BUFFER = 100  # pending incidents per client before the oldest is dropped
+WS_REPLAY_SIZE = 1000  # recent incidents kept for last_event_id resume
+
+# Metrics (/metrics) and on-demand sampling profiler (/debug/profiler)
+PROFILER_INTERVAL = 0.01  # seconds between stack samples while profiling
+PROFILER_MAX_SECONDS = 300  # profiler stops itself after this long
+
+# Process role. "all" runs everything in one process (uvicorn with a single worker).
+# To scale the API, run one "detector" process (cameras, model, persistence, Telegram)
+# and "api" workers (uvicorn --workers N) that only serve HTTP/WebSocket; see serve.py
+APP_ROLE = os.getenv('APP_ROLE', 'all')
+RUNS_PIPELINE = APP_ROLE in ("all", "detector")
+MODEL_WARMUP_RUNS = 2  # dummy inferences before the detector reports ready
+NOTIFICATION_SETTINGS_FILE = "notification_settings.json"  # shared by all processes
+
+# Detector -> API worker transport (see ipc.py): annotated frames go through one
+# shared memory ring per camera, incidents through a local authenticated socket
+FRAME_RING_PREFIX = os.getenv('FRAME_RING_PREFIX', 'weapon_frames')
+FRAME_RING_SLOTS = 4  # frames kept per camera; readers must encode one before it is lapped
+FRAME_RING_POLL_INTERVAL = 0.005  # seconds between checks for a new frame while someone is watching
+FRAME_RING_STALE_SECONDS = 2.0  # reattach after this long without frames (detector restarted)
+INCIDENT_IPC_ADDRESS = (os.getenv('INCIDENT_IPC_HOST', '127.0.0.1'), int(os.getenv('INCIDENT_IPC_PORT', '8765')))
+# Shared secret of the pickle-based incident channel; serve.py generates a random one for each run
+INCIDENT_IPC_AUTHKEY = os.getenv('INCIDENT_IPC_AUTHKEY', '').encode()
+
+# Incident clips (see clips.py): every camera buffers its last seconds of raw frames,
+# downscaled and JPEG compressed, and an MP4 around each incident is encoded in the background
+CLIP_RECORDING = True
+CLIP_PRE_SECONDS = 5.0  # seconds of video before the incident
+CLIP_POST_SECONDS = 5.0  # seconds of video after the incident
+CLIP_FPS = 10  # frames per second buffered and written to the clip
+CLIP_WIDTH = 960  # wider frames are downscaled before buffering
+CLIP_JPEG_QUALITY = 75  # JPEG quality of buffered frames
+CLIP_BUFFER_MAX_BYTES = 32 * 1024 * 1024  # per camera; the oldest frames go first beyond this
+CLIP_ENCODER_WORKERS = 2  # clips encoded concurrently
+CLIP_MAX_PENDING = 32  # clips waiting or encoding; incidents beyond this get no clip
+CLIP_FOURCC = "avc1"  # H.264 plays in browsers; falls back to "mp4v" if OpenCV has no H.264 encoder
+
+# Retention (see retention.py): incidents past the age or size limits move to monthly archive
+# databases in ARCHIVE_DIR, their files are compressed or deleted, and the live database is
+# shrunk with incremental VACUUM. Runs in a background thread of the process running the pipeline
+RETENTION_ENABLED = True
+RETENTION_DAYS = 90  # incidents older than this are archived (0 = no age limit)
+RETENTION_MAX_INCIDENTS = 0  # live incidents kept at most, oldest archived first (0 = no limit)
+RETENTION_MAX_BYTES = 5 * 1024 ** 3  # size of the live incidents' files kept at most, oldest archived first (0 = no limit)
+RETENTION_INTERVAL = 3600  # seconds between runs
+RETENTION_START_DELAY = 300  # seconds after startup before the first run
+RETENTION_BATCH_SIZE = 200  # incidents archived per transaction
+RETENTION_BATCH_PAUSE = 1.0  # seconds slept between batches and between vacuum steps (I/O throttle)
+RETENTION_VACUUM_PAGES = 1000  # database pages returned to the filesystem per vacuum step
+RETENTION_NICE = 10  # CPU niceness of the retention thread (Linux only)
+RETENTION_ORPHAN_GRACE = 86400  # files in INCIDENTS_DIR without an incident row move to ARCHIVE_DIR/orphans after this many seconds (0 = never)
+ARCHIVE_DIR = "archive"
+ARCHIVE_IMAGE_POLICY = "compress"  # "compress": keep one small JPEG per archived incident, "delete": keep no image
+ARCHIVE_IMAGE_WIDTH = 640  # width of the kept JPEG
+ARCHIVE_IMAGE_QUALITY = 60  # JPEG quality of the kept JPEG
 
 # --- SETUP ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build every component on startup and tear it down on shutdown (see LIFECYCLE)."""
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,32 +199,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-if not os.path.exists(INCIDENTS_DIR):
-    os.makedirs(INCIDENTS_DIR)
-
-# Load YOLOv8 model (assume weights are in 'yolov8.pt')
-#model = RTDETR("bestRTDETR.pt")
-model = YOLO("bestyolov11.pt")
-
 # --- GLOBALS ---
-clients: List[WebSocket] = []
-latest_frame = None
-frame_lock = threading.Lock()
-incident_queue = queue.Queue()
+model = None  # loaded and warmed up in the background by load_model()
+readiness = {"database": False, "model": False}  # see /readyz
+camera_streams: Dict[str, "CameraStream"] = {}
+shared_cameras: Dict[str, "SharedCamera"] = {}  # api workers: cameras read from the detector's frame rings
+incident_publisher: Optional[IncidentPublisher] = None  # detector process only
+incident_subscriber: Optional[IncidentSubscriber] = None  # api workers only
+clip_recorder: Optional[ClipRecorder] = None  # processes that run the pipeline, if CLIP_RECORDING
+retention_thread: Optional[threading.Thread] = None  # processes that run the pipeline, if RETENTION_ENABLED
+retention_trigger = threading.Event()  # set to start a retention run now
+retention_stop = threading.Event()
+retention_state = {"running": False, "last_run": None}
+frame_ready = threading.Event()  # set by capture threads whenever a new frame lands
+pipeline_stop = threading.Event()  # set at shutdown so capture and inference stop producing incidents
+inference_thread: Optional[threading.Thread] = None
+# (incident, frame) pairs awaiting write, and ({"id", "clip"}, None) for finished clips;
+# one FIFO queue so a clip link is never applied before its incident's row exists
+persist_queue = queue.Queue(maxsize=PERSIST_QUEUE_SIZE)
+persist_stats = {"written": 0, "dropped": 0, "failed": 0}
+# WebSocket event ids, assigned by the pipeline process; seeded from the clock so they keep growing across restarts
+event_ids = itertools.count(int(time.time() * 1000))
+
+# Metrics: stage timings are observed on the hot path, everything else is read at scrape time
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram(
+    "weapon_stage_seconds", "Time spent per pipeline stage", ["stage"]
+)
+profiler = SamplingProfiler(PROFILER_INTERVAL, PROFILER_MAX_SECONDS)
 
 # Telegram globals
-subscribed_chats: Set[str] = set()
 telegram_alert_queue = queue.Queue()
+# chat_id -> {"incidents", "task"} of open digest windows; only touched on the Telegram worker's loop
+digest_windows: Dict[str, dict] = {}
 
 # Notification settings
 notification_enabled = True  # Default to enabled
 notification_lock = threading.Lock()
+notification_settings_mtime = None  # mtime of NOTIFICATION_SETTINGS_FILE last loaded
 
 # --- DATABASE SETUP ---
 DATABASE_URL = "sqlite:///incidents.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets API reads run while the persistence worker commits.
+
+    synchronous=FULL syncs the WAL on every commit, so an incident batch that
+    was committed survives a power loss. NORMAL would save that sync but may
+    lose the last commits. The worker commits whole batches, so the sync is
+    paid once per batch, not per incident.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -91,66 +271,461 @@ class Incident(Base):
     location = Column(String)
     label = Column(String)
     confidence = Column(Float)
-    image = Column(String)
+    image = Column(String)  # original snapshot
+    thumbnail = Column(String)  # small rendition for lists/grids (NULL for incidents older than renditions)
+    preview = Column(String)  # medium rendition for detail views and Telegram
+    clip = Column(String)  # MP4 around the incident; NULL until encoded, or if recording was off or failed
+
+    # Composite indexes for keyset pagination on (timestamp, id) with filters
+    __table_args__ = (
+        Index("ix_incidents_timestamp_id", "timestamp", "id"),
+        Index("ix_incidents_camera_timestamp_id", "camera", "timestamp", "id"),
+        Index("ix_incidents_label_timestamp_id", "label", "timestamp", "id"),
+    )
 
-Base.metadata.create_all(bind=engine)
+class IncidentRollup(Base):
+    """Incident counts per time bucket x camera x label, kept up to date on every insert."""
+    __tablename__ = "incident_rollups"
+    granularity = Column(String, primary_key=True)  # "hour", "day" or "month"
+    period = Column(String, primary_key=True)  # timestamp prefix, e.g. "2025-07-13_22"
+    camera = Column(String, primary_key=True)
+    camera_name = Column(String, primary_key=True)
+    location = Column(String, primary_key=True)
+    label = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
-# --- TELEGRAM FUNCTIONS ---
-def load_subscriptions():
-    """Load subscriptions from file."""
-    global subscribed_chats
+class TelegramSubscription(Base):
+    """A Telegram chat receiving alerts, with its scalar alert filters."""
+    __tablename__ = "telegram_subscriptions"
+    chat_id = Column(String, primary_key=True)
+    min_confidence = Column(Float, nullable=False, default=0.0)  # same 0-1 scale as Incident.confidence
+    quiet_start = Column(String)  # "HH:MM" local time; no alerts from quiet_start until quiet_end
+    quiet_end = Column(String)
+    digest_seconds = Column(Integer, nullable=False, default=0)  # 0 = one message per incident
+    created_at = Column(String)
+
+    __table_args__ = (
+        Index("ix_telegram_subscriptions_min_confidence", "min_confidence"),
+    )
+
+class TelegramSubscriptionFilter(Base):
+    """One allowed camera or label of a chat; a chat without rows of a kind gets all of that kind."""
+    __tablename__ = "telegram_subscription_filters"
+    chat_id = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)  # "camera" or "label"
+    value = Column(String, primary_key=True)  # camera key as in Incident.camera, or lower-case label
+
+    __table_args__ = (
+        Index("ix_telegram_subscription_filters_kind_value", "kind", "value", "chat_id"),
+    )
+
+# Incidents moved out of the live database by retention, one SQLite file per month
+archive_store = ArchiveStore(ARCHIVE_DIR, Incident.__table__)
+
+# Timestamp prefix length per rollup granularity ("YYYY-MM-DD_HH", "YYYY-MM-DD", "YYYY-MM")
+ROLLUP_GRANULARITIES = {"hour": 13, "day": 10, "month": 7}
+
+def init_database():
+    """Create tables and indexes, then backfill rollups for databases that predate them."""
+    Base.metadata.create_all(bind=engine)
+    if RETENTION_ENABLED and RUNS_PIPELINE:
+        # API workers start after the detector process, which has already done this
+        if enable_incremental_vacuum(engine):
+            logger.info("Rebuilt the database once with auto_vacuum=INCREMENTAL")
+    # create_all skips tables that already exist, so add new indexes to older databases explicitly
+    for index in Incident.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    # ... and it never adds columns either
+    existing = {column["name"] for column in inspect(engine).get_columns("incidents")}
+    with engine.begin() as conn:
+        for column in [*SNAPSHOT_RENDITIONS, "clip"]:
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE incidents ADD COLUMN {column} VARCHAR"))
+    backfill_rollups_if_empty()
+
+# --- ANALYTICS ROLLUPS ---
+# rebuild_rollups fills this copy of incident_rollups in small transactions, then swaps it in
+rollup_staging = IncidentRollup.__table__.to_metadata(MetaData(), name="incident_rollups_rebuild")
+# Held for a whole rebuild (staging and swap), and by retention while it moves a batch to the archive
+rollup_rebuild_lock = threading.Lock()
+ROLLUP_WRITE_CHUNK = 5000  # buckets per staging transaction during a rebuild
+
+def add_to_rollups(db, incidents: list, table=IncidentRollup.__table__):
+    """Increment rollup buckets for newly inserted incidents (same transaction as the insert)."""
+    counts: Dict[tuple, int] = {}
+    for incident in incidents:
+        for granularity, length in ROLLUP_GRANULARITIES.items():
+            key = (granularity, incident["timestamp"][:length], incident["camera"],
+                   incident["camera_name"], incident["location"], incident["label"])
+            counts[key] = counts.get(key, 0) + 1
+    add_rollup_counts(db, counts, table)
+
+def add_rollup_counts(db, counts: Dict[tuple, int], table=IncidentRollup.__table__):
+    """Upsert {(granularity, period, camera, camera_name, location, label): count} into a rollup table."""
+    if not counts:
+        return
+    stmt = sqlite_insert(table).values([
+        {"granularity": k[0], "period": k[1], "camera": k[2], "camera_name": k[3],
+         "location": k[4], "label": k[5], "count": n}
+        for k, n in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["granularity", "period", "camera", "camera_name", "location", "label"],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+def rebuild_rollups(wait: bool = True) -> Optional[int]:
+    """Recompute all rollup buckets from the live and archived incidents (backfill for existing databases).
+
+    The counts are read without the write lock and staged in small
+    transactions; only the final swap into incident_rollups takes the lock,
+    briefly, so the persistence worker's inserts are never held up behind it.
+    Incidents inserted during the rebuild are added in the swap.
+
+    rollup_rebuild_lock is held from staging through the swap and the drop of
+    the staging table. With wait=False the call returns None at once if a
+    rebuild or retention batch already holds it.
+    """
+    if not rollup_rebuild_lock.acquire(blocking=wait):
+        return None
     try:
-        if os.path.exists(SUBSCRIPTIONS_FILE):
-            with open(SUBSCRIPTIONS_FILE, 'r') as f:
-                data = json.load(f)
-                subscribed_chats = set(data.get('subscriptions', []))
-    except Exception as e:
-        logger.error(f"Failed to load subscriptions: {e}")
-        subscribed_chats = set()
+        rollup_staging.drop(engine, checkfirst=True)
+        rollup_staging.create(engine)
+
+        def stage(rows):
+            for i in range(0, len(rows), ROLLUP_WRITE_CHUNK):
+                with engine.begin() as conn:
+                    add_rollup_counts(conn, {tuple(r[:6]): r[6] for r in rows[i:i + ROLLUP_WRITE_CHUNK]}, rollup_staging)
 
-def save_subscriptions():
-    """Save subscriptions to file."""
+        # Archived incidents keep counting towards analytics
+        for month in archive_store.months():
+            with archive_store.engine(month).connect() as conn:
+                archived = conn.execute(text(
+                    "SELECT timestamp, coalesce(camera, '') AS camera, coalesce(camera_name, '') AS camera_name, "
+                    "coalesce(location, '') AS location, coalesce(label, '') AS label FROM incidents"
+                )).mappings().all()
+            with engine.begin() as conn:
+                add_to_rollups(conn, archived, rollup_staging)
+        with engine.connect() as conn:
+            # rowid only grows on insert, so it marks which incidents this pass has counted
+            last_rowid = conn.execute(text("SELECT coalesce(max(rowid), 0) FROM incidents")).scalar()
+        for granularity, length in ROLLUP_GRANULARITIES.items():
+            with engine.connect() as conn:
+                rows = conn.execute(text(
+                    "SELECT :granularity, substr(timestamp, 1, :length) AS period, "
+                    "coalesce(camera, ''), coalesce(camera_name, ''), coalesce(location, ''), coalesce(label, ''), count(*) "
+                    "FROM incidents WHERE rowid <= :last_rowid GROUP BY 2, 3, 4, 5, 6"
+                ), {"granularity": granularity, "length": length, "last_rowid": last_rowid}).all()
+            stage(rows)
+
+        with engine.begin() as conn:
+            # The delete takes the write lock first, so no incident can be inserted between the catch-up read and the swap
+            conn.execute(IncidentRollup.__table__.delete())
+            newer = conn.execute(text(
+                "SELECT timestamp, coalesce(camera, '') AS camera, coalesce(camera_name, '') AS camera_name, "
+                "coalesce(location, '') AS location, coalesce(label, '') AS label FROM incidents WHERE rowid > :last_rowid"
+            ), {"last_rowid": last_rowid}).mappings().all()
+            add_to_rollups(conn, newer, rollup_staging)
+            conn.execute(text(f"INSERT INTO incident_rollups SELECT * FROM {rollup_staging.name}"))
+            buckets = conn.execute(text(f"SELECT count(*) FROM {rollup_staging.name}")).scalar()
+        rollup_staging.drop(engine)
+        logger.info(f"Rebuilt analytics rollups: {buckets} buckets")
+        return buckets
+    finally:
+        rollup_rebuild_lock.release()
+
+def backfill_rollups_if_empty():
+    """Build rollups on first start against a database created before they existed."""
+    db = SessionLocal()
     try:
-        with open(SUBSCRIPTIONS_FILE, 'w') as f:
-            json.dump({'subscriptions': list(subscribed_chats)}, f)
-    except Exception as e:
-        logger.error(f"Failed to save subscriptions: {e}")
+        needs_backfill = db.query(IncidentRollup).first() is None and db.query(Incident).first() is not None
+    finally:
+        db.close()
+    if needs_backfill:
+        rebuild_rollups()
+
+# --- INCIDENT DEDUP ---
+class DedupIndex:
+    """Last-alert time per (camera, label), so duplicate checks never touch the DB.
+
+    Times are kept on the monotonic clock; the index is warmed from the DB at
+    startup so a restart does not re-alert on something reported seconds ago.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.lock = threading.Lock()
+        self.last_alert: Dict[tuple, float] = {}
+
+    def warm(self):
+        """Load the latest incident time per (camera, label) from the DB."""
+        db = SessionLocal()
+        try:
+            rows = db.query(Incident.camera, Incident.label, func.max(Incident.timestamp)).group_by(
+                Incident.camera, Incident.label
+            ).all()
+        finally:
+            db.close()
+        now_wall = datetime.now()
+        now_mono = time.monotonic()
+        with self.lock:
+            for camera, label, timestamp in rows:
+                try:
+                    age = (now_wall - datetime.strptime(timestamp, TIMESTAMP_FORMAT)).total_seconds()
+                except (TypeError, ValueError):
+                    continue
+                if age < self.window:
+                    self.last_alert[(camera, label)] = now_mono - age
+        logger.info(f"Dedup index warmed from {len(rows)} camera/label pairs")
+
+    def should_alert(self, camera: str, label: str) -> bool:
+        """Return True (and record the alert) unless one fired within the window."""
+        key = (camera, label)
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_alert.get(key)
+            if last is not None and now - last < self.window:
+                return False
+            self.last_alert[key] = now
+            return True
+
+dedup_index = DedupIndex(DUPLICATE_TIME_WINDOW)
+
+# --- TELEGRAM FUNCTIONS ---
+def subscription_now() -> str:
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
 
 def subscribe_chat(chat_id: str) -> bool:
-    """Subscribe a chat ID to alerts."""
-    subscribed_chats.add(chat_id)
-    save_subscriptions()
-    logger.info(f"Chat {chat_id} subscribed to alerts")
-    return True
+    """Subscribe a chat ID to alerts; False if it already was (its filters are kept)."""
+    db = SessionLocal()
+    try:
+        result = db.execute(sqlite_insert(TelegramSubscription).values(
+            chat_id=chat_id, min_confidence=0.0, digest_seconds=0, created_at=subscription_now()
+        ).on_conflict_do_nothing())
+        db.commit()
+    finally:
+        db.close()
+    if result.rowcount:
+        logger.info(f"Chat {chat_id} subscribed to alerts")
+    return bool(result.rowcount)
 
 def unsubscribe_chat(chat_id: str) -> bool:
-    """Unsubscribe a chat ID from alerts."""
-    if chat_id in subscribed_chats:
-        subscribed_chats.remove(chat_id)
-        save_subscriptions()
+    """Unsubscribe a chat ID from alerts and drop its filters."""
+    db = SessionLocal()
+    try:
+        db.query(TelegramSubscriptionFilter).filter(TelegramSubscriptionFilter.chat_id == chat_id).delete()
+        removed = db.query(TelegramSubscription).filter(TelegramSubscription.chat_id == chat_id).delete()
+        db.commit()
+    finally:
+        db.close()
+    if removed:
         logger.info(f"Chat {chat_id} unsubscribed from alerts")
+    return bool(removed)
+
+def migrate_chat(chat_id: str, new_chat_id: str) -> bool:
+    """Move a subscription and its filters to the id Telegram migrated the chat to."""
+    db = SessionLocal()
+    try:
+        if db.query(TelegramSubscription.chat_id).filter(TelegramSubscription.chat_id == new_chat_id).first() is not None:
+            moved = False  # already subscribed under the new id; that subscription wins
+        else:
+            db.query(TelegramSubscriptionFilter).filter(TelegramSubscriptionFilter.chat_id == chat_id).update(
+                {TelegramSubscriptionFilter.chat_id: new_chat_id})
+            moved = bool(db.query(TelegramSubscription).filter(TelegramSubscription.chat_id == chat_id).update(
+                {TelegramSubscription.chat_id: new_chat_id}))
+        db.commit()
+    finally:
+        db.close()
+    if not moved:
+        unsubscribe_chat(chat_id)
+    logger.info(f"Moved subscription of chat {chat_id} to {new_chat_id}" if moved else
+                f"Dropped subscription of migrated chat {chat_id}")
+    return moved
+
+def get_subscription(chat_id: str) -> Optional[dict]:
+    """A chat's subscription with its camera and label filters, or None if it is not subscribed."""
+    db = SessionLocal()
+    try:
+        sub = db.query(TelegramSubscription).filter(TelegramSubscription.chat_id == chat_id).first()
+        if sub is None:
+            return None
+        allowed = {kind: [] for kind in SUBSCRIPTION_FILTER_KINDS}
+        for kind, value in (db.query(TelegramSubscriptionFilter.kind, TelegramSubscriptionFilter.value)
+                            .filter(TelegramSubscriptionFilter.chat_id == chat_id)
+                            .order_by(TelegramSubscriptionFilter.kind, TelegramSubscriptionFilter.value)):
+            allowed[kind].append(value)
+        return {
+            "chat_id": sub.chat_id,
+            "cameras": allowed["camera"],
+            "labels": allowed["label"],
+            "min_confidence": sub.min_confidence,
+            "quiet_start": sub.quiet_start,
+            "quiet_end": sub.quiet_end,
+            "digest_seconds": sub.digest_seconds,
+        }
+    finally:
+        db.close()
+
+def update_subscription(chat_id: str, **fields) -> bool:
+    """Change columns of a chat's subscription; False if it is not subscribed."""
+    db = SessionLocal()
+    try:
+        updated = db.query(TelegramSubscription).filter(TelegramSubscription.chat_id == chat_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+    return bool(updated)
+
+def set_subscription_filter(chat_id: str, kind: str, values: List[str]) -> bool:
+    """Replace a chat's allowed cameras or labels in one transaction (empty = all); False if not subscribed."""
+    db = SessionLocal()
+    try:
+        if db.query(TelegramSubscription.chat_id).filter(TelegramSubscription.chat_id == chat_id).first() is None:
+            return False
+        db.query(TelegramSubscriptionFilter).filter(
+            TelegramSubscriptionFilter.chat_id == chat_id, TelegramSubscriptionFilter.kind == kind
+        ).delete()
+        if values:
+            db.execute(sqlite_insert(TelegramSubscriptionFilter).values(
+                [{"chat_id": chat_id, "kind": kind, "value": value} for value in values]
+            ).on_conflict_do_nothing())
+        db.commit()
         return True
-    return False
+    finally:
+        db.close()
+
+def count_subscriptions() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(TelegramSubscription.chat_id)).scalar()
+    finally:
+        db.close()
+
+def matching_chats(incident: dict) -> List[tuple]:
+    """(chat_id, digest_seconds) of every chat whose filters let this incident through.
+
+    Camera and label filters are EXISTS probes on the filter table's primary
+    key, so the cost grows with the number of subscriptions, never with how
+    many alerts each of them ignores. Quiet hours use the incident's local time.
+    """
+    sub, flt = TelegramSubscription, TelegramSubscriptionFilter
+
+    def allows(kind: str, value: str):
+        restricted = exists().where(flt.chat_id == sub.chat_id, flt.kind == kind)
+        listed = exists().where(flt.chat_id == sub.chat_id, flt.kind == kind, flt.value == value)
+        return or_(~restricted, listed)
+
+    clock = incident["timestamp"][11:16].replace("-", ":")  # "HH:MM"
+    in_quiet_hours = or_(
+        and_(sub.quiet_start <= sub.quiet_end, sub.quiet_start <= clock, sub.quiet_end > clock),
+        # Windows across midnight, e.g. 22:00-07:00
+        and_(sub.quiet_start > sub.quiet_end, or_(sub.quiet_start <= clock, sub.quiet_end > clock)),
+    )
+    db = SessionLocal()
+    try:
+        return db.query(sub.chat_id, sub.digest_seconds).filter(
+            sub.min_confidence <= incident.get("confidence", 0),
+            allows("camera", incident.get("camera", "")),
+            allows("label", str(incident.get("label", "")).lower()),
+            or_(sub.quiet_start.is_(None), sub.quiet_end.is_(None), ~in_quiet_hours),
+        ).all()
+    finally:
+        db.close()
 
-def get_subscribed_chats() -> Set[str]:
-    """Get all subscribed chat IDs."""
-    return subscribed_chats.copy()
+def import_legacy_subscriptions():
+    """Copy chats from the old SUBSCRIPTIONS_FILE into the database, once.
+
+    The file is left where it is; PRAGMA user_version records that the import
+    happened, in the same transaction as the rows.
+    """
+    if not os.path.exists(SUBSCRIPTIONS_FILE):
+        return
+    try:
+        with engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA user_version").scalar() >= DB_VERSION_SUBSCRIPTIONS_IMPORTED:
+                return
+        with open(SUBSCRIPTIONS_FILE, 'r') as f:
+            chats = [str(chat_id) for chat_id in json.load(f).get('subscriptions', [])]
+        with engine.begin() as conn:
+            if chats:
+                created_at = subscription_now()
+                conn.execute(sqlite_insert(TelegramSubscription).values([
+                    {"chat_id": chat_id, "min_confidence": 0.0, "digest_seconds": 0, "created_at": created_at}
+                    for chat_id in chats
+                ]).on_conflict_do_nothing())
+            conn.exec_driver_sql(f"PRAGMA user_version = {DB_VERSION_SUBSCRIPTIONS_IMPORTED}")
+        logger.info(f"Imported {len(chats)} Telegram subscriptions from {SUBSCRIPTIONS_FILE}")
+    except Exception as e:
+        logger.error(f"Failed to import subscriptions from {SUBSCRIPTIONS_FILE}: {e}")
+
+def load_notification_settings():
+    """Pick up the notification toggle from disk if another process changed it."""
+    global notification_enabled, notification_settings_mtime
+    try:
+        mtime = os.path.getmtime(NOTIFICATION_SETTINGS_FILE)
+        if mtime == notification_settings_mtime:
+            return
+        with open(NOTIFICATION_SETTINGS_FILE, 'r') as f:
+            enabled = bool(json.load(f).get('enabled', True))
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.error(f"Failed to load notification settings: {e}")
+        return
+    with notification_lock:
+        notification_enabled = enabled
+        notification_settings_mtime = mtime
+
+def save_notification_settings(enabled: bool):
+    """Persist the notification toggle so the detector process and all API workers agree."""
+    try:
+        with open(NOTIFICATION_SETTINGS_FILE, 'w') as f:
+            json.dump({'enabled': enabled}, f)
+    except Exception as e:
+        logger.error(f"Failed to save notification settings: {e}")
+
+HELP_COMMANDS = (
+    "• /subscribe - Subscribe to alerts\n"
+    "• /unsubscribe - Unsubscribe from alerts\n"
+    "• /status - Check subscription status and filters\n"
+    "• /cameras - Only alert for some cameras, e.g. `/cameras Camera 1, Camera 2` (`all` to reset)\n"
+    "• /labels - Only alert for some weapons, e.g. `/labels pistol` (`all` to reset)\n"
+    "• /minconf - Minimum confidence in percent, e.g. `/minconf 85` (`off` to reset)\n"
+    "• /quiet - No alerts during these hours, e.g. `/quiet 22:00-07:00` (`off` to reset)\n"
+    "• /digest - Bundle alerts arriving within N seconds into one message, e.g. `/digest 60` (`off` to reset)\n"
+    "• /help - Show help message\n"
+)
+
+def describe_subscription(sub: dict) -> str:
+    """Markdown summary of a chat's alert filters for /status."""
+    quiet = f"{sub['quiet_start']}-{sub['quiet_end']}" if sub["quiet_start"] else "off"
+    digest = f"{sub['digest_seconds']}s" if sub["digest_seconds"] else "off"
+    cameras = escape_markdown(', '.join(sub['cameras']) or 'all', version=1)
+    labels = escape_markdown(', '.join(sub['labels']) or 'all', version=1)
+    return (
+        f"📹 *Cameras:* {cameras}\n"
+        f"🔫 *Weapons:* {labels}\n"
+        f"📊 *Minimum confidence:* {round(sub['min_confidence'] * 100)}%\n"
+        f"🌙 *Quiet hours:* {quiet}\n"
+        f"📦 *Digest:* {digest}"
+    )
+
+def command_text(context: ContextTypes.DEFAULT_TYPE) -> str:
+    return " ".join(context.args or []).strip()
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
     chat_id = str(update.effective_chat.id)
-    subscribe_chat(chat_id)
+    await asyncio.to_thread(subscribe_chat, chat_id)
     
     message = (
         "🤖 *Welcome to Weapon Detection Alert Bot!*\n\n"
         "✅ You have been subscribed to weapon detection alerts!\n\n"
         "You will now receive notifications when weapons are detected by our security system.\n\n"
         "*Available Commands:*\n"
-        "• /subscribe - Subscribe to alerts\n"
-        "• /unsubscribe - Unsubscribe from alerts\n"
-        "• /status - Check subscription status\n"
-        "• /help - Show help message\n\n"
-        "⚠️ This bot is for security monitoring purposes only."
+        + HELP_COMMANDS +
+        "\n⚠️ This bot is for security monitoring purposes only."
     )
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -158,12 +733,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /subscribe command."""
     chat_id = str(update.effective_chat.id)
-    subscribe_chat(chat_id)
+    await asyncio.to_thread(subscribe_chat, chat_id)
     
     message = (
         "✅ *Subscribed Successfully!*\n\n"
         "You will now receive weapon detection alerts.\n"
-        "Use /unsubscribe to stop receiving alerts."
+        "Use /status to see your filters and /unsubscribe to stop receiving alerts."
     )
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -172,7 +747,7 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Handle /unsubscribe command."""
     chat_id = str(update.effective_chat.id)
     
-    if unsubscribe_chat(chat_id):
+    if await asyncio.to_thread(unsubscribe_chat, chat_id):
         message = (
             "❌ *Unsubscribed Successfully!*\n\n"
             "You will no longer receive weapon detection alerts.\n"
@@ -186,26 +761,113 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command."""
     chat_id = str(update.effective_chat.id)
-    is_subscribed = chat_id in subscribed_chats
-    
-    status_emoji = "✅" if is_subscribed else "❌"
-    status_text = "subscribed" if is_subscribed else "not subscribed"
+    sub = await asyncio.to_thread(get_subscription, chat_id)
     
-    message = f"{status_emoji} You are currently *{status_text}* to weapon detection alerts."
+    if sub is None:
+        message = "❌ You are currently *not subscribed* to weapon detection alerts."
+    else:
+        message = "✅ You are currently *subscribed* to weapon detection alerts.\n\n" + describe_subscription(sub)
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+async def filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, known: List[str]):
+    """Shared body of /cameras and /labels: show, reset or replace one allow list."""
+    chat_id = str(update.effective_chat.id)
+    text_arg = command_text(context)
+    noun = "cameras" if kind == "camera" else "weapons"
+    if not text_arg:
+        sub = await asyncio.to_thread(get_subscription, chat_id)
+        if sub is None:
+            await update.message.reply_text("ℹ️ You are not subscribed. Use /subscribe first.")
+            return
+        current = sub["cameras"] if kind == "camera" else sub["labels"]
+        await update.message.reply_text(
+            f"Alerting for {noun}: {', '.join(current) or 'all'}\nAvailable: {', '.join(known)}"
+        )
+        return
+
+    if text_arg.lower() == "all":
+        values = []
+    elif kind == "camera":
+        # Camera names contain spaces, so the list is comma-separated
+        values = [v.strip() for v in text_arg.split(",") if v.strip()]
+    else:
+        values = [v.strip().lower() for v in text_arg.replace(",", " ").split()]
+    unknown = [v for v in values if v not in known]
+    if unknown:
+        await update.message.reply_text(f"Unknown {noun}: {', '.join(unknown)}\nAvailable: {', '.join(known)}")
+        return
+    if not await asyncio.to_thread(set_subscription_filter, chat_id, kind, values):
+        await update.message.reply_text("ℹ️ You are not subscribed. Use /subscribe first.")
+        return
+    await update.message.reply_text(f"✅ Alerting for {noun}: {', '.join(values) or 'all'}")
+
+async def cameras_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /cameras command."""
+    await filter_command(update, context, "camera", list(CAMERA_LOCATION_MAP))
+
+async def labels_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /labels command."""
+    await filter_command(update, context, "label", WEAPON_LABELS)
+
+async def update_subscription_command(update: Update, fields: dict, confirmation: str):
+    """Apply a setting from a command and confirm it, or point unsubscribed chats to /subscribe."""
+    if await asyncio.to_thread(update_subscription, str(update.effective_chat.id), **fields):
+        await update.message.reply_text(f"✅ {confirmation}")
+    else:
+        await update.message.reply_text("ℹ️ You are not subscribed. Use /subscribe first.")
+
+async def minconf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /minconf command."""
+    text_arg = command_text(context).rstrip("%")
+    try:
+        percent = 0.0 if text_arg.lower() == "off" else float(text_arg)
+        if not 0 <= percent <= 100:
+            raise ValueError(text_arg)
+    except ValueError:
+        await update.message.reply_text("Usage: /minconf 85 (percent, or off)")
+        return
+    await update_subscription_command(update, {"min_confidence": percent / 100},
+                                      f"Minimum confidence set to {percent:g}%")
+
+async def quiet_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /quiet command."""
+    text_arg = command_text(context).replace(" ", "")
+    if text_arg.lower() == "off":
+        await update_subscription_command(update, {"quiet_start": None, "quiet_end": None}, "Quiet hours turned off")
+        return
+    try:
+        start, end = (datetime.strptime(t, "%H:%M").strftime("%H:%M") for t in text_arg.split("-"))
+        if start == end:
+            raise ValueError(text_arg)
+    except ValueError:
+        await update.message.reply_text("Usage: /quiet 22:00-07:00 (or off)")
+        return
+    await update_subscription_command(update, {"quiet_start": start, "quiet_end": end},
+                                      f"No alerts from {start} until {end}")
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /digest command."""
+    text_arg = command_text(context).rstrip("s")
+    try:
+        seconds = 0 if text_arg.lower() in ("off", "0") else int(text_arg)
+        if seconds < 0:
+            raise ValueError(text_arg)
+    except ValueError:
+        await update.message.reply_text("Usage: /digest 60 (seconds, or off)")
+        return
+    confirmation = (f"The first alert of a burst arrives at once; alerts in the next {seconds}s come as one digest"
+                    if seconds else "Digest turned off; every alert is sent on its own")
+    await update_subscription_command(update, {"digest_seconds": seconds}, confirmation)
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command."""
     message = (
         "🤖 *Weapon Detection Bot Help*\n\n"
         "*Available Commands:*\n"
         "• /start - Start the bot and subscribe\n"
-        "• /subscribe - Subscribe to weapon detection alerts\n"
-        "• /unsubscribe - Unsubscribe from alerts\n"
-        "• /status - Check your subscription status\n"
-        "• /help - Show this help message\n\n"
-        "*About:*\n"
+        + HELP_COMMANDS +
+        "\n*About:*\n"
         "This bot sends real-time alerts when weapons are detected by our AI security system.\n\n"
         "⚠️ For security monitoring purposes only."
     )
@@ -230,6 +892,11 @@ def telegram_worker():
         application.add_handler(CommandHandler("subscribe", subscribe_command))
         application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
         application.add_handler(CommandHandler("status", status_command))
+        application.add_handler(CommandHandler("cameras", cameras_command))
+        application.add_handler(CommandHandler("labels", labels_command))
+        application.add_handler(CommandHandler("minconf", minconf_command))
+        application.add_handler(CommandHandler("quiet", quiet_command))
+        application.add_handler(CommandHandler("digest", digest_command))
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         
@@ -240,18 +907,11 @@ def telegram_worker():
         
         logger.info("Telegram bot started successfully")
         
-        # Process alert queue
+        # Process alert queue; blocks in a helper thread until an alert arrives
         while True:
             try:
-                # Check for new alerts (non-blocking)
-                try:
-                    incident = telegram_alert_queue.get_nowait()
-                    await send_incident_alert(application.bot, incident)
-                except queue.Empty:
-                    pass
-                
-                await asyncio.sleep(0.1)  # Small delay to prevent busy waiting
-                
+                incident = await asyncio.to_thread(telegram_alert_queue.get)
+                await send_incident_alert(application.bot, incident)
             except Exception as e:
                 logger.error(f"Error in telegram worker: {e}")
                 await asyncio.sleep(1)
@@ -262,26 +922,54 @@ def telegram_worker():
     except Exception as e:
         logger.error(f"Telegram worker error: {e}")
 
-async def send_incident_alert(bot: Bot, incident: dict):
-    """Send incident alert to all subscribed chats."""
-    # Check if notifications are enabled
-    with notification_lock:
-        if not notification_enabled:
-            logger.info("Notifications disabled, skipping Telegram alert")
-            return
-    
-    if not subscribed_chats:
-        logger.info("No subscribers for incident alerts")
-        return
-    
-    # Format the incident message
+class TelegramRateLimiter:
+    """Global token bucket plus a minimum interval per chat, as Telegram requires."""
+
+    def __init__(self, global_rate: float, per_chat_interval: float):
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.tokens = global_rate
+        self.updated = time.monotonic()
+        self.chat_next: Dict[str, float] = {}
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, chat_id: str):
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.global_rate, self.tokens + (now - self.updated) * self.global_rate)
+                self.updated = now
+                chat_wait = self.chat_next.get(chat_id, 0.0) - now
+                if chat_wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.chat_next[chat_id] = now + self.per_chat_interval
+                    return
+                wait = max(chat_wait, (1 - self.tokens) / self.global_rate)
+            await asyncio.sleep(wait)
+
+    def penalize(self, chat_id: str, seconds: float):
+        """Honour a RetryAfter from Telegram for one chat."""
+        self.chat_next[chat_id] = max(self.chat_next.get(chat_id, 0.0), time.monotonic() + seconds)
+
+_telegram_limiter: Optional[TelegramRateLimiter] = None
+
+def get_telegram_limiter() -> TelegramRateLimiter:
+    # Created lazily so the asyncio.Lock belongs to the Telegram worker's loop
+    global _telegram_limiter
+    if _telegram_limiter is None:
+        _telegram_limiter = TelegramRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL)
+    return _telegram_limiter
+
+def format_incident_message(incident: dict) -> str:
+    """Build the Markdown alert text for an incident."""
     timestamp = incident.get('timestamp', 'Unknown')
-    location = incident.get('location', 'Unknown')
-    camera_name = incident.get('camera_name', 'Unknown')
-    weapon_type = incident.get('label', 'weapon')
+    # Names come from cameras.json; a stray "_" or "*" would make Telegram reject the message
+    location = escape_markdown(str(incident.get('location', 'Unknown')), version=1)
+    camera_name = escape_markdown(str(incident.get('camera_name', 'Unknown')), version=1)
+    weapon_type = escape_markdown(str(incident.get('label', 'weapon')), version=1)
     confidence = incident.get('confidence', 0)
     
-    message = f"""🚨 *WEAPON DETECTION ALERT* 🚨
+    return f"""🚨 *WEAPON DETECTION ALERT* 🚨
 
 📅 *Time:* {timestamp.replace('_', ' ').replace('-', ':')}
 📍 *Location:* {location}
@@ -291,155 +979,1338 @@ async def send_incident_alert(bot: Bot, incident: dict):
 
 ⚠️ *Immediate attention required!*"""
 
-    # Get image path
-    image_path = None
-    if 'image' in incident:
-        image_filename = incident['image'].split('/')[-1]
-        image_path = os.path.join('incidents', image_filename)
-    
-    # Send to all subscribed chats
-    failed_chats = []
-    for chat_id in subscribed_chats.copy():
+async def send_to_chat(bot: Bot, chat_id: str, message: str, photo: dict) -> bool:
+    """Send one alert to one chat with rate limiting and retries.
+
+    `photo` is shared by all chats of one alert: the first successful upload
+    stores Telegram's file_id in it so every other chat reuses it. Returns
+    False only for permanent failures (bot blocked, chat gone).
+    """
+    limiter = get_telegram_limiter()
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        await limiter.acquire(chat_id)
+        started = time.perf_counter()
         try:
-            if image_path and os.path.exists(image_path):
-                with open(image_path, 'rb') as photo:
+            if photo["data"] is None:
+                await bot.send_message(chat_id=int(chat_id), text=message, parse_mode=ParseMode.MARKDOWN)
+            else:
+                uploaded = False
+                if photo["file_id"] is None:
+                    async with photo["upload_lock"]:
+                        # Only one chat uploads the bytes; the rest wait and reuse the file_id
+                        if photo["file_id"] is None:
+                            sent = await bot.send_photo(
+                                chat_id=int(chat_id),
+                                photo=photo["data"],
+                                caption=message,
+                                parse_mode=ParseMode.MARKDOWN
+                            )
+                            photo["file_id"] = sent.photo[-1].file_id
+                            uploaded = True
+                if not uploaded:
                     await bot.send_photo(
                         chat_id=int(chat_id),
-                        photo=photo,
+                        photo=photo["file_id"],
                         caption=message,
                         parse_mode=ParseMode.MARKDOWN
                     )
-            else:
-                await bot.send_message(
-                    chat_id=int(chat_id),
-                    text=message,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+            stage_seconds.observe(time.perf_counter() - started, "telegram_send")
             logger.info(f"Alert sent to chat {chat_id}")
+            return True
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"Rate limited sending to chat {chat_id}, retrying in {retry_after}s")
+            limiter.penalize(chat_id, float(retry_after))
+        except ChatMigrated as e:
+            # The group became a supergroup; keep the subscription and its filters under the new id
+            new_chat_id = str(e.new_chat_id)
+            logger.warning(f"Chat {chat_id} migrated to {new_chat_id}")
+            await asyncio.to_thread(migrate_chat, chat_id, new_chat_id)
+            chat_id = new_chat_id
+        except Forbidden as e:
+            logger.error(f"Permanent failure sending alert to chat {chat_id}: {e}")
+            return False
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                logger.error(f"Permanent failure sending alert to chat {chat_id}: {e}")
+                return False
+            # Anything else (a bad message, a bad photo) is our fault, not the chat's: keep the subscription
+            logger.error(f"Telegram rejected the alert to chat {chat_id}: {e}")
+            return True
         except Exception as e:
-            logger.error(f"Failed to send alert to chat {chat_id}: {e}")
-            failed_chats.append(chat_id)
+            # NetworkError/TimedOut and anything unexpected are treated as transient
+            delay = TELEGRAM_RETRY_BASE_DELAY * (2 ** attempt)
+            logger.warning(f"Failed to send alert to chat {chat_id} (attempt {attempt + 1}): {e}")
+            if attempt < TELEGRAM_MAX_RETRIES:
+                await asyncio.sleep(delay)
+    # Transient failures never unsubscribe a chat
+    logger.error(f"Giving up on alert to chat {chat_id} after {TELEGRAM_MAX_RETRIES + 1} attempts")
+    return True
+
+def format_digest_message(incidents: List[dict], seconds: int) -> str:
+    """Build the Markdown text of one digest message for a burst of incidents."""
+    lines = []
+    for incident in incidents[:TELEGRAM_DIGEST_MAX_LINES]:
+        clock = incident.get('timestamp', 'Unknown')[11:].replace('-', ':')
+        label = escape_markdown(str(incident.get('label', 'weapon')).upper(), version=1)
+        camera_name = escape_markdown(str(incident.get('camera_name', 'Unknown')), version=1)
+        lines.append(f"• {clock} {label} on {camera_name} ({incident.get('confidence', 0):.0%})")
+    if len(incidents) > TELEGRAM_DIGEST_MAX_LINES:
+        lines.append(f"…and {len(incidents) - TELEGRAM_DIGEST_MAX_LINES} more")
+    listing = "\n".join(lines)
+    return f"""🚨 *WEAPON DETECTION DIGEST* 🚨
+
+{len(incidents)} more detection{'s' if len(incidents) != 1 else ''} in the last {seconds}s:
+{listing}
+
+⚠️ *Immediate attention required!*"""
+
+def load_alert_photo(incident: dict) -> dict:
+    """Photo for send_to_chat: the incident's preview, else its original, else none."""
+    # Read the image once; after the first upload Telegram's file_id is reused.
+    # The preview is a fraction of the original's size; older incidents only have the original.
+    photo = {"data": None, "file_id": None, "upload_lock": asyncio.Lock()}
+    for field in ("preview", "image"):
+        if not incident.get(field):
+            continue
+        image_path = snapshot_path(incident[field])
+        if os.path.exists(image_path):
+            with open(image_path, 'rb') as f:
+                photo["data"] = f.read()
+            break
+    return photo
+
+async def drop_failed_chat(chat_id: str):
+    logger.warning(f"Removing failed chat ID: {chat_id}")
+    await asyncio.to_thread(unsubscribe_chat, chat_id)
+    window = digest_windows.pop(chat_id, None)
+    if window is not None and window["task"] is not asyncio.current_task():
+        window["task"].cancel()
+
+async def run_digest_window(bot: Bot, chat_id: str, seconds: int):
+    """Collect a chat's alerts for `seconds` after one was sent, then send them as one message.
+
+    Windows repeat while alerts keep arriving, so a long burst costs the chat
+    one message per window.
+    """
+    try:
+        while True:
+            await asyncio.sleep(seconds)
+            window = digest_windows[chat_id]
+            incidents, window["incidents"] = window["incidents"], []
+            if not incidents:
+                del digest_windows[chat_id]
+                return
+            best = max(incidents, key=lambda i: i.get("confidence", 0))
+            photo = load_alert_photo(best)
+            if not await send_to_chat(bot, chat_id, format_digest_message(incidents, seconds), photo):
+                await drop_failed_chat(chat_id)
+                return
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error(f"Digest for chat {chat_id} failed: {e}")
+        digest_windows.pop(chat_id, None)
+
+async def send_incident_alert(bot: Bot, incident: dict):
+    """Send an incident alert to every chat whose filters match, concurrently."""
+    # Check if notifications are enabled
+    load_notification_settings()
+    with notification_lock:
+        if not notification_enabled:
+            logger.info("Notifications disabled, skipping Telegram alert")
+            return
+    
+    chats = await asyncio.to_thread(matching_chats, incident)
+    if not chats:
+        logger.info("No subscribers for incident alerts")
+        return
+
+    # Chats in digest mode get the first alert of a burst at once and the rest bundled
+    chat_list = []
+    for chat_id, digest_seconds in chats:
+        if chat_id in digest_windows:
+            digest_windows[chat_id]["incidents"].append(incident)
+            continue
+        chat_list.append(chat_id)
+        if digest_seconds:
+            # The task first runs at our next await, by which time its window exists
+            task = asyncio.create_task(run_digest_window(bot, chat_id, digest_seconds))
+            digest_windows[chat_id] = {"incidents": [], "task": task}
+    if not chat_list:
+        return
     
-    # Remove failed chat IDs
-    for chat_id in failed_chats:
-        logger.warning(f"Removing failed chat ID: {chat_id}")
-        subscribed_chats.discard(chat_id)
+    message = format_incident_message(incident)
+    photo = load_alert_photo(incident)
     
-    if failed_chats:
-        save_subscriptions()
+    semaphore = asyncio.Semaphore(TELEGRAM_MAX_CONCURRENCY)
 
-# Initialize Telegram
-load_subscriptions()
+    async def send(chat_id: str) -> bool:
+        async with semaphore:
+            return await send_to_chat(bot, chat_id, message, photo)
 
-# Start Telegram worker thread
-telegram_thread = threading.Thread(target=telegram_worker, daemon=True)
-telegram_thread.start()
-logger.info("Telegram worker thread started")
+    results = await asyncio.gather(*(send(chat_id) for chat_id in chat_list))
+    
+    # Remove chats that failed permanently
+    for chat_id, ok in zip(chat_list, results):
+        if not ok:
+            await drop_failed_chat(chat_id)
 
-# --- CAMERA THREAD ---
-def camera_worker():
-    global latest_frame
-    cap = cv2.VideoCapture(CAMERA_ID)
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+# --- INCIDENT HUB ---
+class IncidentHub:
+    """Asyncio broadcast hub that delivers every incident to every WebSocket subscriber.
+
+    Each subscriber has its own bounded buffer; when a slow client's buffer is
+    full the oldest pending incident is dropped (clients can spot the gap from
+    `event_id`). Recent incidents are kept for resuming with a last event id.
+    Events arrive already numbered by the pipeline process, so a client can
+    resume against any API worker.
+    """
+
+    def __init__(self, client_buffer: int, replay_size: int):
+        self.client_buffer = client_buffer
+        self.replay = deque(maxlen=replay_size)
+        self.last_id = 0
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.dropped = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def publish(self, incident: dict):
+        """Thread-safe: schedule delivery on the API event loop."""
+        if self.loop is None:
+            # No API loop yet, so nobody is subscribed; keep it for replay only
+            self._publish(incident)
+        else:
+            self.loop.call_soon_threadsafe(self._publish, incident)
+
+    def _publish(self, event: dict):
+        self.last_id = event["event_id"]
+        self.replay.append(event)
+        for q in self.subscribers:
+            if q.full():
+                q.get_nowait()
+                self.dropped += 1
+            q.put_nowait(event)
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> asyncio.Queue:
+        """Register a subscriber, pre-filled with anything missed after last_event_id."""
+        q = asyncio.Queue(maxsize=self.client_buffer)
+        if last_event_id is not None:
+            missed = [e for e in self.replay if e["event_id"] > last_event_id]
+            for event in missed[-self.client_buffer:]:
+                q.put_nowait(event)
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self.subscribers.discard(q)
+
+incident_hub = IncidentHub(WS_CLIENT_BUFFER, WS_REPLAY_SIZE)
+
+# --- INCIDENT PERSISTENCE ---
+def enqueue_incident(incident: dict, frame) -> bool:
+    """Hand an incident and its frame to the persistence worker.
+
+    Backpressure policy: if the queue is full, wait up to PERSIST_PUT_TIMEOUT
+    and then drop the incident (logged and counted) rather than stall detection.
+    """
+    try:
+        persist_queue.put((incident, frame), timeout=PERSIST_PUT_TIMEOUT)
+        return True
+    except queue.Full:
+        persist_stats["dropped"] += 1
+        logger.error(f"Persistence queue full, dropping incident {incident['id']}")
+        return False
+
+def snapshot_path(url: str) -> str:
+    """File behind an /incidents/... snapshot URL."""
+    return os.path.join(INCIDENTS_DIR, url.split('/')[-1])
+
+def downscale(frame, max_width: int):
+    """`frame` resized to at most `max_width` pixels wide, keeping the aspect ratio."""
+    h, w = frame.shape[:2]
+    if w <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, max(1, round(h * max_width / w))), interpolation=cv2.INTER_AREA)
+
+def write_snapshots(incident: dict, frame):
+    """Write the original snapshot and every rendition; raises if any write fails."""
+    images = [(incident["image"], frame, SNAPSHOT_QUALITY)]
+    for field, (max_width, quality) in SNAPSHOT_RENDITIONS.items():
+        images.append((incident[field], downscale(frame, max_width), quality))
+    for url, image, quality in images:
+        path = snapshot_path(url)
+        if not cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+            raise IOError(f"cv2.imwrite returned False for {path}")
+
+def enqueue_clip_link(incident_id: str, path: Optional[str]):
+    """Clip encoder callback: link a finished clip to its incident through the persistence queue."""
+    if path is None:
+        return
+    try:
+        persist_queue.put(({"id": incident_id, "clip": f"/incidents/{os.path.basename(path)}"}, None),
+                          timeout=PERSIST_PUT_TIMEOUT)
+    except queue.Full:
+        logger.error(f"Persistence queue full, discarding clip of incident {incident_id}")
+        os.remove(path)
+
+def write_clip_links(clips: list):
+    """Set Incident.clip for finished clips in one commit; clips of incidents that never got a row are deleted."""
+    if not clips:
+        return
+    orphans = []
+    db = SessionLocal()
+    try:
+        for clip in clips:
+            if not db.query(Incident).filter(Incident.id == clip["id"]).update({Incident.clip: clip["clip"]}):
+                orphans.append(clip)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to link {len(clips)} clips: {e}")
+        orphans = clips
+    finally:
+        db.close()
+    for clip in orphans:
+        logger.warning(f"Deleting clip of unsaved incident {clip['id']}")
+        os.remove(snapshot_path(clip["clip"]))
+
+def write_incident_batch(batch: list):
+    """Write snapshots, insert all rows in one commit, then publish the incidents."""
+    written = []
+    for incident, frame in batch:
+        try:
+            with stage_seconds.time("imwrite"):
+                write_snapshots(incident, frame)
+            written.append(incident)
+        except Exception as e:
+            persist_stats["failed"] += 1
+            logger.error(f"Failed to write snapshot for incident {incident['id']}: {e}")
+    if not written:
+        return
+
+    for attempt in range(PERSIST_COMMIT_RETRIES + 1):
+        db = SessionLocal()
+        try:
+            with stage_seconds.time("db_commit"):
+                db.add_all([Incident(**incident) for incident in written])
+                add_to_rollups(db, written)
+                db.commit()
+            persist_stats["written"] += len(written)
+            break
+        except Exception as e:
+            db.rollback()
+            if attempt < PERSIST_COMMIT_RETRIES:
+                # Usually a long writer (retention, a rollup rebuild) holding the lock past the busy timeout
+                delay = PERSIST_RETRY_BASE_DELAY * (2 ** attempt)
+                logger.warning(f"Failed to save {len(written)} incidents (attempt {attempt + 1}), retrying in {delay}s: {e}")
+                time.sleep(delay)
+            else:
+                persist_stats["failed"] += len(written)
+                # The snapshots are on disk; a weapon alert must still go out
+                logger.error(f"Failed to save {len(written)} incidents, alerting without database rows: {e}")
+        finally:
+            db.close()
+
+    # Only publish once the snapshot and row are on disk (or the row could not be written at all)
+    for incident in written:
+        # Numbered here, once, so every API worker's hub gives an incident the same event_id
+        event = {**incident, "event_id": next(event_ids)}
+        incident_hub.publish(event)
+        if incident_publisher is not None:
+            incident_publisher.publish(event)
+        # Queue Telegram alert (thread-safe)
+        telegram_alert_queue.put(incident)
+
+def persistence_worker():
+    """Drain the persistence queue, batching whatever has piled up into one commit."""
+    running = True
+    while running:
+        item = persist_queue.get()
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < PERSIST_BATCH_SIZE:
+            try:
+                item = persist_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+        try:
+            # Clip links come after the inserts, which may include the incidents they point to
+            write_incident_batch([item for item in batch if item[1] is not None])
+            write_clip_links([incident for incident, frame in batch if frame is None])
+        except Exception as e:
+            logger.error(f"Error in persistence worker: {e}")
+    logger.info("Persistence worker stopped")
+
+persist_thread: Optional[threading.Thread] = None
+
+def flush_incidents():
+    """Let the persistence worker finish everything queued before exit."""
+    try:
+        persist_queue.put(None, timeout=PERSIST_SHUTDOWN_TIMEOUT)
+    except queue.Full:
+        logger.error("Persistence queue still full at shutdown, pending incidents may be lost")
+        return
+    persist_thread.join(timeout=PERSIST_SHUTDOWN_TIMEOUT)
+    if persist_thread.is_alive():
+        logger.error("Persistence worker did not flush before shutdown timeout")
+
+# --- RETENTION ---
+def incident_files(row: dict) -> list:
+    """Live files of an incident: snapshot, renditions and clip."""
+    urls = [row["image"], *(row[field] for field in SNAPSHOT_RENDITIONS), row["clip"]]
+    return [snapshot_path(url) for url in urls if url]
+
+def archive_snapshot(row: dict) -> Optional[str]:
+    """Write the image kept for an archived incident (ARCHIVE_IMAGE_POLICY); returns its URL or None."""
+    if ARCHIVE_IMAGE_POLICY != "compress":
+        return None
+    frame = None
+    for url in (row["preview"], row["image"]):
+        if url and os.path.exists(snapshot_path(url)):
+            frame = cv2.imread(snapshot_path(url))
+            if frame is not None:
+                break
+    if frame is None:
+        return None
+    month = row["timestamp"][:7]
+    directory = os.path.join(ARCHIVE_DIR, "images", month)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{row['id']}.jpg")
+    if not cv2.imwrite(path, downscale(frame, ARCHIVE_IMAGE_WIDTH), [cv2.IMWRITE_JPEG_QUALITY, ARCHIVE_IMAGE_QUALITY]):
+        raise IOError(f"cv2.imwrite returned False for {path}")
+    return f"/archive/images/{month}/{row['id']}.jpg"
+
+def retention_batch(cutoff: Optional[str], excess_rows: int, excess_bytes: int) -> tuple:
+    """Oldest live incidents past the age or size limits (at most RETENTION_BATCH_SIZE), and the remaining excess."""
+    db = SessionLocal()
+    try:
+        rows = db.query(*INCIDENT_COLUMNS).order_by(Incident.timestamp, Incident.id).limit(RETENTION_BATCH_SIZE).all()
+    finally:
+        db.close()
+    batch = []
+    for row in rows:
+        row = dict(row._mapping)
+        expired = cutoff is not None and row["timestamp"] < cutoff
+        if not (expired or excess_rows > 0 or excess_bytes > 0):
+            break
+        batch.append(row)
+        excess_rows -= 1
+        excess_bytes -= sum(os.path.getsize(path) for path in incident_files(row) if os.path.exists(path))
+    return batch, excess_rows, excess_bytes
+
+def archive_incidents(rows: list) -> int:
+    """Copy incidents to the archive, delete them from the live database, then delete their files.
+
+    Archive inserts are idempotent, so a run interrupted before the delete is
+    redone safely. Rollups are left alone: analytics keep counting archived
+    incidents. Returns the bytes freed in INCIDENTS_DIR.
+    """
+    records = []
+    for row in rows:
+        try:
+            image = archive_snapshot(row)
+        except Exception as e:
+            logger.warning(f"Could not keep an image for archived incident {row['id']}: {e}")
+            image = None
+        records.append({**row, "image": image, **{field: None for field in SNAPSHOT_RENDITIONS}, "clip": None})
+    archive_store.insert(records)
+
+    db = SessionLocal()
+    try:
+        db.query(Incident).filter(Incident.id.in_([row["id"] for row in rows])).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    freed = 0
+    for row in rows:
+        for path in incident_files(row):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+    return freed
+
+def incident_files_by_id(max_mtime: Optional[float] = None) -> Dict[str, list]:
+    """Files in INCIDENTS_DIR grouped by the incident id in their name, optionally only those older than `max_mtime`."""
+    by_id: Dict[str, list] = {}
+    with os.scandir(INCIDENTS_DIR) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and (max_mtime is None or entry.stat().st_mtime < max_mtime):
+                # "{id}.jpg", "{id}_{rendition}.jpg" or "{id}.mp4"
+                by_id.setdefault(entry.name.split(".")[0].split("_")[0], []).append(entry)
+    return by_id
+
+def live_incident_ids(ids: list) -> set:
+    """The ids among `ids` that have a row in the live database."""
+    live = set()
+    for i in range(0, len(ids), RETENTION_BATCH_SIZE):
+        db = SessionLocal()
+        try:
+            live.update(row.id for row in db.query(Incident.id).filter(Incident.id.in_(ids[i:i + RETENTION_BATCH_SIZE])))
+        finally:
+            db.close()
+    return live
+
+def live_incident_bytes() -> int:
+    """Bytes in INCIDENTS_DIR owned by live incidents, the only bytes archiving can free."""
+    by_id = incident_files_by_id()
+    return sum(entry.stat().st_size for incident_id in live_incident_ids(list(by_id)) for entry in by_id[incident_id])
+
+def sweep_orphan_files() -> int:
+    """Move files in INCIDENTS_DIR older than RETENTION_ORPHAN_GRACE that belong to no live incident to ARCHIVE_DIR/orphans.
+
+    They are left behind when an insert fails after the snapshot was written,
+    or by a clip whose link was lost, and may be the only copy of a detection,
+    so they are set aside rather than deleted. Returns the bytes moved.
+    """
+    by_id = incident_files_by_id(time.time() - RETENTION_ORPHAN_GRACE)
+    live = live_incident_ids(list(by_id))
+    directory = os.path.join(ARCHIVE_DIR, "orphans")
+    moved = 0
+    for incident_id, files in by_id.items():
+        if incident_id in live:
+            continue
+        os.makedirs(directory, exist_ok=True)
+        for entry in files:
+            try:
+                size = entry.stat().st_size
+                shutil.move(entry.path, os.path.join(directory, entry.name))
+                moved += size
+            except FileNotFoundError:
+                pass
+    if moved:
+        logger.info(f"Moved {moved} bytes of orphan incident files to {directory}")
+    return moved
+
+def run_retention() -> dict:
+    """One retention pass: archive incidents past the limits in throttled batches, then shrink the database."""
+    started = time.monotonic()
+    cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT) if RETENTION_DAYS else None
+    excess_rows = excess_bytes = 0
+    if RETENTION_MAX_INCIDENTS:
+        db = SessionLocal()
+        try:
+            excess_rows = db.query(func.count(Incident.id)).scalar() - RETENTION_MAX_INCIDENTS
+        finally:
+            db.close()
+    if RETENTION_MAX_BYTES:
+        # Files no row owns cannot be freed by archiving; counting them would archive the whole table
+        excess_bytes = live_incident_bytes() - RETENTION_MAX_BYTES
+
+    freed = sweep_orphan_files() if RETENTION_ORPHAN_GRACE else 0
+    archived = 0
+    while not retention_stop.is_set():
+        batch, excess_rows, excess_bytes = retention_batch(cutoff, excess_rows, excess_bytes)
+        if not batch:
+            break
+        with rollup_rebuild_lock:
+            # A rebuild counts the archives and the live table in turn; nothing may move between them
+            batch_freed = archive_incidents(batch)
+        if not batch_freed and excess_bytes > 0:
+            # The files were already gone; the size limit cannot be met by archiving more
+            excess_bytes = 0
+        freed += batch_freed
+        archived += len(batch)
+        # Leave the disk and the database write lock to the live pipeline for a moment
+        retention_stop.wait(RETENTION_BATCH_PAUSE)
+    pages = incremental_vacuum(engine, RETENTION_VACUUM_PAGES, RETENTION_BATCH_PAUSE, retention_stop)
+    result = {
+        "archived": archived,
+        "freed_bytes": freed,
+        "vacuumed_pages": pages,
+        "seconds": round(time.monotonic() - started, 1),
+        "finished_at": datetime.now().strftime(TIMESTAMP_FORMAT),
+    }
+    logger.info(f"Retention archived {archived} incidents, freed {freed} bytes and {pages} database pages")
+    return result
+
+def retention_worker():
+    """Run retention every RETENTION_INTERVAL seconds, or as soon as it is triggered through the API."""
+    try:
+        # Linux applies priorities per thread, so this only lowers the retention thread
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), RETENTION_NICE)
+    except (AttributeError, OSError):
+        pass
+    retention_trigger.wait(RETENTION_START_DELAY)
+    while not retention_stop.is_set():
+        retention_trigger.clear()
+        retention_state["running"] = True
+        try:
+            retention_state["last_run"] = run_retention()
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}")
+        finally:
+            retention_state["running"] = False
+        retention_trigger.wait(RETENTION_INTERVAL)
+    logger.info("Retention worker stopped")
+
+# --- CAMERA THREADS ---
+def load_camera_config():
+    """Merge camera definitions from CAMERAS_FILE into CAMERA_LOCATION_MAP."""
+    try:
+        if os.path.exists(CAMERAS_FILE):
+            with open(CAMERAS_FILE, 'r') as f:
+                data = json.load(f)
+            for label, info in data.items():
+                CAMERA_LOCATION_MAP[label] = {**CAMERA_LOCATION_MAP.get(label, {}), **info}
+            logger.info(f"Loaded {len(data)} camera definitions from {CAMERAS_FILE}")
+    except Exception as e:
+        logger.error(f"Failed to load camera config: {e}")
+
+def get_camera_info(camera: str) -> dict:
+    """Get display name and location for a camera label."""
+    cam_info = CAMERA_LOCATION_MAP.get(camera, {})
+    return {"name": cam_info.get("name", camera), "location": cam_info.get("location", "Unknown")}
+
+class RateMeter:
+    """Exponentially smoothed events-per-second counter."""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.rate = 0.0
+        self.count = 0
+        self.last = None
+
+    def tick(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if self.last is not None and now > self.last:
+            self.rate += self.alpha * (1.0 / (now - self.last) - self.rate)
+        self.last = now
+        self.count += 1
+
+    def current(self) -> float:
+        """Rate, decayed to 0 once no event has been seen for a few intervals."""
+        if self.last is None or self.rate <= 0:
+            return 0.0
+        idle = time.monotonic() - self.last
+        return self.rate if idle < 5.0 / self.rate + 1.0 else 0.0
+
+def encode_jpeg(frame) -> Optional[bytes]:
+    with stage_seconds.time("mjpeg_encode"):
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, MJPEG_QUALITY])
+    return jpeg.tobytes() if ok else None
+
+class MJPEGBroadcaster:
+    """Encodes each annotated frame of a camera once and fans the bytes out to every /video viewer.
+
+    `stream` is a CameraStream or SharedCamera; its `encode_jpeg()` returns the
+    newest annotated frame as JPEG bytes.
+
+    Each encoded chunk gets a sequence number; viewers always jump to the latest
+    one, so a slow client skips frames instead of queueing them.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.chunk: Optional[bytes] = None
+        self.new_frame = threading.Event()
+        self.waiters: Set[tuple] = set()  # (event loop, asyncio.Event) per viewer
+        self.thread = threading.Thread(target=self._encode_loop, daemon=True, name=f"mjpeg-{stream.label}")
+
+    def start(self):
+        self.thread.start()
+
+    def publish(self):
+        """Signal that the camera has a new annotated frame."""
+        self.new_frame.set()
+
+    def viewer_count(self) -> int:
+        with self.lock:
+            return len(self.waiters)
+
+    def _encode_loop(self):
+        while True:
+            self.new_frame.wait()
+            self.new_frame.clear()
+            if not self.viewer_count():
+                continue  # Nobody is watching, don't spend CPU on encoding
+            try:
+                jpeg = self.stream.encode_jpeg()
+                if jpeg is None:
+                    continue
+                chunk = mjpeg_chunk(jpeg)
+                with self.lock:
+                    self.seq += 1
+                    self.chunk = chunk
+                    waiters = list(self.waiters)
+                for loop, event in waiters:
+                    loop.call_soon_threadsafe(event.set)
+            except Exception as e:
+                # One bad frame must not stall /video for every viewer
+                logger.error(f"MJPEG encoding for {self.stream.label} failed: {e}")
+
+    async def subscribe(self):
+        """Async generator of multipart chunks for one viewer."""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = (loop, event)
+        with self.lock:
+            self.waiters.add(waiter)
+        # Make sure a new viewer gets the current frame even if the camera is idle
+        self.publish()
+        last_seq = 0
+        try:
+            while True:
+                with self.lock:
+                    seq, chunk = self.seq, self.chunk
+                if chunk is None:
+                    yield placeholder_chunk()
+                    await asyncio.sleep(0.5)
+                    continue
+                if seq != last_seq:
+                    last_seq = seq
+                    yield chunk
+                event.clear()
+                with self.lock:
+                    if self.seq != last_seq:
+                        continue
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.lock:
+                self.waiters.discard(waiter)
+
+class CameraStream:
+    """Capture thread for one camera source.
+
+    The capture loop only keeps the newest frame in a single slot (latest frame
+    wins, overwritten frames are counted as dropped); the shared inference
+    scheduler takes it from here and hands back the annotated frame for /video.
+    """
+
+    def __init__(self, label: str, source, rois: Optional[list] = None,
+                 tile_size: Optional[int] = None, tile_overlap: float = 0.2):
+        self.label = label
+        self.source = source
+        self.rois = rois  # polygons [[x, y], ...] in frame pixels; None = whole frame
+        self.tile_size = tile_size  # tile edge in pixels; None = no tiling
+        self.tile_overlap = tile_overlap
+        self._regions: Dict[tuple, list] = {}  # frame shape -> planned crop regions
+        self.lock = threading.Lock()
+        self.frame = None  # newest raw frame, not yet taken by the scheduler
+        self.frame_time = 0.0  # monotonic capture time of self.frame
+        self.annotated_frame = None  # last frame with detections drawn
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.dropped_frames = 0
+        self.frame_age = 0.0  # seconds from capture to annotated frame, smoothed
+        self.last_frame_age = 0.0
+        self.gate = MotionGate(
+            MOTION_WIDTH, MOTION_PIXEL_THRESHOLD, MOTION_AREA_THRESHOLD,
+            MOTION_HOLD_SECONDS, WEAPON_HOLD_SECONDS, IDLE_INFERENCE_INTERVAL
+        ) if MOTION_GATING else None
+        self.tracker = IoUTracker(
+            TRACK_IOU_THRESHOLD, TRACK_MAX_AGE, TRACK_CONFIRM_HITS, TRACK_CONFIRM_WINDOW, CONFIDENCE_THRESHOLD
+        ) if TRACKING else None
+        self.broadcaster = MJPEGBroadcaster(self)
+        # A separate detector process shares its frames with the API workers (ring created on the first frame)
+        self.shares_frames = APP_ROLE == "detector"
+        self.ring: Optional[FrameRingWriter] = None
+        # Slightly longer than a clip, so a clip's first frames survive until its window closes
+        self.clip_buffer = FrameBuffer(
+            CLIP_PRE_SECONDS + CLIP_POST_SECONDS + 1.0, CLIP_BUFFER_MAX_BYTES, CLIP_FPS, CLIP_WIDTH, CLIP_JPEG_QUALITY
+        ) if CLIP_RECORDING else None
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True, name=f"capture-{label}")
+
+    def start(self):
+        self.thread.start()
+        self.broadcaster.start()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        # Keep OpenCV's internal queue as short as possible so reads return fresh frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Files are read faster than real time, so pace them at their native FPS
+        is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        fps = cap.get(cv2.CAP_PROP_FPS) if is_file else 0
+        return cap, (1.0 / fps if fps and fps > 0 else 0.0)
+
+    def _capture_loop(self):
+        cap, frame_interval = self._open()
+        backoff = 0.05
+        while not pipeline_stop.is_set():
+            started = time.monotonic()
+            ret, frame = cap.read()
+            if not ret:
+                # Back off on a dead source and reopen it once the backoff is maxed out
+                time.sleep(backoff)
+                backoff = min(backoff * 2, CAPTURE_MAX_BACKOFF)
+                if backoff >= CAPTURE_MAX_BACKOFF:
+                    logger.warning(f"Camera {self.label} not returning frames, reopening source")
+                    cap.release()
+                    cap, frame_interval = self._open()
+                continue
+            backoff = 0.05
+            now = time.monotonic()
+            stage_seconds.observe(now - started, "capture")
+            if self.gate:
+                # Runs on every captured frame, so motion between dropped frames is not missed
+                self.gate.update(frame, now)
+            if self.clip_buffer is not None:
+                # Raw frames at CLIP_FPS only; a small JPEG every 1/CLIP_FPS seconds
+                self.clip_buffer.add(frame, now)
+            with self.lock:
+                if self.frame is not None:
+                    self.dropped_frames += 1
+                self.frame = frame
+                self.frame_time = now
+                self.capture_rate.tick(now)
+            frame_ready.set()
+            if frame_interval:
+                remaining = frame_interval - (time.monotonic() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+        cap.release()
+
+    def take_frame(self):
+        """Return (frame, capture_time) for the newest raw frame, or None, and clear the slot."""
+        with self.lock:
+            if self.frame is None:
+                return None
+            item = (self.frame, self.frame_time)
+            self.frame = None
+        return item
+
+    def set_annotated_frame(self, frame, captured_at: float, inferred: bool = True):
+        """Publish a frame for /video; `inferred` is False for frames the motion gate skipped."""
+        now = time.monotonic()
+        with self.lock:
+            self.annotated_frame = frame
+            if inferred:
+                self.inference_rate.tick(now)
+            self.last_frame_age = now - captured_at
+            self.frame_age += 0.1 * (self.last_frame_age - self.frame_age)
+        stage_seconds.observe(now - captured_at, "capture_to_display")
+        if self.shares_frames:
+            self.share_frame(frame, captured_at)
+        self.broadcaster.publish()
+
+    def share_frame(self, frame, captured_at: float):
+        """Write a frame to the shared ring, sized to this camera's frames instead of the largest possible one."""
+        if self.ring is None or frame.nbytes > self.ring.slot_bytes:
+            if self.ring is not None:
+                # Resolution went up; readers find the new segment when they reattach after FRAME_RING_STALE_SECONDS
+                logger.info(f"Camera {self.label} frames grew to {frame.shape[1]}x{frame.shape[0]}, resizing its frame ring")
+                self.ring.unlink()
+            self.ring = FrameRingWriter(ring_name(FRAME_RING_PREFIX, self.label), FRAME_RING_SLOTS, frame.nbytes)
+        self.ring.write(frame, captured_at)
+
+    def regions(self, shape) -> list:
+        """Crop regions for this camera's frames, planned once per frame size."""
+        key = tuple(shape[:2])
+        if key not in self._regions:
+            self._regions[key] = plan_regions(key, self.rois, self.tile_size, self.tile_overlap)
+            logger.info(f"Camera {self.label}: {len(self._regions[key])} inference regions for {key[1]}x{key[0]} frames")
+        return self._regions[key]
+
+    def get_annotated_frame(self):
+        # Annotated frames are never drawn on after being published, so no copy is needed
+        with self.lock:
+            return self.annotated_frame
+
+    def encode_jpeg(self) -> Optional[bytes]:
+        frame = self.get_annotated_frame()
+        return encode_jpeg(frame) if frame is not None else None
+
+    def stats(self) -> dict:
+        clip_buffer = self.clip_buffer.stats() if self.clip_buffer else {"frames": 0, "bytes": 0}
+        with self.lock:
+            return {
+                "camera": self.label,
+                "capture_fps": round(self.capture_rate.current(), 2),
+                "inference_fps": round(self.inference_rate.current(), 2),
+                "frames_captured": self.capture_rate.count,
+                "frames_processed": self.inference_rate.count,
+                "frames_dropped": self.dropped_frames,
+                "frame_age_ms": round(self.frame_age * 1000, 1),
+                "last_frame_age_ms": round(self.last_frame_age * 1000, 1),
+                "viewers": self.broadcaster.viewer_count(),
+                "inference_skipped": self.gate.skipped if self.gate else 0,
+                "skip_ratio": round(self.gate.skip_ratio(), 3) if self.gate else 0.0,
+                "motion_score": round(self.gate.motion_score, 4) if self.gate else None,
+                "active_tracks": len(self.tracker) if self.tracker else 0,
+                "clip_buffer_frames": clip_buffer["frames"],
+                "clip_buffer_bytes": clip_buffer["bytes"],
+            }
+
+class SharedCamera:
+    """API worker view of a camera whose frames the detector process publishes to a frame ring."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.reader = FrameRingReader(ring_name(FRAME_RING_PREFIX, label))
+        self.lock = threading.Lock()  # reattach must never close the mapping under an encode
+        self.broadcaster = MJPEGBroadcaster(self)
+        self.thread = threading.Thread(target=self._watch_loop, daemon=True, name=f"ring-{label}")
+
+    def start(self):
+        self.thread.start()
+        self.broadcaster.start()
+
+    def _watch_loop(self):
+        """While someone is watching, tell the broadcaster whenever the ring has a newer frame."""
+        last_seq = 0
+        last_change = time.monotonic()
+        while True:
+            if not self.broadcaster.viewer_count():
+                time.sleep(0.1)
+                continue
+            with self.lock:
+                seq = self.reader.latest_seq()
+            now = time.monotonic()
+            if seq != last_seq:
+                last_seq = seq
+                last_change = now
+                self.broadcaster.publish()
+            elif now - last_change > FRAME_RING_STALE_SECONDS:
+                # The detector may have restarted with a fresh segment
+                with self.lock:
+                    self.reader.reattach()
+                last_change = now
+            time.sleep(FRAME_RING_POLL_INTERVAL)
+
+    def encode_jpeg(self) -> Optional[bytes]:
+        """Encode straight from shared memory; discard the result if the writer lapped the slot meanwhile."""
+        with self.lock:
+            item = self.reader.read()
+            if item is None:
+                return None
+            seq, view, _ = item
+            jpeg = encode_jpeg(view)
+            del view
+            return jpeg if self.reader.still_valid(seq) else None
+
+    def viewer_count(self) -> int:
+        return self.broadcaster.viewer_count()
+
+def build_incident(camera: str, label: str, conf: float) -> dict:
+    """Incident record for a new detection on `camera`."""
+    img_id = str(uuid.uuid4())
+    cam_info = get_camera_info(camera)
+    return {
+        "id": img_id,
+        "timestamp": datetime.now().strftime(TIMESTAMP_FORMAT),
+        "camera": camera,
+        "camera_name": cam_info["name"],
+        "location": cam_info["location"],
+        "label": label,
+        "confidence": round(conf, 2),
+        "image": f"/incidents/{img_id}.jpg",
+        **{field: f"/incidents/{img_id}_{field}.jpg" for field in SNAPSHOT_RENDITIONS},
+        "clip": None,  # set once the clip is encoded (see record_clip)
+    }
+
+def result_arrays(result):
+    """(xyxy, conf, cls) numpy arrays of one ultralytics result."""
+    boxes = result.boxes
+    if not len(boxes):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int)
+    return (boxes.xyxy.cpu().numpy().astype(np.float32), boxes.conf.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(int))
+
+def process_detections(stream: "CameraStream", frame, boxes, confs, classes) -> bool:
+    """Draw one camera's boxes (frame coordinates) and raise incidents for weapons.
+
+    With tracking enabled, weapon boxes feed the camera's tracker and an
+    incident is raised once per confirmed track, using the frame where that
+    track's confidence peaked. Otherwise the (camera, label) dedup window applies.
+    Returns True if any weapon-class box was detected, whatever its confidence.
+    """
+    camera = stream.label
+    new_incidents = []
+    weapon_seen = False
+    track_boxes, track_confs, track_cls = [], [], []
+    for xyxy, conf, cls in zip(boxes, confs, classes):
+        cls = int(cls)
+        label = model.names[cls]
+        conf = float(conf)
+        # Draw bounding box and label
+        x1, y1, x2, y2 = map(int, xyxy)
+        color = (0, 255, 0) if label in WEAPON_LABELS else ((0, 255, 255) if label == "neutral" else (255, 0, 0))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        text = f"{label}: {conf:.2f}"
+        cv2.putText(frame, text, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        if label not in WEAPON_LABELS:
             continue
-        # Run detection
-        results = model(frame)
-        for r in results:
-            for box in r.boxes:
-                cls = int(box.cls[0])
-                label = model.names[cls]
-                conf = float(box.conf[0])
-                # Draw bounding box and label
-                if hasattr(box, 'xyxy'):
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                else:
-                    # Fallback if attribute is different
-                    x1, y1, x2, y2 = [int(v) for v in box]
-                color = (0, 255, 0) if label in WEAPON_LABELS else ((0, 255, 255) if label == "neutral" else (255, 0, 0))
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                text = f"{label}: {conf:.2f}"
-                cv2.putText(frame, text, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                if label in WEAPON_LABELS and conf >= CONFIDENCE_THRESHOLD:
-                    # Save incident only if not duplicate
-                    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                    now = datetime.now()
-                    is_duplicate = False
-                    # Check for duplicate in DB
-                    db = SessionLocal()
-                    recent_incidents = db.query(Incident).filter(
-                        Incident.label == label,
-                        Incident.camera == CAMERA_LABEL
-                    ).order_by(Incident.timestamp.desc()).all()
-                    db.close()
-                    for incident in recent_incidents:
-                        last_time = datetime.strptime(incident.timestamp, "%Y-%m-%d_%H-%M-%S")
-                        if (now - last_time).total_seconds() < DUPLICATE_TIME_WINDOW:
-                            # Update timestamp to latest (optional: update in DB if needed)
-                            is_duplicate = True
-                            break
-                    if not is_duplicate:
-                        img_id = str(uuid.uuid4())
-                        img_path = os.path.join(INCIDENTS_DIR, f"{img_id}.jpg")
-                        cv2.imwrite(img_path, frame)
-                        cam_info = CAMERA_LOCATION_MAP.get(CAMERA_LABEL, {"name": CAMERA_LABEL, "location": "Unknown"})
-                        incident = {
-                            "id": img_id,
-                            "timestamp": timestamp,
-                            "camera": CAMERA_LABEL,
-                            "camera_name": cam_info["name"],
-                            "location": cam_info["location"],
-                            "label": label,
-                            "confidence": round(conf, 2),
-                            "image": f"/incidents/{img_id}.jpg"
-                        }
-                        # Save to DB
-                        db = SessionLocal()
-                        db_incident = Incident(**incident)
-                        db.add(db_incident)
-                        db.commit()
-                        db.close()
-                        incident_queue.put(incident)
-                        # Queue Telegram alert (thread-safe)
-                        telegram_alert_queue.put(incident)
-        with frame_lock:
-            latest_frame = frame.copy()
-        time.sleep(0.05)  # ~20 FPS
-
-threading.Thread(target=camera_worker, daemon=True).start()
+        weapon_seen = True
+        if stream.tracker is not None:
+            if conf >= TRACK_MIN_CONFIDENCE:
+                track_boxes.append((x1, y1, x2, y2))
+                track_confs.append(conf)
+                track_cls.append(cls)
+        elif conf >= CONFIDENCE_THRESHOLD:
+            with stage_seconds.time("dedup"):
+                duplicate = not dedup_index.should_alert(camera, label)
+            # Save incident only if not duplicate
+            if not duplicate:
+                new_incidents.append((build_incident(camera, label, conf), frame))
+    if stream.tracker is not None:
+        with stage_seconds.time("tracking"):
+            confirmed = stream.tracker.update(track_boxes, track_confs, track_cls, time.monotonic(), frame)
+        for track in confirmed:
+            new_incidents.append((build_incident(camera, model.names[track["cls"]], track["confidence"]), track["frame"]))
+    # Queue after all boxes are drawn; the frame is not modified after this point
+    for incident, snapshot in new_incidents:
+        if enqueue_incident(incident, snapshot):
+            record_clip(stream, incident["id"])
+    return weapon_seen
+
+def record_clip(stream: "CameraStream", incident_id: str):
+    """Schedule an MP4 of the seconds around an incident; it is linked to the incident once written."""
+    if clip_recorder is None or stream.clip_buffer is None:
+        return
+    now = time.monotonic()
+    clip_recorder.record(
+        stream.clip_buffer, now - CLIP_PRE_SECONDS, now + CLIP_POST_SECONDS,
+        os.path.join(INCIDENTS_DIR, f"{incident_id}.mp4"),
+        lambda path: enqueue_clip_link(incident_id, path),
+    )
+
+def inference_scheduler():
+    """Run one batched model call over the newest frame of every camera.
+
+    Cameras with ROIs or tiling contribute one crop per region; all crops of
+    all cameras go through the same batched call and are merged back per frame.
+    Wakes up as soon as any camera has a new frame instead of sleeping a fixed
+    interval, and only throttles when running faster than MAX_INFERENCE_FPS.
+    """
+    min_interval = 1.0 / MAX_INFERENCE_FPS if MAX_INFERENCE_FPS else 0.0
+    while not pipeline_stop.is_set():
+        frame_ready.wait(timeout=1.0)
+        frame_ready.clear()
+        if pipeline_stop.is_set():
+            break
+        started = time.monotonic()
+        batch = []
+        for stream in camera_streams.values():
+            item = stream.take_frame()
+            if item is None:
+                continue
+            if stream.gate and not stream.gate.should_infer(started):
+                # Static scene: keep the stream live without running the model
+                stream.set_annotated_frame(*item, inferred=False)
+                continue
+            batch.append((stream, *item))
+        if not batch:
+            continue
+
+        crops, owners = [], []
+        parts = []  # per batch entry: one (xyxy, conf, cls) per region, None if inference failed
+        for j, (stream, frame, _) in enumerate(batch):
+            regions = stream.regions(frame.shape)
+            parts.append([None] * len(regions))
+            for k, region in enumerate(regions):
+                crops.append(crop(frame, region))
+                owners.append((j, k))
+        for i in range(0, len(crops), INFERENCE_BATCH_SIZE):
+            try:
+                with stage_seconds.time("inference"):
+                    results = model(crops[i:i + INFERENCE_BATCH_SIZE])
+            except Exception as e:
+                logger.error(f"Inference failed: {e}")
+                continue
+            for (j, k), r in zip(owners[i:i + INFERENCE_BATCH_SIZE], results):
+                parts[j][k] = result_arrays(r)
+
+        for (stream, frame, captured_at), frame_parts in zip(batch, parts):
+            if any(part is None for part in frame_parts):
+                stream.set_annotated_frame(frame, captured_at, inferred=False)
+                continue
+            post_started = time.perf_counter()
+            boxes, confs, classes = merge_detections(
+                frame_parts, stream.regions(frame.shape), stream.rois, TILE_MERGE_IOU
+            )
+            weapon_seen = process_detections(stream, frame, boxes, confs, classes)
+            stage_seconds.observe(time.perf_counter() - post_started, "postprocess")
+            if weapon_seen and stream.gate:
+                stream.gate.note_weapon(time.monotonic())
+            stream.set_annotated_frame(frame, captured_at)
+        remaining = min_interval - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+def start_cameras():
+    """Start a capture thread for every configured camera with a source."""
+    load_camera_config()
+    for cam_label, cam_info in CAMERA_LOCATION_MAP.items():
+        if "source" not in cam_info:
+            logger.warning(f"Camera {cam_label} has no source configured, skipping")
+            continue
+        camera_streams[cam_label] = CameraStream(
+            cam_label, cam_info["source"], cam_info.get("rois"), cam_info.get("tile_size"),
+            cam_info.get("tile_overlap", TILE_OVERLAP)
+        )
+        camera_streams[cam_label].start()
+    logger.info(f"Started {len(camera_streams)} camera capture threads")
+
+def load_model():
+    """Load and warm up the detector, then start inference (runs in a background thread).
+
+    Keeps startup fast: the app answers /healthz while the model loads, and
+    /readyz only reports ready once the first real frame will not pay for
+    lazy initialisation.
+    """
+    global model, inference_thread
+    started = time.monotonic()
+    try:
+        # Load the detector on the configured backend (see detector.py)
+        detector = load_detector(MODEL_WEIGHTS, MODEL_BACKEND, MODEL_PRECISION, MODEL_ARCH, MODEL_CALIBRATION_DATA)
+        for _ in range(MODEL_WARMUP_RUNS):
+            warmup(detector, batch_size=min(INFERENCE_BATCH_SIZE, max(1, len(camera_streams))))
+    except Exception as e:
+        logger.error(f"Failed to load detector: {e}")
+        return
+    model = detector
+    readiness["model"] = True
+    logger.info(f"Detector ready after {time.monotonic() - started:.1f}s")
+    if pipeline_stop.is_set():
+        return
+    inference_thread = threading.Thread(target=inference_scheduler, daemon=True, name="inference")
+    inference_thread.start()
+
+# --- LIFECYCLE ---
+def require_ipc_authkey():
+    """The incident channel unpickles what it receives, so it never runs with a guessable key."""
+    if not INCIDENT_IPC_AUTHKEY:
+        raise RuntimeError("INCIDENT_IPC_AUTHKEY is not set; start the detector and API workers with serve.py")
+
+async def startup():
+    """Build the components this process's APP_ROLE needs."""
+    global persist_thread, incident_publisher, incident_subscriber, clip_recorder, retention_thread
+    os.makedirs(INCIDENTS_DIR, exist_ok=True)
+    await asyncio.to_thread(init_database)
+    readiness["database"] = True
+    incident_hub.bind_loop(asyncio.get_running_loop())
+    load_notification_settings()
+    if not RUNS_PIPELINE:
+        load_camera_config()
+        for label, info in CAMERA_LOCATION_MAP.items():
+            if "source" in info:
+                shared_cameras[label] = SharedCamera(label)
+                shared_cameras[label].start()
+        require_ipc_authkey()
+        incident_subscriber = IncidentSubscriber(INCIDENT_IPC_ADDRESS, INCIDENT_IPC_AUTHKEY, incident_hub.publish)
+        logger.info(f"Started as API worker reading {len(shared_cameras)} cameras from the detector process")
+        return
+
+    if APP_ROLE == "detector":
+        require_ipc_authkey()
+        incident_publisher = IncidentPublisher(INCIDENT_IPC_ADDRESS, INCIDENT_IPC_AUTHKEY, WS_CLIENT_BUFFER)
+
+    await asyncio.to_thread(dedup_index.warm)
+    import_legacy_subscriptions()
+    threading.Thread(target=telegram_worker, daemon=True, name="telegram").start()
+    logger.info("Telegram worker thread started")
+    persist_thread = threading.Thread(target=persistence_worker, daemon=True, name="persistence")
+    persist_thread.start()
+    if CLIP_RECORDING:
+        clip_recorder = ClipRecorder(CLIP_FPS, CLIP_ENCODER_WORKERS, CLIP_MAX_PENDING, CLIP_FOURCC)
+    if RETENTION_ENABLED:
+        retention_thread = threading.Thread(target=retention_worker, daemon=True, name="retention")
+        retention_thread.start()
+    start_cameras()
+    threading.Thread(target=load_model, daemon=True, name="model-loader").start()
+
+async def shutdown():
+    if RUNS_PIPELINE:
+        if retention_thread is not None:
+            # Stops between batches; a half-done batch is redone on the next run
+            retention_stop.set()
+            retention_trigger.set()
+            await asyncio.to_thread(retention_thread.join, PERSIST_SHUTDOWN_TIMEOUT)
+        # Stop the producers before the flush; anything queued after its end marker would be lost
+        pipeline_stop.set()
+        frame_ready.set()
+        if inference_thread is not None:
+            await asyncio.to_thread(inference_thread.join, PERSIST_SHUTDOWN_TIMEOUT)
+        if clip_recorder is not None:
+            # Before the flush, so links of clips finished here are still written
+            await asyncio.to_thread(clip_recorder.shutdown)
+        if persist_thread is not None:
+            await asyncio.to_thread(flush_incidents)
+        if incident_publisher is not None:
+            incident_publisher.close()
+        for stream in camera_streams.values():
+            if stream.ring is not None:
+                stream.ring.unlink()
+    elif incident_subscriber is not None:
+        incident_subscriber.close()
+
+# --- METRICS ---
+def camera_samples(key: str, scale: float = 1.0):
+    """Collector for one numeric field of CameraStream.stats(), labelled by camera."""
+    def collect():
+        return [({"camera": stream.label}, stream.stats()[key] * scale) for stream in camera_streams.values()]
+    return collect
+
+metrics_registry.gauge("weapon_queue_depth", "Items waiting in internal queues", lambda: [
+    ({"queue": "persistence"}, persist_queue.qsize()),
+    ({"queue": "telegram"}, telegram_alert_queue.qsize()),
+])
+metrics_registry.counter("weapon_incidents_total", "Incidents by persistence outcome", lambda: [
+    ({"result": result}, count) for result, count in persist_stats.items()
+])
+metrics_registry.gauge("weapon_video_viewers", "Connected /video viewers", lambda: [
+    ({"camera": label}, stream.broadcaster.viewer_count())
+    for label, stream in {**camera_streams, **shared_cameras}.items()
+])
+metrics_registry.gauge("weapon_incident_ipc_subscribers", "API workers connected to the incident publisher", lambda: [
+    ({}, incident_publisher.subscriber_count())
+] if incident_publisher is not None else [])
+metrics_registry.gauge("weapon_websocket_clients", "Connected /ws/incidents clients", lambda: [
+    ({}, len(incident_hub.subscribers))
+])
+metrics_registry.counter("weapon_websocket_dropped_total", "Incidents dropped for slow WebSocket clients", lambda: [
+    ({}, incident_hub.dropped)
+])
+metrics_registry.gauge("weapon_camera_capture_fps", "Frames read per second", camera_samples("capture_fps"))
+metrics_registry.gauge("weapon_camera_inference_fps", "Frames run through the detector per second", camera_samples("inference_fps"))
+metrics_registry.counter("weapon_camera_frames_dropped_total", "Frames overwritten before inference", camera_samples("frames_dropped"))
+metrics_registry.gauge("weapon_camera_frame_age_seconds", "Smoothed capture-to-display latency", camera_samples("frame_age_ms", 0.001))
+metrics_registry.gauge("weapon_camera_skip_ratio", "Share of frames the motion gate kept from the detector", camera_samples("skip_ratio"))
+metrics_registry.gauge("weapon_camera_active_tracks", "Weapon tracks currently alive", camera_samples("active_tracks"))
+metrics_registry.gauge("weapon_camera_clip_buffer_bytes", "Memory held by the pre-event clip buffer", camera_samples("clip_buffer_bytes"))
+metrics_registry.gauge("weapon_clips_outstanding", "Clips waiting for their post-event window or being encoded", lambda: [
+    ({"state": state}, clip_recorder.stats()[state]) for state in ("pending", "encoding")
+] if clip_recorder is not None else [])
+metrics_registry.counter("weapon_clips_total", "Incident clips by outcome", lambda: [
+    ({"result": result}, clip_recorder.stats()[result]) for result in ("encoded", "failed", "skipped")
+] if clip_recorder is not None else [])
 
 # --- ROUTES ---
+@app.get("/cameras")
+def get_cameras():
+    """List configured cameras."""
+    return [
+        {"camera": label, **get_camera_info(label), "streaming": label in camera_streams}
+        for label in CAMERA_LOCATION_MAP
+    ]
+
+@app.get("/stats/cameras")
+def get_camera_stats():
+    """Per-camera capture/inference FPS, dropped frames and frame age."""
+    return [stream.stats() for stream in camera_streams.values()]
+
+@app.get("/stats/persistence")
+def get_persistence_stats():
+    """Persistence queue depth and written/dropped/failed incident counters."""
+    return {"queued": persist_queue.qsize(), **persist_stats}
+
+@app.get("/stats/clips")
+def get_clip_stats():
+    """Clips waiting for their window, being encoded, and encoded/failed/skipped counters."""
+    return clip_recorder.stats() if clip_recorder is not None else {"enabled": False}
+
+@app.get("/stats/retention")
+def get_retention_stats():
+    """Whether retention is running, the result of its last run and the size of the archive."""
+    return {
+        "enabled": RETENTION_ENABLED and RUNS_PIPELINE,
+        **retention_state,
+        "live_bytes": directory_bytes(INCIDENTS_DIR),
+        "archive_months": archive_store.months(),
+        "archive_bytes": archive_store.bytes(),
+    }
+
+@app.post("/retention/run")
+def trigger_retention():
+    """Start a retention run now instead of waiting for RETENTION_INTERVAL."""
+    if retention_thread is None:
+        raise HTTPException(status_code=409, detail="Retention runs in the detector process")
+    retention_trigger.set()
+    return {"triggered": True, "running": retention_state["running"]}
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok", "role": APP_ROLE}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: database initialised and, in processes that run detection, the model warmed up."""
+    required = ["database", "model"] if RUNS_PIPELINE else ["database"]
+    ready = all(readiness[name] for name in required)
+    body = {"ready": ready, "role": APP_ROLE, **{name: readiness[name] for name in required}}
+    if incident_subscriber is not None:
+        # Informational: API workers still serve stored data while the detector restarts
+        body["detector_connected"] = incident_subscriber.connected
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/video")
-def video_feed():
-    def gen():
-        while True:
-            with frame_lock:
-                if latest_frame is not None:
-                    frame = latest_frame.copy()
-                else:
-                    # Create a placeholder frame if no camera feed
-                    frame = create_placeholder_frame()
-            
-            _, jpeg = cv2.imencode('.jpg', frame)
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            time.sleep(0.05)
-    
-    return StreamingResponse(gen(), media_type='multipart/x-mixed-replace; boundary=frame')
+async def video_feed(camera: str = Query(CAMERA_LABEL)):
+    stream = camera_streams.get(camera) or shared_cameras.get(camera)
+    if stream:
+        gen = stream.broadcaster.subscribe()
+    else:
+        async def gen_placeholder():
+            while True:
+                yield placeholder_chunk()
+                await asyncio.sleep(1.0)
+        gen = gen_placeholder()
+
+    return StreamingResponse(gen, media_type='multipart/x-mixed-replace; boundary=frame')
+
+def mjpeg_chunk(jpeg: bytes) -> bytes:
+    """Wrap JPEG bytes as one part of a multipart/x-mixed-replace stream."""
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+_placeholder_chunk: Optional[bytes] = None
+
+def placeholder_chunk() -> bytes:
+    """Encoded placeholder frame, built once."""
+    global _placeholder_chunk
+    if _placeholder_chunk is None:
+        _, jpeg = cv2.imencode('.jpg', create_placeholder_frame())
+        _placeholder_chunk = mjpeg_chunk(jpeg.tobytes())
+    return _placeholder_chunk
 
 def create_placeholder_frame():
     """Create a placeholder frame when camera is not available"""
-    import numpy as np
     frame = np.zeros((480, 640, 3), dtype=np.uint8)
     frame.fill(50)  # Dark gray background
     cv2.putText(frame, "Camera Feed Loading...", (150, 240), 
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
     return frame
 
-@app.get("/incidents")
-def get_incidents(start_date: Optional[str] = Query(None), end_date: Optional[str] = Query(None)):
-    db = SessionLocal()
-    query = db.query(Incident)
+# Columns returned by /incidents; selected directly so rows are plain tuples, not ORM objects
+INCIDENT_COLUMNS = [
+    Incident.id, Incident.timestamp, Incident.camera, Incident.camera_name,
+    Incident.location, Incident.label, Incident.confidence, Incident.image,
+    Incident.thumbnail, Incident.preview, Incident.clip,
+]
+
+def encode_cursor(timestamp: str, incident_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{incident_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, incident_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return timestamp, incident_id
+
+def filtered_incidents(db, start_date=None, end_date=None, camera=None, label=None, min_confidence=None):
+    """Incident rows matching the API filters, newest first on (timestamp, id)."""
+    query = db.query(*INCIDENT_COLUMNS)
     # If date filters are provided, filter by date (inclusive)
     if start_date:
         query = query.filter(Incident.timestamp >= start_date)
@@ -450,58 +2321,205 @@ def get_incidents(start_date: Optional[str] = Query(None), end_date: Optional[st
         else:
             end_date_full = end_date
         query = query.filter(Incident.timestamp <= end_date_full)
-    incidents = query.order_by(Incident.timestamp.desc()).all()
-    db.close()
-    return [
-        {
-            "id": i.id,
-            "timestamp": i.timestamp,
-            "camera": i.camera,
-            "camera_name": i.camera_name,
-            "location": i.location,
-            "label": i.label,
-            "confidence": i.confidence,
-            "image": i.image
-        }
-        for i in incidents
-    ]
+    if camera:
+        query = query.filter(Incident.camera == camera)
+    if label:
+        query = query.filter(Incident.label == label)
+    if min_confidence is not None:
+        query = query.filter(Incident.confidence >= min_confidence)
+    return query.order_by(Incident.timestamp.desc(), Incident.id.desc())
+
+def after_cursor(query, cursor: tuple):
+    """Keyset condition: rows strictly older than the cursor's (timestamp, id)."""
+    timestamp, incident_id = cursor
+    return query.filter(or_(
+        Incident.timestamp < timestamp,
+        and_(Incident.timestamp == timestamp, Incident.id < incident_id),
+    ))
+
+@app.get("/incidents")
+def get_incidents(
+    response: Response,
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    camera: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(INCIDENTS_PAGE_SIZE, ge=1, le=INCIDENTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    format: str = Query("json", enum=["json", "ndjson"]),
+):
+    """List incidents newest first, one page at a time.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next
+    page. `format=ndjson` streams every matching row instead (for exports).
+    """
+    filters = dict(start_date=start_date, end_date=end_date, camera=camera, label=label, min_confidence=min_confidence)
+    start_cursor = decode_cursor(cursor) if cursor else None
+    if format == "ndjson":
+        return StreamingResponse(stream_incidents_ndjson(filters, start_cursor), media_type="application/x-ndjson")
+
+    db = SessionLocal()
+    try:
+        query = filtered_incidents(db, **filters)
+        if start_cursor:
+            query = after_cursor(query, start_cursor)
+        rows = query.limit(limit + 1).all()
+    finally:
+        db.close()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [dict(row._mapping) for row in rows]
+
+@app.get("/archive/incidents")
+def get_archived_incidents(
+    response: Response,
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    camera: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(INCIDENTS_PAGE_SIZE, ge=1, le=INCIDENTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+):
+    """Incidents moved to the archive by retention, newest first; same filters and paging as /incidents.
+
+    Only the monthly archives overlapping the date range and cursor are opened.
+    """
+    filters = dict(start_date=start_date, end_date=end_date, camera=camera, label=label, min_confidence=min_confidence)
+    start_cursor = decode_cursor(cursor) if cursor else None
+    rows = []
+    for month in reversed(archive_store.months()):
+        if start_date and month < start_date[:7]:
+            break
+        if (end_date and month > end_date[:7]) or (start_cursor and month > start_cursor[0][:7]):
+            continue
+        db = archive_store.session(month)
+        try:
+            query = filtered_incidents(db, **filters)
+            if start_cursor:
+                query = after_cursor(query, start_cursor)
+            rows.extend(query.limit(limit + 1 - len(rows)).all())
+        finally:
+            db.close()
+        if len(rows) > limit:
+            break
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [dict(row._mapping) for row in rows]
+
+def stream_incidents_ndjson(filters: dict, start_cursor: Optional[tuple]):
+    """Yield all matching incidents as NDJSON, fetching one keyset page per query."""
+    page_cursor = start_cursor
+    while True:
+        db = SessionLocal()
+        try:
+            query = filtered_incidents(db, **filters)
+            if page_cursor:
+                query = after_cursor(query, page_cursor)
+            rows = query.limit(INCIDENTS_MAX_PAGE_SIZE).all()
+        finally:
+            db.close()
+        if not rows:
+            return
+        yield "".join(json.dumps(dict(row._mapping)) + "\n" for row in rows)
+        page_cursor = (rows[-1].timestamp, rows[-1].id)
 
 @app.websocket("/ws/incidents")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, last_event_id: Optional[int] = Query(None)):
     await websocket.accept()
-    clients.append(websocket)
-    try:
+    # Resume point can also come from a Last-Event-ID header
+    if last_event_id is None and websocket.headers.get("last-event-id", "").isdigit():
+        last_event_id = int(websocket.headers["last-event-id"])
+    subscription = incident_hub.subscribe(last_event_id)
+
+    async def send_incidents():
         while True:
-            # Wait for a new incident from the queue
-            loop = asyncio.get_event_loop()
-            incident = await loop.run_in_executor(None, incident_queue.get)
-            # Send to all connected clients
-            for ws in clients[:]:
-                try:
-                    await ws.send_json(incident)
-                except Exception:
-                    clients.remove(ws)
-    except WebSocketDisconnect:
-        clients.remove(websocket)
+            await websocket.send_json(await subscription.get())
+
+    async def wait_for_disconnect():
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(send_incidents()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Collects WebSocketDisconnect/send errors so they are not logged as unretrieved
+        await asyncio.gather(*tasks, return_exceptions=True)
+        incident_hub.unsubscribe(subscription)
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of stage latencies, queues, clients and camera rates."""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profiler")
+def get_profiler(format: str = Query("json", enum=["json", "collapsed"])):
+    """Profiler status, or the collected profile as collapsed stacks (for flamegraph.pl/speedscope)."""
+    if format == "collapsed":
+        return Response(profiler.collapsed(), media_type="text/plain")
+    return profiler.status()
+
+@app.post("/debug/profiler")
+def toggle_profiler(request: dict):
+    """Start ({"enabled": true, "interval": 0.01}) or stop ({"enabled": false}) the sampling profiler."""
+    if request.get("enabled", True):
+        interval = request.get("interval")
+        if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                                     or not math.isfinite(interval)):
+            raise HTTPException(status_code=400, detail="interval must be a number of seconds")
+        if profiler.start(interval):
+            logger.info(f"Sampling profiler started (interval {profiler.interval}s)")
+    elif profiler.running:
+        profiler.stop()
+        logger.info(f"Sampling profiler stopped after {profiler.samples} samples")
+    return profiler.status()
+
+@app.get("/stats/websockets")
+def get_websocket_stats():
+    """Connected WebSocket clients and incidents dropped for slow clients."""
+    return {"clients": len(incident_hub.subscribers), "dropped": incident_hub.dropped, "last_event_id": incident_hub.last_id}
 
 from fastapi.staticfiles import StaticFiles
-app.mount("/incidents", StaticFiles(directory=INCIDENTS_DIR), name="incidents")
+class SnapshotFiles(StaticFiles):
+    """Static snapshots with long-lived caching.
+
+    Snapshot names are unique per incident and files are never rewritten, so
+    clients may keep them for good. Starlette already sends a strong ETag and
+    answers If-None-Match with 304.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={SNAPSHOT_CACHE_MAX_AGE}, immutable"
+        return response
+
+# The directory is created on startup, not at import
+app.mount("/incidents", SnapshotFiles(directory=INCIDENTS_DIR, check_dir=False), name="incidents")
+# Only the images subdirectory: the archive databases next to it are not served
+app.mount("/archive/images", SnapshotFiles(directory=os.path.join(ARCHIVE_DIR, "images"), check_dir=False), name="archive-images")
 
 @app.get("/alerts")
 def get_alerts():
     db = SessionLocal()
-    count = db.query(Incident).count()
+    count = db.query(func.sum(IncidentRollup.count)).filter(IncidentRollup.granularity == "month").scalar()
     db.close()
-    return {"alerts": count}
+    return {"alerts": count or 0}
 
 @app.get("/telegram/subscribers")
 def get_telegram_subscribers():
     """Get count of Telegram subscribers."""
-    return {"subscribers": len(get_subscribed_chats())}
+    return {"subscribers": count_subscriptions()}
 
 @app.get("/settings/notifications")
 def get_notification_settings():
     """Get current notification settings."""
+    load_notification_settings()
     with notification_lock:
         logger.info(f"Notification settings retrieved: enabled={notification_enabled}")
         return {"enabled": notification_enabled}
@@ -516,6 +2534,7 @@ def update_notification_settings(request: dict):
     with notification_lock:
         old_state = notification_enabled
         notification_enabled = enabled
+        save_notification_settings(enabled)
     
     # Log the change with context
     if old_state != enabled:
@@ -529,23 +2548,63 @@ def update_notification_settings(request: dict):
     
     return {"enabled": notification_enabled, "message": "Settings updated successfully"}
 
+def rollup_query(db, granularity: str, columns: list, camera=None, label=None, start_date=None, end_date=None):
+    """Query rollup buckets of one granularity with the shared analytics filters."""
+    length = ROLLUP_GRANULARITIES[granularity]
+    query = db.query(*columns).filter(IncidentRollup.granularity == granularity)
+    if start_date:
+        query = query.filter(IncidentRollup.period >= start_date[:length])
+    if end_date:
+        # "~" sorts after every timestamp character, so the whole end bucket is included
+        query = query.filter(IncidentRollup.period <= end_date[:length] + "~")
+    if camera:
+        query = query.filter(IncidentRollup.camera == camera)
+    if label:
+        query = query.filter(IncidentRollup.label == label)
+    return query
+
 @app.get("/analytics/incidents/timeline")
-def incidents_timeline(granularity: str = Query("day", enum=["day", "month"])):
+def incidents_timeline(
+    granularity: str = Query("day", enum=["hour", "day", "month"]),
+    camera: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+):
     db = SessionLocal()
-    # Parse timestamp to date, group by date
-    if granularity == "day":
-        group_expr = func.substr(Incident.timestamp, 1, 10)  # "YYYY-MM-DD"
-    elif granularity == "month":
-        group_expr = func.substr(Incident.timestamp, 1, 7)   # "YYYY-MM"
-    else:
-        group_expr = func.substr(Incident.timestamp, 1, 10)
-    results = db.query(group_expr.label("period"), func.count().label("count")).group_by("period").order_by("period").all()
+    total = func.sum(IncidentRollup.count).label("count")
+    results = rollup_query(
+        db, granularity, [IncidentRollup.period, total], camera, label, start_date, end_date
+    ).group_by(IncidentRollup.period).order_by(IncidentRollup.period).all()
     db.close()
     return [{"period": r.period, "count": r.count} for r in results]
 
 @app.get("/analytics/incidents/distribution")
-def incidents_distribution(by: str = Query("label", enum=["label", "location", "camera_name"])):
+def incidents_distribution(
+    by: str = Query("label", enum=["label", "location", "camera_name", "camera"]),
+    camera: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+):
     db = SessionLocal()
-    results = db.query(getattr(Incident, by), func.count().label("count")).group_by(getattr(Incident, by)).order_by(func.count().desc()).all()
+    # Day buckets are needed to honour date filters exactly; month buckets are fewest otherwise
+    granularity = "day" if start_date or end_date else "month"
+    column = getattr(IncidentRollup, by)
+    total = func.sum(IncidentRollup.count)
+    results = rollup_query(
+        db, granularity, [column, total], camera, label, start_date, end_date
+    ).group_by(column).order_by(total.desc()).all()
     db.close()
     return [{"category": r[0], "count": r[1]} for r in results]
+
+@app.post("/analytics/rollups/rebuild")
+def rebuild_analytics_rollups():
+    """Recompute analytics rollups from the incidents table."""
+    if not RUNS_PIPELINE:
+        # It has to exclude retention, which only runs in the pipeline process
+        raise HTTPException(status_code=409, detail="Rollups are rebuilt in the detector process")
+    buckets = rebuild_rollups(wait=False)
+    if buckets is None:
+        raise HTTPException(status_code=409, detail="A rollup rebuild or retention batch is in progress")
+    return {"buckets": buckets}
@@ -0,0 +1,68 @@
+"""Cheap motion pre-stage that decides when a camera frame needs the detector.
+
+Each frame is downscaled, converted to grayscale and compared against a
+running-average background. While the scene is static the detector only runs
+every `idle_interval` seconds; as soon as enough pixels change, or a weapon
+box was seen recently, every frame goes to the model again.
+
+All methods take the current time explicitly so the same gate can be replayed
+on recorded clips using video time (see evaluate_motion_gate.py).
+"""
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, width: int = 160, pixel_threshold: int = 25, area_threshold: float = 0.005,
+                 motion_hold: float = 2.0, weapon_hold: float = 10.0, idle_interval: float = 1.0,
+                 background_rate: float = 0.05):
+        self.width = width
+        self.pixel_threshold = pixel_threshold  # grey-level change that counts as a changed pixel
+        self.area_threshold = area_threshold  # fraction of changed pixels that counts as motion
+        self.motion_hold = motion_hold  # seconds to keep full rate after motion stops
+        self.weapon_hold = weapon_hold  # seconds to keep full rate after a weapon box
+        self.idle_interval = idle_interval  # seconds between detector runs on a static scene
+        self.background_rate = background_rate
+        self.background = None
+        self.last_motion = float("-inf")
+        self.last_weapon = float("-inf")
+        self.last_inference = float("-inf")
+        self.motion_score = 0.0
+        self.inferred = 0
+        self.skipped = 0
+
+    def update(self, frame, now: float) -> bool:
+        """Feed a captured frame; returns True if it shows motion."""
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            self.last_motion = now
+            return True
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        # Slowly absorb lighting changes into the background
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+        self.motion_score = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+        if self.motion_score >= self.area_threshold:
+            self.last_motion = now
+            return True
+        return False
+
+    def note_weapon(self, now: float):
+        """Record that the detector saw a weapon-class box."""
+        self.last_weapon = now
+
+    def should_infer(self, now: float) -> bool:
+        """Decide whether the newest frame goes to the detector, and count the decision."""
+        active = now - self.last_motion < self.motion_hold or now - self.last_weapon < self.weapon_hold
+        if active or now - self.last_inference >= self.idle_interval:
+            self.last_inference = now
+            self.inferred += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def skip_ratio(self) -> float:
+        total = self.inferred + self.skipped
+        return self.skipped / total if total else 0.0
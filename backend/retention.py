@@ -0,0 +1,138 @@
+"""Month-partitioned archive databases and SQLite space reclamation for the retention job.
+
+`ArchiveStore` keeps incidents moved out of the live database in one SQLite
+file per month (`incidents-YYYY-MM.db`), each holding the same table as the
+live database, so the API can run its usual queries against them on demand.
+Inserts are idempotent (INSERT OR IGNORE on the primary key): a retention run
+that dies between archiving and deleting the live rows is simply repeated.
+
+`incremental_vacuum` hands free pages back to the filesystem a few at a time,
+so the live database shrinks without the long exclusive lock of a full VACUUM.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Table, create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveStore:
+    def __init__(self, directory: str, table: Table, prefix: str = "incidents"):
+        self.directory = directory
+        self.table = table
+        self.prefix = prefix
+        self.pattern = re.compile(rf"^{re.escape(prefix)}-(\d{{4}}-\d{{2}})\.db$")
+        self.lock = threading.Lock()
+        self.engines: Dict[str, Engine] = {}
+
+    def path(self, month: str) -> str:
+        return os.path.join(self.directory, f"{self.prefix}-{month}.db")
+
+    def months(self) -> List[str]:
+        """Archived months ("YYYY-MM"), oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(m.group(1) for m in map(self.pattern.match, os.listdir(self.directory)) if m)
+
+    def engine(self, month: str, create: bool = False) -> Optional[Engine]:
+        """Engine of one month's archive; None if it does not exist and `create` is False."""
+        with self.lock:
+            engine = self.engines.get(month)
+            if engine is not None:
+                return engine
+            path = self.path(month)
+            if not create and not os.path.exists(path):
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+            event.listen(engine, "connect", _archive_pragmas)
+            self.table.create(engine, checkfirst=True)
+            self.engines[month] = engine
+            return engine
+
+    def session(self, month: str) -> Optional[Session]:
+        engine = self.engine(month)
+        return Session(engine) if engine is not None else None
+
+    def insert(self, rows: Iterable[dict]) -> int:
+        """Add rows to the partition of their timestamp's month, one transaction per month."""
+        by_month: Dict[str, list] = {}
+        for row in rows:
+            by_month.setdefault(row["timestamp"][:7], []).append(row)
+        for month, month_rows in by_month.items():
+            with self.engine(month, create=True).begin() as conn:
+                conn.execute(sqlite_insert(self.table).on_conflict_do_nothing(), month_rows)
+        return sum(len(r) for r in by_month.values())
+
+    def bytes(self) -> int:
+        return sum(os.path.getsize(self.path(month)) for month in self.months())
+
+    def close(self):
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+
+
+def _archive_pragmas(dbapi_connection, connection_record):
+    # Archives are written in bulk by one thread and otherwise only read. FULL, because the
+    # rows are deleted from the live table right after the archive commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.close()
+
+
+def enable_incremental_vacuum(engine: Engine) -> bool:
+    """Switch a database to auto_vacuum=INCREMENTAL; True if this needed a one-off full VACUUM.
+
+    The mode only takes effect on an existing database after it is rebuilt,
+    so call this at startup, before anything else holds the database.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return False
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        has_tables = conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE type='table'").scalar()
+        if has_tables:
+            conn.exec_driver_sql("VACUUM")
+        return bool(has_tables)
+
+
+def incremental_vacuum(engine: Engine, pages: int = 1000, pause: float = 0.5,
+                       stop: Optional[threading.Event] = None) -> int:
+    """Free the database's unused pages `pages` at a time, pausing in between; returns pages freed."""
+    freed = 0
+    while stop is None or not stop.is_set():
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if not free:
+                break
+            # The sqlite3 module steps a statement once, which frees a single page; executescript runs it to completion
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({min(pages, free)})")
+            freed += free - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if free <= pages:
+            break
+        time.sleep(pause)
+    return freed
+
+
+def directory_bytes(path: str) -> int:
+    """Total size of the regular files directly inside `path`."""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
@@ -0,0 +1,87 @@
+"""Run the API tier as several workers with a single detection process behind it.
+
+`uvicorn main:app --workers N` on its own would start N copies of every camera,
+model and Telegram bot. This launcher starts:
+  - one detector process (APP_ROLE=detector) on --detector-port: cameras,
+    model, persistence and the Telegram bot
+  - N API workers (APP_ROLE=api) on --port: /video from the detector's
+    shared-memory frame rings, the incident WebSocket fed over the incident
+    channel (see ipc.py), and incidents/analytics/images from the database
+
+The detector is started first and the workers only once it answers /healthz,
+so the database schema is created by a single process. Both sides get a fresh
+random INCIDENT_IPC_AUTHKEY for the incident channel unless one is set already.
+
+Usage:
+    python serve.py --workers 4 --port 8000 --detector-port 8001
+"""
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def uvicorn_command(host, port, workers=1):
+    return [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port), "--workers", str(workers)]
+
+
+def wait_for_health(url, process, timeout):
+    """Poll a /healthz URL until it answers, the process dies or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1.0):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000, help="port of the API workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--detector-host", default="127.0.0.1")
+    parser.add_argument("--detector-port", type=int, default=8001)
+    parser.add_argument("--startup-timeout", type=float, default=60.0, help="seconds to wait for the detector")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ}
+    env.setdefault("INCIDENT_IPC_AUTHKEY", secrets.token_hex(32))
+    detector = subprocess.Popen(uvicorn_command(args.detector_host, args.detector_port),
+                                env={**env, "APP_ROLE": "detector"}, cwd=here)
+    health_url = f"http://{args.detector_host}:{args.detector_port}/healthz"
+    if not wait_for_health(health_url, detector, args.startup_timeout):
+        print("Detector process did not come up, exiting", file=sys.stderr)
+        detector.terminate()
+        sys.exit(1)
+    api = subprocess.Popen(uvicorn_command(args.host, args.port, args.workers),
+                           env={**env, "APP_ROLE": "api"}, cwd=here)
+    processes = [detector, api]
+
+    def stop(signum=None, frame=None):
+        for p in processes:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # If either side exits, take the other one down too
+    while all(p.poll() is None for p in processes):
+        time.sleep(0.5)
+    stop()
+    for p in processes:
+        p.wait()
+    sys.exit(max(p.returncode or 0 for p in processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+
+from tiling import merge_detections, plan_regions
+
+# Two 640px tiles overlapping on x in [512, 640)
+TWO_TILES = [(0, 0, 640, 640), (512, 0, 1152, 640)]
+
+
+def part(*boxes):
+    """(xyxy, conf, cls) arrays in tile coordinates from (x1, y1, x2, y2, conf, cls) rows."""
+    rows = np.array(boxes, dtype=np.float32).reshape(-1, 6)
+    return rows[:, :4], rows[:, 4], rows[:, 5].astype(int)
+
+
+def test_plan_regions_cover_frame_with_overlap():
+    regions = plan_regions((640, 1152), tile_size=640, overlap=0.2)
+    assert regions == TWO_TILES
+
+
+def test_truncated_box_joins_full_box_from_neighbour():
+    # Tile 0 cuts the object at its right edge; tile 1 sees it whole at [600, 660]
+    boxes, confs, classes = merge_detections(
+        [part((600, 10, 640, 50, 0.9, 0)), part((88, 10, 148, 50, 0.8, 0))], TWO_TILES)
+    np.testing.assert_allclose(boxes, [[600, 10, 660, 50]])
+    np.testing.assert_allclose(confs, [0.9])
+    assert classes.tolist() == [0]
+
+
+def test_object_wider_than_overlap_becomes_one_box():
+    # Frame box [300, 900]; each tile only sees the part inside it
+    boxes, confs, _ = merge_detections(
+        [part((300, 100, 640, 300, 0.7, 0)), part((0, 100, 388, 300, 0.6, 0))], TWO_TILES)
+    np.testing.assert_allclose(boxes, [[300, 100, 900, 300]])
+    np.testing.assert_allclose(confs, [0.7])
+
+
+def test_object_across_three_tiles_becomes_one_box():
+    regions = [(0, 0, 640, 640), (512, 0, 1152, 640), (1024, 0, 1664, 640)]
+    boxes, _, _ = merge_detections(
+        [part((400, 0, 640, 100, 0.5, 1)), part((0, 0, 640, 100, 0.6, 1)), part((0, 0, 276, 100, 0.5, 1))],
+        regions)
+    np.testing.assert_allclose(boxes, [[400, 0, 1300, 100]])
+
+
+def test_separate_objects_across_seam_are_kept():
+    boxes, _, _ = merge_detections(
+        [part((100, 100, 150, 150, 0.9, 0)), part((388, 100, 438, 150, 0.9, 0))], TWO_TILES)
+    assert len(boxes) == 2
+
+
+def test_different_classes_at_seam_are_kept():
+    boxes, _, classes = merge_detections(
+        [part((600, 10, 640, 50, 0.9, 0)), part((88, 10, 148, 50, 0.8, 1))], TWO_TILES)
+    assert sorted(classes.tolist()) == [0, 1]
+    assert len(boxes) == 2
+
+
+def test_boxes_from_the_same_tile_are_not_merged():
+    boxes, _, _ = merge_detections(
+        [part((100, 100, 200, 200, 0.9, 0), (120, 100, 220, 200, 0.8, 0)), part()], TWO_TILES)
+    assert len(boxes) == 2
+
+
+def test_roi_filter_uses_centre_of_merged_box():
+    # The piece from tile 0 is centred at x=620, outside the ROI; the whole object is centred at x=700
+    roi = [[[650, 0], [1152, 0], [1152, 640], [650, 640]]]
+    boxes, _, _ = merge_detections(
+        [part((600, 10, 640, 50, 0.9, 0)), part((88, 10, 288, 50, 0.8, 0))], TWO_TILES, roi)
+    np.testing.assert_allclose(boxes, [[600, 10, 800, 50]])
@@ -0,0 +1,94 @@
+import numpy as np
+
+from tracker import IoUTracker
+
+BOX = [100, 100, 150, 200]
+PISTOL = 0
+
+
+def step(tracker, now, box=None, conf=0.9, frame=None):
+    """One tracker update with a single pistol box, or with no detections if box is None."""
+    if box is None:
+        return tracker.update(np.zeros((0, 4)), np.zeros(0), np.zeros(0), now, frame)
+    return tracker.update([box], [conf], [PISTOL], now, frame)
+
+
+def test_confirms_after_n_of_m_hits():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5)
+    assert step(tracker, 0.0, BOX) == []
+    assert step(tracker, 0.1) == []
+    assert step(tracker, 0.2, BOX) == []
+    confirmed = step(tracker, 0.3, BOX)
+    assert len(confirmed) == 1
+    assert confirmed[0]["cls"] == PISTOL
+
+
+def test_confirms_only_once_per_track():
+    tracker = IoUTracker(confirm_hits=2, confirm_window=3)
+    step(tracker, 0.0, BOX)
+    assert len(step(tracker, 0.1, BOX)) == 1
+    for i in range(2, 6):
+        assert step(tracker, i / 10, BOX) == []
+
+
+def test_single_frame_blip_never_alerts():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5)
+    assert step(tracker, 0.0, BOX) == []
+    for i in range(1, 10):
+        assert step(tracker, i / 10) == []
+
+
+def test_hits_spread_wider_than_window_do_not_confirm():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5, max_age=60.0)
+    for i in range(15):
+        # One hit every five updates: never three inside any window of five
+        assert step(tracker, i / 10, BOX if i % 5 == 0 else None) == []
+    assert len(tracker) == 1
+
+
+def test_peak_frame_is_the_highest_confidence_one():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5)
+    step(tracker, 0.0, BOX, 0.5, "f0")
+    step(tracker, 0.1, BOX, 0.9, "f1")
+    confirmed = step(tracker, 0.2, BOX, 0.6, "f2")
+    assert len(confirmed) == 1
+    assert confirmed[0]["frame"] == "f1"
+    assert confirmed[0]["confidence"] == np.float32(0.9)
+
+
+def test_confirmation_waits_for_min_peak_confidence():
+    tracker = IoUTracker(confirm_hits=2, confirm_window=3, min_peak_confidence=0.8)
+    step(tracker, 0.0, BOX, 0.5)
+    assert step(tracker, 0.1, BOX, 0.6) == []
+    confirmed = step(tracker, 0.2, BOX, 0.85, "peak")
+    assert len(confirmed) == 1
+    assert confirmed[0]["frame"] == "peak"
+
+
+def test_track_expires_after_miss_budget():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5, max_age=1.0)
+    step(tracker, 0.0, BOX)
+    step(tracker, 0.5)
+    assert len(tracker) == 1
+    step(tracker, 1.5)
+    assert len(tracker) == 0
+    # The same object coming back starts a new track that has to be confirmed again
+    step(tracker, 1.6, BOX)
+    assert tracker.ids.tolist() == [2]
+
+
+def test_moving_box_keeps_its_track():
+    tracker = IoUTracker(confirm_hits=3, confirm_window=5)
+    confirmed = []
+    for i in range(3):
+        x = 100 + 10 * i
+        confirmed += step(tracker, i / 10, [x, 100, x + 50, 200])
+    assert len(confirmed) == 1
+    assert len(tracker) == 1
+
+
+def test_other_class_does_not_match():
+    tracker = IoUTracker(confirm_hits=2, confirm_window=3)
+    tracker.update([BOX], [0.9], [0], 0.0)
+    assert tracker.update([BOX], [0.9], [1], 0.1) == []
+    assert len(tracker) == 2
@@ -0,0 +1,144 @@
+"""Region-of-interest cropping and tiled inference helpers.
+
+A camera can restrict detection to polygon ROIs and/or split the area it
+watches into overlapping tiles. Each tile is passed to the model at close to
+its native resolution, so small objects (e.g. pistols on a 4K frame) are not
+lost in the model's internal downscale. ROIs are cropped to the bounding
+rectangle of each polygon, so the parts of the frame far from every ROI are
+skipped, but masked pixels inside a rectangle still reach the model; the
+polygons are only applied to the detections afterwards.
+
+Regions are planned once per camera and frame size. Detections from all
+regions of a frame are shifted back to frame coordinates, merged across
+region overlaps and filtered to the ROI polygons.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Region = Tuple[int, int, int, int]  # x1, y1, x2, y2 in frame pixels
+
+
+def _tile_starts(start: int, end: int, tile: int, overlap: float) -> List[int]:
+    """Tile offsets covering [start, end) with the last tile flush against the end."""
+    length = end - start
+    if length <= tile:
+        return [start]
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(start, end - tile, stride))
+    starts.append(end - tile)
+    return starts
+
+
+def plan_regions(frame_shape: Sequence[int], rois: Optional[list] = None,
+                 tile_size: Optional[int] = None, overlap: float = 0.2) -> List[Region]:
+    """Crop rectangles to run the model on for one frame size.
+
+    Without ROIs the whole frame is the area of interest; without a tile size
+    each area is a single crop.
+    """
+    h, w = frame_shape[:2]
+    if rois:
+        areas = []
+        for polygon in rois:
+            x, y, bw, bh = cv2.boundingRect(np.array(polygon, dtype=np.int32))
+            areas.append((max(0, x), max(0, y), min(w, x + bw), min(h, y + bh)))
+    else:
+        areas = [(0, 0, w, h)]
+    if not tile_size:
+        return areas
+
+    regions = []
+    for x1, y1, x2, y2 in areas:
+        for ty in _tile_starts(y1, y2, tile_size, overlap):
+            for tx in _tile_starts(x1, x2, tile_size, overlap):
+                regions.append((tx, ty, min(tx + tile_size, x2), min(ty + tile_size, y2)))
+    return regions
+
+
+def crop(frame, region: Region):
+    """Crop view (no copy) of a region."""
+    x1, y1, x2, y2 = region
+    return frame[y1:y2, x1:x2]
+
+
+def merge_overlapping(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, sources: np.ndarray,
+                      regions: List[Region], iou_threshold: float):
+    """Merge boxes of the same object reported by several overlapping regions.
+
+    Two same-class boxes from different regions are taken to be one object when
+    their parts inside the overlap of the two regions match (IoU of the clipped
+    boxes >= iou_threshold). That pairs a box cut off at one tile's edge with
+    the full box from its neighbour, and the pieces of an object too large for
+    either tile. Each group becomes the union of its boxes with the best score.
+    """
+    if len(boxes) < 2:
+        return boxes, scores, classes
+    reg = np.asarray(regions, dtype=np.float32)[sources]
+    lo = np.maximum(reg[:, None, :2], reg[None, :, :2])
+    hi = np.minimum(reg[:, None, 2:], reg[None, :, 2:])
+    lo, hi = np.concatenate([lo, lo], axis=2), np.concatenate([hi, hi], axis=2)
+    a = np.clip(boxes[:, None, :], lo, hi)
+    b = np.clip(boxes[None, :, :], lo, hi)
+    inter = (np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+             * np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None))
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-9)
+    same = ((classes[:, None] == classes[None, :]) & (sources[:, None] != sources[None, :])
+            & (iou >= iou_threshold))
+
+    # Union-find, so an object spanning three or more tiles ends up in one group
+    parent = list(range(len(boxes)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(same, 1))):
+        parent[root(int(i))] = root(int(j))
+    groups = {}
+    for i in range(len(boxes)):
+        groups.setdefault(root(i), []).append(i)
+
+    members = list(groups.values())
+    merged = np.array([[boxes[m, 0].min(), boxes[m, 1].min(), boxes[m, 2].max(), boxes[m, 3].max()]
+                       for m in members], dtype=boxes.dtype)
+    return merged, np.array([scores[m].max() for m in members], dtype=scores.dtype), classes[[m[0] for m in members]]
+
+
+def inside_rois(boxes: np.ndarray, rois: list) -> np.ndarray:
+    """Mask of boxes whose centre lies inside any ROI polygon."""
+    if not len(boxes):
+        return np.zeros(0, dtype=bool)
+    centres = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+    mask = np.zeros(len(boxes), dtype=bool)
+    for polygon in rois:
+        contour = np.array(polygon, dtype=np.float32)
+        mask |= np.array([cv2.pointPolygonTest(contour, (float(x), float(y)), False) >= 0 for x, y in centres])
+    return mask
+
+
+def merge_detections(parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]], regions: List[Region],
+                     rois: Optional[list] = None, iou_threshold: float = 0.5):
+    """Combine per-region (xyxy, conf, cls) arrays into one set in frame coordinates."""
+    boxes, confs, classes, sources = [], [], [], []
+    for index, ((xyxy, conf, cls), (x1, y1, _, _)) in enumerate(zip(parts, regions)):
+        boxes.append(xyxy + np.array([x1, y1, x1, y1], dtype=np.float32))
+        confs.append(conf)
+        classes.append(cls)
+        sources.append(np.full(len(xyxy), index, dtype=int))
+    boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32)
+    confs = np.concatenate(confs) if confs else np.zeros(0, dtype=np.float32)
+    classes = np.concatenate(classes) if classes else np.zeros(0, dtype=int)
+    sources = np.concatenate(sources) if sources else np.zeros(0, dtype=int)
+    if len(regions) > 1:
+        boxes, confs, classes = merge_overlapping(boxes, confs, classes, sources, regions, iou_threshold)
+    # Filter after merging so a box cut at a seam is judged by the whole object's centre
+    if rois:
+        keep = inside_rois(boxes, rois)
+        boxes, confs, classes = boxes[keep], confs[keep], classes[keep]
+    return boxes, confs, classes
@@ -0,0 +1,158 @@
+"""Lightweight IoU tracker so weapon alerts fire once per track instead of per frame.
+
+Track state lives in parallel numpy arrays (boxes, velocities, hit history,
+timestamps, peak confidence), so an update is a handful of vectorised
+operations even with many boxes. Each track carries a constant-velocity
+alpha-beta filter (a fixed-gain Kalman filter): boxes are predicted forward
+before matching and corrected by the matched detection afterwards.
+
+A track is confirmed once it was detected in at least `confirm_hits` of its
+last `confirm_window` updates and its peak confidence reached
+`min_peak_confidence`. `update()` returns each track exactly once, at
+confirmation, together with the frame where its confidence peaked.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (K, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class IoUTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_age: float = 2.0, confirm_hits: int = 3,
+                 confirm_window: int = 5, min_peak_confidence: float = 0.0,
+                 alpha: float = 0.6, beta: float = 0.2):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age  # seconds a track survives without a matching detection
+        self.confirm_hits = confirm_hits
+        self.window_mask = (1 << confirm_window) - 1
+        self.confirm_window = confirm_window
+        self.min_peak_confidence = min_peak_confidence
+        self.alpha = alpha  # position gain
+        self.beta = beta  # velocity gain
+        self.next_id = 1
+        self.last_update: Optional[float] = None
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.cls = np.zeros(0, dtype=np.int32)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.velocity = np.zeros((0, 4), dtype=np.float32)  # px/s per box coordinate
+        self.hits = np.zeros(0, dtype=np.uint32)  # bit i = detected i updates ago
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.peak_conf = np.zeros(0, dtype=np.float32)
+        self.confirmed = np.zeros(0, dtype=bool)
+        self.peak_frames: list = []  # frame at peak confidence, parallel to the arrays
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keep(self, mask: np.ndarray):
+        self.ids = self.ids[mask]
+        self.cls = self.cls[mask]
+        self.boxes = self.boxes[mask]
+        self.velocity = self.velocity[mask]
+        self.hits = self.hits[mask]
+        self.last_seen = self.last_seen[mask]
+        self.peak_conf = self.peak_conf[mask]
+        self.confirmed = self.confirmed[mask]
+        self.peak_frames = [f for f, keep in zip(self.peak_frames, mask) if keep]
+
+    def _match(self, dets: np.ndarray, det_cls: np.ndarray):
+        """Greedy highest-IoU-first matching between tracks and same-class detections."""
+        if not len(self.ids) or not len(dets):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        iou = iou_matrix(self.boxes, dets)
+        iou[self.cls[:, None] != det_cls[None, :]] = 0.0
+        track_idx, det_idx = [], []
+        used_t, used_d = set(), set()
+        for flat in np.argsort(-iou, axis=None):
+            t, d = divmod(int(flat), iou.shape[1])
+            if iou[t, d] < self.iou_threshold:
+                break
+            if t in used_t or d in used_d:
+                continue
+            used_t.add(t)
+            used_d.add(d)
+            track_idx.append(t)
+            det_idx.append(d)
+        return np.array(track_idx, dtype=int), np.array(det_idx, dtype=int)
+
+    def update(self, dets: np.ndarray, confs: np.ndarray, det_cls: np.ndarray, now: float, frame=None) -> List[dict]:
+        """Advance all tracks with one frame's detections.
+
+        Returns newly confirmed tracks as dicts with track_id, cls, confidence
+        (the peak) and frame (the frame where that peak was seen).
+        """
+        dets = np.asarray(dets, dtype=np.float32).reshape(-1, 4)
+        confs = np.asarray(confs, dtype=np.float32).reshape(-1)
+        det_cls = np.asarray(det_cls, dtype=np.int32).reshape(-1)
+        dt = 0.0 if self.last_update is None else max(now - self.last_update, 0.0)
+        self.last_update = now
+
+        # Predict
+        self.boxes += self.velocity * dt
+        self.hits <<= 1
+        self.hits &= self.window_mask
+
+        # Correct matched tracks
+        t_idx, d_idx = self._match(dets, det_cls)
+        if len(t_idx):
+            residual = dets[d_idx] - self.boxes[t_idx]
+            self.boxes[t_idx] += self.alpha * residual
+            if dt > 0:
+                self.velocity[t_idx] += self.beta * residual / dt
+            self.hits[t_idx] |= 1
+            self.last_seen[t_idx] = now
+            better = confs[d_idx] > self.peak_conf[t_idx]
+            self.peak_conf[t_idx[better]] = confs[d_idx[better]]
+            for t in t_idx[better]:
+                if not self.confirmed[t]:
+                    self.peak_frames[t] = frame
+
+        # Drop tracks that have not been matched for too long
+        alive = now - self.last_seen <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+
+        # Start tentative tracks for unmatched detections
+        unmatched = np.setdiff1d(np.arange(len(dets)), d_idx)
+        if len(unmatched):
+            n = len(unmatched)
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + n)])
+            self.next_id += n
+            self.cls = np.concatenate([self.cls, det_cls[unmatched]])
+            self.boxes = np.concatenate([self.boxes, dets[unmatched]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((n, 4), dtype=np.float32)])
+            self.hits = np.concatenate([self.hits, np.ones(n, dtype=np.uint32)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(n, now)])
+            self.peak_conf = np.concatenate([self.peak_conf, confs[unmatched]])
+            self.confirmed = np.concatenate([self.confirmed, np.zeros(n, dtype=bool)])
+            self.peak_frames.extend([frame] * n)
+
+        # N-of-M confirmation
+        hit_count = np.zeros(len(self.ids), dtype=np.int32)
+        for bit in range(self.confirm_window):
+            hit_count += ((self.hits >> bit) & 1).astype(np.int32)
+        newly = ~self.confirmed & (hit_count >= self.confirm_hits) & (self.peak_conf >= self.min_peak_confidence)
+        self.confirmed |= newly
+        confirmed = []
+        for t in np.flatnonzero(newly):
+            confirmed.append({
+                "track_id": int(self.ids[t]),
+                "cls": int(self.cls[t]),
+                "confidence": float(self.peak_conf[t]),
+                "frame": self.peak_frames[t],
+            })
+            # The snapshot is handed off; stop pinning the frame in memory
+            self.peak_frames[t] = None
+        return confirmed
@@ -1,5 +1,6 @@
 import * as React from 'react';
 import { useEffect, useState } from 'react';
+import { fetchAllIncidents, refreshIncidents } from '@/lib/incidents';
 
 const BACKEND_URL = 'http://localhost:8000';
 
@@ -46,20 +47,33 @@ const Dashboard: React.FC = () => {
 
   // Fetch incidents (auto-refresh)
   useEffect(() => {
+    let cancelled = false;
+    let loaded: any[] | null = null;
+    let busy = false;
     const fetchIncidents = async () => {
+      // A large first load can outlast the refresh interval
+      if (busy) return;
+      busy = true;
       try {
-        const res = await fetch(`${BACKEND_URL}/incidents`);
-        const data = await res.json();
+        // Load every page once, then only re-fetch the newest page on each refresh
+        const data = loaded === null
+          ? await fetchAllIncidents(BACKEND_URL)
+          : await refreshIncidents(BACKEND_URL, {}, loaded);
+        if (cancelled) return;
+        loaded = data;
         setIncidents(data);
         if (data.length > 0) {
           setCamName(data[0].camera_name || 'Main Entrance');
           setCamLocation(data[0].location || 'Building A - Front');
         }
-      } catch {}
+      } catch {
+      } finally {
+        busy = false;
+      }
     };
     fetchIncidents();
     const interval = setInterval(fetchIncidents, 2000);
-    return () => clearInterval(interval);
+    return () => { cancelled = true; clearInterval(interval); };
   }, []);
 
   // Fetch notification settings
@@ -235,7 +249,9 @@ const Dashboard: React.FC = () => {
                     );
                     const camera = incident.camera_name || incident.camera || 'Camera 1';
                     const location = incident.location || 'Building A - Front';
-                    const imgUrl = `${BACKEND_URL}${incident.image}`;
+                    // Older incidents have no thumbnail/preview and fall back to the original
+                    const thumbUrl = `${BACKEND_URL}${incident.thumbnail || incident.image}`;
+                    const previewUrl = `${BACKEND_URL}${incident.preview || incident.image}`;
                     return (
                       <tr key={incident.id} className="hover:bg-[#22304a]">
                         <td>{alertName}</td>
@@ -252,10 +268,11 @@ const Dashboard: React.FC = () => {
                         <td>{location}</td>
                         <td>
                           <img
-                            src={imgUrl}
+                            src={thumbUrl}
+                            loading="lazy"
                             alt="clip"
                             className="w-16 h-16 rounded-lg bg-[#222] cursor-pointer hover:ring-2 hover:ring-[#2563eb]"
-                            onClick={() => setModalImg(imgUrl)}
+                            onClick={() => setModalImg(previewUrl)}
                           />
                         </td>
                       </tr>
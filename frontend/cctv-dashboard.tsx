@@ -33,6 +33,7 @@ import ReactSelect from "react-select";
 import { PieChart, Pie, Cell, Tooltip as ReTooltip, ResponsiveContainer, BarChart, Bar, XAxis, YAxis, LineChart, Line, CartesianGrid, Legend } from "recharts";
 import React from "react";
 import { TooltipProps } from 'recharts';
+import { fetchAllIncidents, refreshIncidents, IncidentQuery } from "@/lib/incidents";
 
 const BACKEND_URL = 'http://localhost:8000';
 
@@ -113,27 +114,40 @@ export default function CCTVDashboard() {
 
   // Fetch incidents (auto-refresh)
   useEffect(() => {
+    // The date range is filtered by the server; type/camera/location filters below run on the full result
+    const query: IncidentQuery = {};
+    if (dateRange[0] && dateRange[1]) {
+      // Format dates as YYYY-MM-DD
+      query.start_date = dateRange[0].toISOString().slice(0, 10);
+      query.end_date = dateRange[1].toISOString().slice(0, 10);
+    }
+    let cancelled = false;
+    let loaded: any[] | null = null;
+    let busy = false;
     const fetchIncidents = async () => {
+      // A large first load can outlast the refresh interval
+      if (busy) return;
+      busy = true;
       try {
-        let url = `${BACKEND_URL}/incidents`;
-        if (dateRange[0] && dateRange[1]) {
-          // Format dates as YYYY-MM-DD
-          const start = dateRange[0].toISOString().slice(0, 10);
-          const end = dateRange[1].toISOString().slice(0, 10);
-          url += `?start_date=${start}&end_date=${end}`;
-        }
-        const res = await fetch(url);
-        const data = await res.json();
+        // Load every page once, then only re-fetch the newest page on each refresh
+        const data = loaded === null
+          ? await fetchAllIncidents(BACKEND_URL, query)
+          : await refreshIncidents(BACKEND_URL, query, loaded);
+        if (cancelled) return;
+        loaded = data;
         setIncidents(data);
         if (data.length > 0) {
           setCamName(data[0].camera_name || 'Main Entrance');
           setCamLocation(data[0].location || 'Building A - Front');
         }
-      } catch {}
+      } catch {
+      } finally {
+        busy = false;
+      }
     };
     fetchIncidents();
     const interval = setInterval(fetchIncidents, 2000);
-    return () => clearInterval(interval);
+    return () => { cancelled = true; clearInterval(interval); };
   }, [dateRange]);
 
   // Fetch notification settings
@@ -496,7 +510,9 @@ export default function CCTVDashboard() {
                     const alertName = `${incident.label.charAt(0).toUpperCase() + incident.label.slice(1)} alert`;
                     const camera = incident.camera_name || incident.camera || 'Camera 1';
                     const location = incident.location || 'Building A - Front';
-                    const imgUrl = `${BACKEND_URL}${incident.image}`;
+                    // Older incidents have no thumbnail/preview and fall back to the original
+                    const thumbUrl = `${BACKEND_URL}${incident.thumbnail || incident.image}`;
+                    const previewUrl = `${BACKEND_URL}${incident.preview || incident.image}`;
                     return (
                       <TableRow key={incident.id} className="border-gray-700 hover:bg-gray-700/50">
                         <TableCell className="text-white font-medium">{alertName}</TableCell>
@@ -507,10 +523,11 @@ export default function CCTVDashboard() {
                         <TableCell className="text-gray-300">{location}</TableCell>
                         <TableCell>
                           <img
-                            src={imgUrl}
+                            src={thumbUrl}
+                            loading="lazy"
                             alt="Incident clip"
                             className="w-20 h-15 object-cover rounded border border-gray-600 cursor-pointer hover:ring-2 hover:ring-blue-400 transition-all"
-                            onClick={() => setModalImg(imgUrl)}
+                            onClick={() => setModalImg(previewUrl)}
                           />
                         </TableCell>
                       </TableRow>
@@ -0,0 +1,47 @@
+// Client for the paginated GET /incidents endpoint.
+// The backend returns one page (newest first) and an X-Next-Cursor header while more rows match.
+
+export type IncidentQuery = {
+  start_date?: string;
+  end_date?: string;
+  camera?: string;
+  label?: string;
+  min_confidence?: number;
+};
+
+// Largest page the backend accepts (INCIDENTS_MAX_PAGE_SIZE)
+const PAGE_SIZE = 5000;
+
+async function fetchIncidentPage(backendUrl: string, query: IncidentQuery, cursor?: string) {
+  const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== '') params.set(key, String(value));
+  });
+  if (cursor) params.set('cursor', cursor);
+  const res = await fetch(`${backendUrl}/incidents?${params}`);
+  if (!res.ok) throw new Error(`GET /incidents failed: ${res.status}`);
+  const incidents: any[] = await res.json();
+  return { incidents, nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
+// Every incident matching `query`, newest first
+export async function fetchAllIncidents(backendUrl: string, query: IncidentQuery = {}) {
+  const all: any[] = [];
+  let cursor: string | undefined;
+  do {
+    const page = await fetchIncidentPage(backendUrl, query, cursor);
+    all.push(...page.incidents);
+    cursor = page.nextCursor || undefined;
+  } while (cursor);
+  return all;
+}
+
+// Bring a list from fetchAllIncidents up to date by re-fetching only the newest page
+export async function refreshIncidents(backendUrl: string, query: IncidentQuery, current: any[]) {
+  const page = await fetchIncidentPage(backendUrl, query);
+  if (!page.nextCursor) return page.incidents;
+  const last = page.incidents[page.incidents.length - 1];
+  const older = current.filter(i =>
+    i.timestamp < last.timestamp || (i.timestamp === last.timestamp && i.id < last.id));
+  return [...page.incidents, ...older];
+}